@@ -9,42 +9,44 @@ from .botsconfig import *
 TAVARS = 'idta,statust,divtext,child,ts,filename,status,idroute,fromchannel,tochannel,frompartner,topartner,frommail,tomail,contenttype,nrmessages,editype,messagetype,errortext,script,rsrv1,filesize,numberofresends'
 
 
-def evaluate(command,rootidtaofrun):
+def evaluate(command,rootidtaofrun,idroute=''):
     ''' Trace for each received file.
         Write a filereport for each file,
         Write a report for the run.
+        idroute: run is for this route only (option parallel_routes); other bots-engines run other routes at the same time.
     '''
+    routeselection = ' AND idroute=%(idroute)s ' if idroute else ''
     resultsofrun = {OPEN:0,ERROR:0,OK:0,DONE:0}     #to collect the results of the filereports for runreport
     totalfilesize = 0
     #evaluate every incoming file of this run;
     for row in botslib.query('''SELECT ''' + TAVARS + '''
                                 FROM ta
                                 WHERE idta > %(rootidtaofrun)s
-                                AND status=%(status)s ''',
-                                {'status':EXTERNIN,'rootidtaofrun':rootidtaofrun}):
+                                AND status=%(status)s ''' + routeselection,
+                                {'status':EXTERNIN,'rootidtaofrun':rootidtaofrun,'idroute':idroute}):
         traceofinfile = Trace(row,rootidtaofrun)
         resultsofrun[traceofinfile.statust] += 1
         totalfilesize += traceofinfile.filesize
         traceofinfile.make_file_report()
-    make_run_report(rootidtaofrun,resultsofrun,command,totalfilesize)
-    return email_error_report(rootidtaofrun)    #return report status: 0 (no error) or 1 (error)
+    make_run_report(rootidtaofrun,resultsofrun,command,totalfilesize,routeselection,idroute)
+    return email_error_report(rootidtaofrun,routeselection,idroute)    #return report status: 0 (no error) or 1 (error)
 
-def make_run_report(rootidtaofrun,resultsofrun,command,totalfilesize):
+def make_run_report(rootidtaofrun,resultsofrun,command,totalfilesize,routeselection,idroute):
     #count nr files send
     for row in botslib.query('''SELECT COUNT(*) as count
                                 FROM ta
                                 WHERE idta > %(rootidtaofrun)s
                                 AND status=%(status)s
-                                AND statust=%(statust)s ''',
-                                {'status':EXTERNOUT,'rootidtaofrun':rootidtaofrun,'statust':DONE}):
+                                AND statust=%(statust)s ''' + routeselection,
+                                {'status':EXTERNOUT,'rootidtaofrun':rootidtaofrun,'statust':DONE,'idroute':idroute}):
         send = row['count']
     #count process errors
     for row in botslib.query('''SELECT COUNT(*) as count
                                 FROM ta
                                 WHERE idta >= %(rootidtaofrun)s
                                 AND status=%(status)s
-                                AND statust=%(statust)s''',
-                                {'status':PROCESS,'rootidtaofrun':rootidtaofrun,'statust':ERROR}):
+                                AND statust=%(statust)s''' + routeselection,
+                                {'status':PROCESS,'rootidtaofrun':rootidtaofrun,'statust':ERROR,'idroute':idroute}):
         processerrors = row['count']
     #generate report (in database)
     rootta = botslib.OldTransaction(rootidtaofrun)
@@ -58,22 +60,22 @@ def make_run_report(rootidtaofrun,resultsofrun,command,totalfilesize):
     else:
         commandline = ' '.join(arg for arg in sys.argv[1:] if arg!='-cconfig' and not arg.startswith('--'))[:35]
     botslib.changeq('''INSERT INTO report (idta,lastopen,lasterror,lastok,lastdone,send,processerrors,
-                                            ts,lastreceived,status,type,filesize,acceptance,rsrv1)
+                                            ts,lastreceived,status,type,filesize,acceptance,rsrv1,rsrv2)
                             VALUES  (%(rootidtaofrun)s,%(lastopen)s,%(lasterror)s,%(lastok)s,%(lastdone)s,%(send)s,%(processerrors)s,
-                                    %(ts)s,%(lastreceived)s,%(status)s,%(type)s,%(totalfilesize)s,%(acceptance)s,%(rsrv1)s) ''',
+                                    %(ts)s,%(lastreceived)s,%(status)s,%(type)s,%(totalfilesize)s,%(acceptance)s,%(rsrv1)s,%(rsrv2)s) ''',
                             {'rootidtaofrun':rootidtaofrun,'lastopen':resultsofrun[OPEN],'lasterror':resultsofrun[ERROR],'lastok':resultsofrun[OK],
                             'lastdone':resultsofrun[DONE],'send':send,'processerrors':processerrors,'ts':rootta.ts,'lastreceived':lastreceived,
                             'status':status,'type':command,'totalfilesize':totalfilesize,'acceptance':int(botsglobal.ini.getboolean('acceptance','runacceptancetest',False)),
-                            'rsrv1':commandline})
+                            'rsrv1':commandline,'rsrv2':(botsglobal.bytescopied + 1023) // 1024})   #rsrv2: KB copied (integer field)
     #20120830: if new run with nothing received and no process errors: delete ta's.
     if command == 'new' and not lastreceived and not processerrors:
-        botslib.changeq('''DELETE FROM ta WHERE idta>=%(rootidtaofrun)s''',{'rootidtaofrun':rootidtaofrun})
+        botslib.changeq('''DELETE FROM ta WHERE idta>=%(rootidtaofrun)s''' + routeselection,{'rootidtaofrun':rootidtaofrun,'idroute':idroute})
 
 
 
-def email_error_report(rootidtaofrun):
+def email_error_report(rootidtaofrun,routeselection='',idroute=''):
     for results in botslib.query('''SELECT idta,lastopen,lasterror,lastok,lastdone,
-                                            send,processerrors,ts,lastreceived,type,status
+                                            send,processerrors,ts,lastreceived,type,status,rsrv2
                                     FROM report
                                     WHERE idta=%(rootidtaofrun)s''',
                                     {'rootidtaofrun':rootidtaofrun}):
@@ -98,6 +100,8 @@ def email_error_report(rootidtaofrun):
         subject += '; %d process errors'%(results['processerrors'])
         reporttext += '    %d errors in processes.\n'%(results['processerrors'])
     reporttext += '    %d files send in run.\n'%(results['send'])
+    if results['rsrv2']:
+        reporttext += '    %d KB copied when receiving and archiving files.\n'%(results['rsrv2'])
 
     botsglobal.logger.info(reporttext)      #log the report texts
     # only send email report if there are errors.
@@ -110,8 +114,8 @@ def email_error_report(rootidtaofrun):
                                         FROM ta
                                         WHERE idta>=%(rootidtaofrun)s
                                         AND status=%(status)s
-                                        AND statust=%(statust)s ''',
-                                        {'rootidtaofrun':rootidtaofrun,'status':PROCESS,'statust':ERROR}):
+                                        AND statust=%(statust)s ''' + routeselection,
+                                        {'rootidtaofrun':rootidtaofrun,'status':PROCESS,'statust':ERROR,'idroute':idroute}):
                 reporttext += '\nProcess error:\n'
                 for key in row.keys():
                     reporttext += '%s: %s\n' % (key,row[key])
@@ -120,8 +124,8 @@ def email_error_report(rootidtaofrun):
             for row in botslib.query('''SELECT idroute,frompartner,fromchannel,topartner,tochannel,errortext,infilename
                                         FROM filereport
                                         WHERE idta>%(rootidtaofrun)s
-                                        AND statust!=%(statust)s ''',
-                                        {'rootidtaofrun':rootidtaofrun,'statust':DONE}):
+                                        AND statust!=%(statust)s ''' + routeselection,
+                                        {'rootidtaofrun':rootidtaofrun,'statust':DONE,'idroute':idroute}):
                 reporttext += '\nFile error:\n'
                 for key in row.keys():
                     reporttext += '%s: %s\n' % (key,row[key])
@@ -35,6 +35,9 @@ QUERIES = 7
 SUBTRANSLATION = 8
 BOTSIDNR = 9
 FIXED_RECORD_LENGTH = 10         #length of fixed record
+FIELDINDEX = 11                  #for compact records (incoming): index of fields of record, per noBOTSID
+LEVELINDEX = 12                  #for writing (outgoing): index of records in LEVEL: (BOTSID, BOTSIDnr) -> record
+SLICEPLAN = 13                   #for fixed records (incoming): field ids and slicer of fields of record, per noBOTSID
 
 #***grammar.recorddefs: dict keys for fields of record eg: record[FIELDS][ID] == 'C124.0034'
 #ID = 0 (is already defined)
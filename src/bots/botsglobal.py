@@ -8,6 +8,12 @@ settings = None         #django's settings.py
 usersysimportpath = None
 currentrun = None       #store current run for global use. needed to get the idta's of run, route, routepart
 routeid = ''            #current route. This is used to set routeid for Processes.
+routerun = False        #run of routes at same time as runs of other routes (option parallel_routes; botslib.is_routerun)
 confirmrules = []       #confirmrules are read into memory at start of run
+translations = None     #translations are read into memory at start of run (botslib.prepare_translations)
 not_import = set()      #register modules that are not importable
+unitofwork = None       #if not None: buffer for updates of db-ta, commit is done per incoming file (botslib.begin_unitofwork)
+bytescopied = 0         #bytes copied in run when receiving and archiving files (for run report; setting zerocopy)
+uniquelock = None       #lock for botslib.unique when translating in worker processes (option translate_workers)
+tajournal = None        #if not None: changes of db-ta are recorded, not written (worker processes; see botslib.replay_tajournal)
 is_first_run_of_day = False  #20190123 added.
\ No newline at end of file
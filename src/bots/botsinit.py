@@ -155,7 +155,11 @@ def connect():
         if not os.path.isfile(botsglobal.settings.DATABASES['default']['NAME']):
             raise botslib.PanicError('Could not find database file for SQLite')
         from . import botssqlite
-        botsglobal.db = botssqlite.connect(database = botsglobal.settings.DATABASES['default']['NAME'])
+        botsglobal.db = botssqlite.connect(database = botsglobal.settings.DATABASES['default']['NAME'],
+                                           journal_mode = botsglobal.ini.get('settings','sqlite_journal_mode','') or None,
+                                           synchronous = botsglobal.ini.get('settings','sqlite_synchronous','OFF'),
+                                           cache_size = botsglobal.ini.getint('settings','sqlite_cache_size',0),
+                                           mmap_size = botsglobal.ini.getint('settings','sqlite_mmap_size',0))
     elif botsglobal.settings.DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
         import MySQLdb
         from MySQLdb import cursors
@@ -7,6 +7,12 @@ import traceback
 import socket
 import platform
 import collections
+import shutil
+import re
+try:
+    import fcntl
+except ImportError:     #not on windows
+    fcntl = None
 try:
     import cPickle as pickle
 except ImportError:
@@ -44,11 +50,25 @@ class _Transaction(object):
                 'alt','divtext','merge','nrmessages','testindicator','reference','frommail','tomail','charset','retransmit','contenttype','errortext',
                 'confirmasked','confirmed','confirmtype','confirmidta','envelope','botskey','cc','rsrv1','rsrv2','rsrv3','rsrv5','filesize','numberofresends'))
     processlist = [0]  #stack for bots-processes. last one is the current process; starts with 1 element in list: root
+    #fields that are copied from old transaction in copyta.
+    copylist = set(('frompartner','topartner','fromchannel','tochannel','editype','messagetype','alt','merge','testindicator','reference',
+                'frommail','tomail','charset','contenttype','filename','idroute','nrmessages','botskey','envelope','rsrv3','cc'))
 
     def update(self,**ta_info):
         ''' Updates db-ta with named-parameters/dict.
             Use a filter to update only valid fields in db-ta
+            In a unit of work the update is buffered (written at end of unit of work).
         '''
+        if botsglobal.tajournal is not None:
+            changes = dict((key,value) for key,value in ta_info.items() if key in self.filterlist)
+            if changes:
+                botsglobal.tajournal.append(('update',self.idta,changes))
+            return
+        if botsglobal.unitofwork is not None:
+            changes = dict((key,value) for key,value in ta_info.items() if key in self.filterlist)
+            if changes:
+                botsglobal.unitofwork.setdefault(self.idta,{}).update(changes)
+            return
         setstring = ','.join(key+'=%('+key+')s' for key in ta_info if key in self.filterlist)
         if not setstring:   #nothing to update
             return
@@ -60,11 +80,17 @@ class _Transaction(object):
 
     def delete(self):
         '''Deletes current transaction '''
+        if botsglobal.tajournal is not None:
+            botsglobal.tajournal.append(('delete',self.idta))
+            return
         changeq('''DELETE FROM ta
                     WHERE idta=%(idta)s''',
                     {'idta':self.idta})
 
     def deletechildren(self):
+        if botsglobal.tajournal is not None:
+            botsglobal.tajournal.append(('deletechildren',self.idta))
+            return
         self.deleteonlychildren_core(self.idta)
 
     def deleteonlychildren_core(self,idta):
@@ -99,6 +125,10 @@ class _Transaction(object):
         ''' copy old transaction, return new transaction.
             parameters for new transaction are in ta_info (new transaction is updated with these values).
         '''
+        if botsglobal.tajournal is not None:
+            newta = OldTransaction(_provisional_idta())
+            botsglobal.tajournal.append(('copyta',self.idta,newta.idta,status,dict((key,value) for key,value in ta_info.items() if key in self.filterlist)))
+            return newta
         script = _Transaction.processlist[-1]
         newidta = insertta('''INSERT INTO ta (script,  status,parent,frompartner,topartner,fromchannel,tochannel,editype,messagetype,alt,merge,testindicator,reference,frommail,tomail,charset,contenttype,filename,idroute,nrmessages,botskey,envelope,rsrv3,cc)
                                 SELECT %(script)s,%(newstatus)s,idta,frompartner,topartner,fromchannel,tochannel,editype,messagetype,alt,merge,testindicator,reference,frommail,tomail,charset,contenttype,filename,idroute,nrmessages,botskey,envelope,rsrv3,cc
@@ -106,6 +136,11 @@ class _Transaction(object):
                                 WHERE idta=%(idta)s''',
                                 {'idta':self.idta,'script':script,'newstatus':status})
         newta = OldTransaction(newidta)
+        if botsglobal.unitofwork is not None and self.idta in botsglobal.unitofwork:
+            #old transaction has buffered updates that are not in database yet: copy these as well.
+            copied = dict((key,value) for key,value in botsglobal.unitofwork[self.idta].items() if key in self.copylist)
+            copied.update(ta_info)
+            ta_info = copied
         newta.update(**ta_info)
         return newta
 
@@ -120,6 +155,10 @@ class NewTransaction(_Transaction):
     ''' Generate new transaction. '''
     def __init__(self,**ta_info):
         updatedict = dict((key,value) for key,value in ta_info.items() if key in self.filterlist)     #filter ta_info
+        if botsglobal.tajournal is not None:
+            self.idta = _provisional_idta()
+            botsglobal.tajournal.append(('new',self.idta,updatedict))
+            return
         updatedict['script'] = self.processlist[-1]
         namesstring = ','.join(key for key in updatedict)
         varsstring = ','.join('%('+key+')s' for key in updatedict)
@@ -200,8 +239,76 @@ def updateinfo(change,where):
 def changestatustinfo(change,where):
     return updateinfo({'statust':change},where)
 
+#**********************************************************/**
+#*************************Unit of work*********************/**
+#**********************************************************/**
+_unitofworknew = []     #idta's of db-ta inserted in current unit of work (not committed)
+
+def begin_unitofwork():
+    ''' start unit of work: updates of db-ta are buffered, commits are postponed till end_unitofwork.
+        Used per incoming file in translation: one commit per file instead of a commit per change.
+    '''
+    global _tajournalstart
+    if botsglobal.tajournal is not None:    #worker process: changes are recorded in journal
+        _tajournalstart = len(botsglobal.tajournal)
+        return
+    botsglobal.unitofwork = collections.OrderedDict()    #idta -> dict with changed fields
+    del _unitofworknew[:]
+
+def _flush_unitofwork():
+    ''' write buffered updates of db-ta to database (no commit).
+        Updates that change the same fields are written with one executemany.
+    '''
+    if not botsglobal.unitofwork:
+        return
+    batches = collections.OrderedDict()     #sorted fields -> list of parameters
+    for idta,changes in botsglobal.unitofwork.items():
+        parameters = changes.copy()
+        parameters['selfid'] = idta
+        batches.setdefault(tuple(sorted(changes)),[]).append(parameters)
+    botsglobal.unitofwork.clear()
+    cursor = botsglobal.db.cursor()
+    for keys,parameterlist in batches.items():
+        cursor.executemany('''UPDATE ta
+                              SET '''+','.join(key+'=%('+key+')s' for key in keys)+ '''
+                              WHERE idta=%(selfid)s''',
+                              parameterlist)
+    cursor.close()
+
+def rollback_unitofwork():
+    ''' discard all changes in unit of work (buffered and not committed). Unit of work stays active.'''
+    if botsglobal.tajournal is not None:
+        for entry in botsglobal.tajournal[_tajournalstart:]:    #files written for discarded db-ta are removed
+            if entry[0] in ('copyta','new'):
+                deldata(str(entry[2] if entry[0] == 'copyta' else entry[1]))
+        del botsglobal.tajournal[_tajournalstart:]
+        return
+    if botsglobal.unitofwork is not None:
+        botsglobal.unitofwork.clear()
+        botsglobal.db.rollback()
+        for idta in _unitofworknew:     #files written for discarded db-ta are removed
+            deldata(str(idta))
+        del _unitofworknew[:]
+        clear_uniqueblocks()
+
+def end_unitofwork():
+    ''' write buffered changes, commit and end the unit of work.'''
+    if botsglobal.unitofwork is None:
+        return
+    try:
+        _flush_unitofwork()
+    except:
+        botsglobal.db.rollback()
+        raise
+    else:
+        botsglobal.db.commit()
+    finally:
+        botsglobal.unitofwork = None
+        del _unitofworknew[:]
+
 def query(querystring,*args):
     ''' general query. yields rows from query '''
+    _flush_unitofwork()     #in unit of work: query should see buffered updates
     cursor = botsglobal.db.cursor()
     cursor.execute(querystring,*args)
     results =  cursor.fetchall()
@@ -211,6 +318,8 @@ def query(querystring,*args):
 
 def changeq(querystring,*args):
     '''general inset/update. no return'''
+    if botsglobal.unitofwork is not None:
+        return _changeq_unitofwork(querystring,*args)
     cursor = botsglobal.db.cursor()
     try:
         cursor.execute(querystring,*args)
@@ -222,6 +331,25 @@ def changeq(querystring,*args):
     cursor.close()
     return terug
 
+def _changeq_unitofwork(querystring,*args):
+    ''' as changeq, but no commit. A savepoint is used so an error does not discard the whole unit of work
+        (eg persist_add_update uses a failing insert).
+    '''
+    _flush_unitofwork()
+    cursor = botsglobal.db.cursor()
+    cursor.execute('''SAVEPOINT botschangeq''')
+    try:
+        cursor.execute(querystring,*args)
+    except:
+        cursor.execute('''ROLLBACK TO SAVEPOINT botschangeq''')
+        cursor.execute('''RELEASE SAVEPOINT botschangeq''')
+        cursor.close()
+        raise
+    cursor.execute('''RELEASE SAVEPOINT botschangeq''')
+    terug = cursor.rowcount
+    cursor.close()
+    return terug
+
 def insertta(querystring,*args):
     ''' insert ta
         from insert get back the idta; this is different with postgrSQL.
@@ -232,10 +360,65 @@ def insertta(querystring,*args):
     if not newidta:   #if botsglobal.settings.DATABASE_ENGINE ==
         cursor.execute('''SELECT lastval() as idta''')
         newidta = cursor.fetchone()['idta']
-    botsglobal.db.commit()
+    if botsglobal.unitofwork is None:   #in unit of work: commit is done at end of unit of work
+        botsglobal.db.commit()
+    else:
+        _unitofworknew.append(newidta)
     cursor.close()
     return newidta
 
+#journal of changes in db-ta: used in worker processes (option translate_workers).
+#worker processes do not write db-ta; the changes are recorded, and written by the parent process (replay_tajournal) in order of the incoming files.
+#new db-ta get a provisional (negative) idta; the parent process replaces these by the real idta's.
+#entries: ('new',idta,ta_info), ('copyta',idta,newidta,status,ta_info), ('update',idta,ta_info), ('delete',idta), ('deletechildren',idta)
+_tajournalcounter = 0
+_tajournalstart = 0     #position in journal of start of unit of work
+
+def _provisional_idta():
+    ''' provisional idta for db-ta in journal; unique over worker processes as files are written with this name.'''
+    global _tajournalcounter
+    _tajournalcounter += 1
+    return -(os.getpid() * 1000000000 + _tajournalcounter)
+
+def replay_tajournal(tajournal):
+    ''' write changes of db-ta recorded in a worker process (one incoming file) in one unit of work.
+        provisional idta's are replaced by real idta's; files written with a provisional idta as name are renamed.
+    '''
+    idtas = {}          #provisional idta -> idta
+    filenames = {}      #provisional filename -> filename
+    def realvalues(ta_info):
+        for key in ('parent','child','confirmidta'):
+            if ta_info.get(key) in idtas:
+                ta_info[key] = idtas[ta_info[key]]
+        if ta_info.get('filename') in filenames:
+            ta_info['filename'] = filenames[ta_info['filename']]
+        return ta_info
+    def newidta(provisional,ta_new):
+        idtas[provisional] = ta_new.idta
+        filenames[str(provisional)] = str(ta_new.idta)
+        if os.path.isfile(abspathdata(str(provisional))):
+            filename = abspathdata(str(ta_new.idta))
+            dirshouldbethere(os.path.dirname(filename))
+            os.rename(abspathdata(str(provisional)),filename)
+    begin_unitofwork()
+    try:
+        for entry in tajournal:
+            if entry[0] == 'copyta':
+                newidta(entry[2],OldTransaction(idtas.get(entry[1],entry[1])).copyta(status=entry[3],**realvalues(entry[4])))
+            elif entry[0] == 'new':
+                newidta(entry[1],NewTransaction(**realvalues(entry[2])))
+            elif entry[0] == 'update':
+                OldTransaction(idtas.get(entry[1],entry[1])).update(**realvalues(entry[2]))
+            elif entry[0] == 'delete':
+                OldTransaction(idtas.get(entry[1],entry[1])).delete()
+            else:
+                OldTransaction(idtas.get(entry[1],entry[1])).deletechildren()
+    except:
+        rollback_unitofwork()
+        raise
+    finally:
+        end_unitofwork()
+
 def unique_runcounter(domain,updatewith=None):
     ''' as unique, but per run of bots-engine.
     '''
@@ -260,28 +443,115 @@ def unique(domein,updatewith=None):
     '''
     if botsglobal.ini.getboolean('acceptance','runacceptancetest',False):
         return unique_runcounter(domein)
+    elif botsglobal.uniquelock is not None:     #translating in worker processes: other workers use the same counters
+        with botsglobal.uniquelock:
+            return _uniquecore(domein,updatewith)
+    elif _uniqueblocks is not None and domein in _uniqueblocks['domains']:
+        if updatewith is None:
+            return _uniquefromblock(domein)
+        _release_uniqueblock(domein)    #database is updated: first give back unused numbers of block
+        return _uniquecore(domein,updatewith)
     else:
-        cursor = botsglobal.db.cursor()
-        try:
-            cursor.execute('''SELECT nummer FROM uniek WHERE domein=%(domein)s''',{'domein':domein})
-            nummer = cursor.fetchone()['nummer']
-            if updatewith is None:
-                nummer += 1
-                updatewith = nummer
-                if updatewith > MAXINT:
-                    updatewith = 0
-            cursor.execute('''UPDATE uniek SET nummer=%(nummer)s WHERE domein=%(domein)s''',{'domein':domein,'nummer':updatewith})
-        except TypeError: #if domein does not exist, cursor.fetchone returns None, so TypeError
-            cursor.execute('''INSERT INTO uniek (domein,nummer) VALUES (%(domein)s,1)''',{'domein': domein})
-            nummer = 1
+        return _uniquecore(domein,updatewith)
+
+def _uniquecore(domein,updatewith):
+    cursor = botsglobal.db.cursor()
+    try:
+        cursor.execute('''SELECT nummer FROM uniek WHERE domein=%(domein)s''',{'domein':domein})
+        nummer = cursor.fetchone()['nummer']
+        if updatewith is None:
+            nummer += 1
+            updatewith = nummer
+            if updatewith > MAXINT:
+                updatewith = 0
+        cursor.execute('''UPDATE uniek SET nummer=%(nummer)s WHERE domein=%(domein)s''',{'domein':domein,'nummer':updatewith})
+    except TypeError: #if domein does not exist, cursor.fetchone returns None, so TypeError
+        cursor.execute('''INSERT INTO uniek (domein,nummer) VALUES (%(domein)s,1)''',{'domein': domein})
+        nummer = 1
+    if botsglobal.unitofwork is None:   #in worker processes unitofwork is always None (db-ta is journalled): counters are committed at once
         botsglobal.db.commit()
+    cursor.close()
+    return nummer
+
+#blocks of unique numbers, used by bots-engine for counters in bots.ini (unique_block_domains).
+#per domain a block of numbers is reserved in database in one transaction; numbers are given from the block.
+#unused numbers are given back at end of run; if bots-engine stops unexpected these numbers are skipped.
+#numbers are unique, but are not given in ascending order if other processes use the same counter (other bots-engines, translate_workers):
+#each process has its own block. Also numbers of a block used in a unit of work that is rolled back are skipped.
+#so counters that should be ascending or without gaps (eg messagecounter, used for references in confirmations) are not in blocks.
+#if not None: {'size':blocksize,'domains':set of domains,'blocks':{domain:[next number,last number of block]}}
+_uniqueblocks = None
+
+def begin_uniqueblocks():
+    ''' start using blocks of unique numbers (in bots-engine). '''
+    global _uniqueblocks
+    blocksize = botsglobal.ini.getint('settings','unique_blocksize',100)
+    domains = set(domain.strip() for domain in botsglobal.ini.get('settings','unique_block_domains','bots_file_name,bots_outgoing_file_name').split(',') if domain.strip())
+    if blocksize > 1 and domains:
+        _uniqueblocks = {'size':blocksize,'domains':domains,'blocks':{}}
+
+def end_uniqueblocks():
+    ''' give back unused numbers of blocks; stop using blocks of unique numbers.'''
+    global _uniqueblocks
+    if _uniqueblocks is None:
+        return
+    for domein in list(_uniqueblocks['blocks']):
+        _release_uniqueblock(domein)
+    _uniqueblocks = None
+
+def clear_uniqueblocks():
+    ''' forget blocks without giving back unused numbers. Used after rollback: reservation of a block might be rolled back.'''
+    if _uniqueblocks is not None:
+        _uniqueblocks['blocks'].clear()
+
+def _uniquefromblock(domein):
+    block = _uniqueblocks['blocks'].get(domein)
+    if block is None or block[0] > block[1]:    #no block or block is used: reserve new block
+        block = _reserve_uniqueblock(domein)
+        if block is None:       #no block possible (numbers near MAXINT)
+            return _uniquecore(domein,None)
+    nummer = block[0]
+    block[0] += 1
+    return nummer
+
+def _reserve_uniqueblock(domein):
+    ''' reserve block of numbers in database (one transaction); return block or None.'''
+    cursor = botsglobal.db.cursor()
+    cursor.execute('''SELECT nummer FROM uniek WHERE domein=%(domein)s''',{'domein':domein})
+    row = cursor.fetchone()
+    first = 1 if row is None else row['nummer'] + 1
+    last = min(first + _uniqueblocks['size'] - 1, MAXINT)
+    if last <= first:
         cursor.close()
-        return nummer
+        return None
+    if row is None:
+        cursor.execute('''INSERT INTO uniek (domein,nummer) VALUES (%(domein)s,%(nummer)s)''',{'domein':domein,'nummer':last})
+    else:
+        cursor.execute('''UPDATE uniek SET nummer=%(nummer)s WHERE domein=%(domein)s''',{'domein':domein,'nummer':last})
+    if botsglobal.unitofwork is None:
+        botsglobal.db.commit()
+    cursor.close()
+    block = _uniqueblocks['blocks'][domein] = [first,last]
+    return block
+
+def _release_uniqueblock(domein):
+    ''' give back unused numbers of block: only if no other process has used the domain after reserving the block.'''
+    block = _uniqueblocks['blocks'].pop(domein,None)
+    if block is None or block[0] > block[1]:
+        return
+    cursor = botsglobal.db.cursor()
+    cursor.execute('''UPDATE uniek SET nummer=%(nummer)s WHERE domein=%(domein)s AND nummer=%(last)s''',{'domein':domein,'nummer':block[0]-1,'last':block[1]})
+    if botsglobal.unitofwork is None:
+        botsglobal.db.commit()
+    cursor.close()
 
 def checkunique(domein, receivednumber):
     ''' to check if received number is sequential: value is compare with new generated number.
         if domain not used before, initialize it . '1' is the first value expected.
     '''
+    if _uniqueblocks is not None and domein in _uniqueblocks['domains']:   #received numbers are checked against database: no blocks for this domain
+        _release_uniqueblock(domein)
+        _uniqueblocks['domains'].discard(domein)
     newnumber = unique(domein)
     if newnumber  == receivednumber:
         return True
@@ -428,7 +698,7 @@ def join(*paths):
 
 def dirshouldbethere(path):
     if path and not os.path.exists(path):
-        os.makedirs(path)
+        os.makedirs(path,exist_ok=True)     #directory can be made at the same time by other thread (eg ftpsessions) or process
         return True
     return False
 
@@ -484,6 +754,43 @@ def readdata_bin(filename):
     filehandler.close()
     return content
 
+def copyfile(fromfilename,tofilename):
+    ''' copy file; returns number of bytes copied (counted in botsglobal.bytescopied for run report).
+        uses os.copy_file_range if possible: data is not copied via bots, on some filesystems (eg NFS 4.2) copy is done on server.
+    '''
+    with open(fromfilename,'rb') as fromfile:
+        with open(tofilename,'wb') as tofile:
+            copied = 0
+            if hasattr(os,'copy_file_range'):
+                try:
+                    while True:
+                        nrbytes = os.copy_file_range(fromfile.fileno(),tofile.fileno(),1073741824)
+                        if not nrbytes:
+                            break
+                        copied += nrbytes
+                except OSError:     #not supported for these files/filesystems: copy in usual way.
+                    if copied:
+                        raise
+                    shutil.copyfileobj(fromfile,tofile,1048576)
+                    copied = tofile.tell()
+            else:
+                shutil.copyfileobj(fromfile,tofile,1048576)
+                copied = tofile.tell()
+    botsglobal.bytescopied += copied
+    return copied
+
+def linkfile(fromfilename,tofilename):
+    ''' zero-copy: hard link fromfilename to tofilename.
+        If not possible (eg different filesystems) file is copied.
+        A hard link shares the file (inode): use only if fromfilename is not changed anymore (eg is removed).
+        Returns number of bytes copied.
+    '''
+    try:
+        os.link(fromfilename,tofilename)
+        return 0
+    except OSError:
+        return copyfile(fromfilename,tofilename)
+
 def readdata_pickled(filename):
     filehandler = opendata_bin(filename,mode='rb') #pickle is a binary/byte stream
     content = pickle.load(filehandler)
@@ -613,15 +920,97 @@ def checkconfirmrules(confirmtype,**kwargs):
 #**********************************************************/**
 #***************###############  misc.   #############
 #**********************************************************/**
-def set_database_lock():
+def set_database_lock(mutexk=1):
+    ''' mutexk 1: lock of bots-engine.
+        option parallel_routes: each run of a route has its own lock, mutexk is minus idta of root of the run.
+    '''
     try:
-        changeq('''INSERT INTO mutex (mutexk) VALUES (1)''')
+        changeq('''INSERT INTO mutex (mutexk) VALUES (%(mutexk)s)''',{'mutexk':mutexk})
     except:
         return False
     return True
 
-def remove_database_lock():
-    changeq('''DELETE FROM mutex WHERE mutexk=1''')
+def remove_database_lock(mutexk=1):
+    changeq('''DELETE FROM mutex WHERE mutexk=%(mutexk)s''',{'mutexk':mutexk})
+
+def is_database_locked():
+    for row in query('''SELECT mutexk FROM mutex WHERE mutexk=1'''):
+        return True
+    return False
+
+def crashed_routeruns(idroute=None):
+    ''' option parallel_routes: runs of routes that did not finish (database lock of the run is still there).
+        only use for routes that are locked by this bots-engine (else runs of other bots-engines are found).
+        returns list of (idroute,idta of root of run), sorted by idta.
+    '''
+    crashed = []
+    for row in query('''SELECT mutexk FROM mutex WHERE mutexk<0 ORDER BY mutexk DESC'''):
+        rootidta = -row['mutexk']
+        for rootrow in query('''SELECT idroute FROM ta WHERE idta=%(idta)s''',{'idta':rootidta}):
+            if idroute is None or rootrow['idroute'] == idroute:
+                crashed.append((rootrow['idroute'],rootidta))
+            break
+        else:   #ta's of run are deleted (nothing received): nothing to recover
+            remove_database_lock(row['mutexk'])
+    return crashed
+
+def parallel_routes():
+    ''' option parallel_routes: different routes can be run by bots-engines at the same time (not on windows).'''
+    return fcntl is not None and botsglobal.ini.getboolean('settings','parallel_routes',False)
+
+def is_routerun(commandstorun,routestorun,do_cleanup_parameter):
+    ''' option parallel_routes: run of bots-engine that can run at the same time as runs for other routes.
+        this is a run for routes given on command line, only command new, no cleanup.
+    '''
+    return bool(routestorun) and commandstorun == ['new'] and not do_cleanup_parameter and parallel_routes()
+
+def lock_engine(routerun=None):
+    ''' check that no other bots-engine is running that conflicts with this run.
+        routerun: the routes if is_routerun.
+        returns list of locks (socket, files), close these when run is finished; raises socket.error if other bots-engine is running.
+        option parallel_routes uses lock files in botssys/locks (released when process stops):
+        - run of routes: shared lock on engine lock file, exclusive lock for each route.
+        - other runs: port (as without parallel_routes) and exclusive lock on engine lock file.
+    '''
+    if not parallel_routes():
+        return [check_if_other_engine_is_running()]
+    locks = []
+    try:
+        if routerun:
+            locks.append(_lockfile('engine',fcntl.LOCK_SH|fcntl.LOCK_NB))
+            for idroute in sorted(set(routerun)):
+                locks.append(_lockfile('route_' + idroute,fcntl.LOCK_EX|fcntl.LOCK_NB))
+        else:
+            locks.append(check_if_other_engine_is_running())
+            locks.append(_lockfile('engine',fcntl.LOCK_EX|fcntl.LOCK_NB))
+    except:
+        for lock in locks:
+            lock.close()
+        raise
+    return locks
+
+def lock_channels(idchannels):
+    ''' option parallel_routes: in a run of routes only one bots-engine at a time uses a channel (waits for lock).
+        returns list of locks, close these when done.
+    '''
+    if not botsglobal.routerun:
+        return []
+    locks = []
+    for idchannel in sorted(set(idchannel for idchannel in idchannels if idchannel)):     #always same order: no deadlock
+        locks.append(_lockfile('channel_' + idchannel,fcntl.LOCK_EX))
+    return locks
+
+def _lockfile(name,operation):
+    ''' open and lock (fcntl.flock) a lock file in botssys/locks. returns file; lock is released when file is closed.'''
+    lockdir = join(botsglobal.ini.get('directories','botssys'),'locks')
+    dirshouldbethere(lockdir)
+    lockfile = open(os.path.join(lockdir,re.sub(r'[^\w.-]','_',name) + '.lock'),'a')
+    try:
+        fcntl.flock(lockfile,operation)
+    except:
+        lockfile.close()
+        raise
+    return lockfile
 
 def check_if_other_engine_is_running():
     ''' bots-engine always connects to 127.0.0.1 port 28081 (or port as set in bots.ini).
@@ -696,8 +1085,48 @@ def countoutfiles(idchannel,rootidta):
                         {'status':FILEOUT,'statust':OK,'tochannel':idchannel,'rootidta':rootidta}):
         return row['count']
 
+#*************** translations *****************************/**
+def prepare_translations():
+    ''' as translations are looked up for each message, read active translations and partnergroups into memory. Reason: performance.
+        translations are indexed by (fromeditype,frommessagetype) and sorted as in the ORDER BY of lookup_translation_sql:
+        first translation that matches is used.
+    '''
+    translations = {}
+    for row in query('''SELECT fromeditype,frommessagetype,alt,frompartner_id,topartner_id,tscript,toeditype,tomessagetype
+                        FROM translate
+                        WHERE active=%(booll)s
+                        ORDER BY id ''',
+                        {'booll':True}):
+        translations.setdefault((row['fromeditype'],row['frommessagetype']),[]).append(dict(row))
+    for translationlist in translations.values():
+        translationlist.sort(key=lambda translation: (translation['alt'] == '',
+                                                      translation['frompartner_id'] is None, translation['frompartner_id'] or '',
+                                                      translation['topartner_id'] is None, translation['topartner_id'] or ''))
+    partnergroups = {}      #partner -> set of partnergroups partner is in
+    for row in query('''SELECT from_partner_id,to_partner_id
+                        FROM partnergroup'''):
+        partnergroups.setdefault(row['from_partner_id'],set()).add(row['to_partner_id'])
+    botsglobal.translations = (translations,partnergroups)
+
 def lookup_translation(frommessagetype,fromeditype,alt,frompartner,topartner):
     ''' lookup the translation: frommessagetype,fromeditype,alt,frompartner,topartner -> mappingscript, tomessagetype, toeditype
+        uses translations in memory (prepare_translations); gives same results as lookup_translation_sql.
+    '''
+    if botsglobal.translations is None:
+        prepare_translations()
+    translations,partnergroups = botsglobal.translations
+    for translation in translations.get((fromeditype,frommessagetype),()):
+        if translation['alt'] and translation['alt'] != alt:
+            continue
+        if translation['frompartner_id'] is not None and not (frompartner is not None and (translation['frompartner_id'] == frompartner or translation['frompartner_id'] in partnergroups.get(frompartner,()))):
+            continue
+        if translation['topartner_id'] is not None and not (topartner is not None and (translation['topartner_id'] == topartner or translation['topartner_id'] in partnergroups.get(topartner,()))):
+            continue
+        return translation['tscript'],translation['toeditype'],translation['tomessagetype']
+    return None,None,None
+
+def lookup_translation_sql(frommessagetype,fromeditype,alt,frompartner,topartner):
+    ''' lookup the translation in database: frommessagetype,fromeditype,alt,frompartner,topartner -> mappingscript, tomessagetype, toeditype
     '''
     for row2 in query('''SELECT tscript,tomessagetype,toeditype
                             FROM translate
@@ -3,11 +3,17 @@ import sqlite3
 import re
 
 reformatparamstyle = re.compile(r'%\((?P<name>[^)]+)\)s')
+_sqlcache = {}          #query string as used by bots -> query string for SQLite
+MAX_SQLCACHE = 1000
 
 sqlite3.register_adapter(bool, int)
 sqlite3.register_converter('BOOLEAN', lambda s: bool(int(s)))
 
-def connect(database):
+def connect(database,journal_mode=None,synchronous='OFF',cache_size=None,mmap_size=None):
+    ''' connection for bots-engine.
+        journal_mode 'WAL': readers (eg GUI) are not blocked while bots-engine is writing; journal_mode is kept in database file.
+        cache_size, mmap_size: as SQLite pragmas (cache_size in pages or if negative in KiB; mmap_size in bytes).
+    '''
     con = sqlite3.connect(
         database,
         factory=BotsConnection,
@@ -16,9 +22,25 @@ def connect(database):
         isolation_level='EXCLUSIVE'
     )
     con.row_factory = sqlite3.Row
-    con.execute('PRAGMA synchronous=OFF')
+    if journal_mode:
+        con.execute('PRAGMA journal_mode=%s'%journal_mode)
+    con.execute('PRAGMA synchronous=%s'%synchronous)
+    if cache_size:
+        con.execute('PRAGMA cache_size=%d'%cache_size)
+    if mmap_size:
+        con.execute('PRAGMA mmap_size=%d'%mmap_size)
     return con
 
+def reformat(string):
+    ''' change paramstyle of query; result is cached as bots uses the same queries over and over.'''
+    try:
+        return _sqlcache[string]
+    except KeyError:
+        if len(_sqlcache) >= MAX_SQLCACHE:
+            _sqlcache.clear()
+        terug = _sqlcache[string] = reformatparamstyle.sub(r':\g<name>', string)
+        return terug
+
 class BotsConnection(sqlite3.Connection):
     def cursor(self):
         return sqlite3.Connection.cursor(self, factory=BotsCursor)
@@ -36,6 +58,13 @@ class BotsCursor(sqlite3.Cursor):
         else:
             sqlite3.Cursor.execute(
                 self,
-                reformatparamstyle.sub(r':\g<name>', string),
+                reformat(string),
                 parameters
             )
+
+    def executemany(self, string, seq_of_parameters):
+        sqlite3.Cursor.executemany(
+            self,
+            reformat(string),
+            seq_of_parameters
+        )
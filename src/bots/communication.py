@@ -19,6 +19,12 @@ import smtplib
 import ftplib
 import socket
 import ssl
+import collections
+import concurrent.futures
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 if os.name == 'nt':
     import msvcrt
 elif os.name == 'posix':
@@ -112,41 +118,29 @@ class _comsession(object):
                 #~ print('in communication run 1')
                 #handle maxsecondsperchannel: use global value from bots.ini unless specified in channel. (In database this is field 'rsrv2'.)
                 self.maxsecondsperchannel = self.channeldict['rsrv2'] if self.channeldict['rsrv2'] is not None and self.channeldict['rsrv2'] > 0 else botsglobal.ini.getint('settings','maxsecondsperchannel',sys.maxsize)
-                #bots tries to connect several times. this is probably a better stategy than having long time-outs.
-                max_nr_connect_tries = botsglobal.ini.getint('settings','maxconnectiontries',3)        #how often does bots try to connect. TODO later version: setting per channel
-                nr_connect_tries = 0
-                while True:
-                    nr_connect_tries += 1
-                    try:
-                        #~ print('in communication run 2')
-                        self.connect()
-                        #~ print('in communication run 3')
-                    except:
-                        #check if max nr tries is reached
-                        if nr_connect_tries < max_nr_connect_tries:
-                            continue
-                        #in-connection failed (no files are received yet via this channel)
-                        #store in database how many failed connection tries for this channel.
-                        #useful if bots is scheduled quite often, and limiting number of error-reports eg when server is down.
-                        #max_nr_retry : from channel. should be integer, but only textfields where left. so might be ''/None->use 0
-                        max_nr_retry = int(self.channeldict['rsrv1']) if self.channeldict['rsrv1'] else 0
-                        if max_nr_retry:
-                            domain = 'bots_communication_failure_' + self.channeldict['idchannel']
-                            nr_retry = botslib.unique(domain)  #update nr_retry in database
-                            if nr_retry >= max_nr_retry:
-                                botslib.unique(domain,updatewith=0)    #reset nr_retry to zero
-                            else:
-                                return  #max_nr_retry is not reached. return without error
-                        raise
-                    finally:
-                        break
-                    # ~ else:
-                        # ~ #in-connection OK. Reset database entry.
-                        # ~ #max_nr_retry : get this from channel. should be integer, but only textfields where left. so might be ''/None->use 0
-                        # ~ max_nr_retry = int(self.channeldict['rsrv1']) if self.channeldict['rsrv1'] else 0
-                        # ~ if max_nr_retry:
-                            # ~ domain = 'bots_communication_failure_' + self.channeldict['idchannel']
-                            # ~ botslib.unique(domain,updatewith=0)    #set nr_retry to zero
+                try:
+                    self.connect_tries()
+                except:
+                    #in-connection failed (no files are received yet via this channel)
+                    #store in database how many failed connection tries for this channel.
+                    #useful if bots is scheduled quite often, and limiting number of error-reports eg when server is down.
+                    #max_nr_retry : from channel. should be integer, but only textfields where left. so might be ''/None->use 0
+                    max_nr_retry = int(self.channeldict['rsrv1']) if self.channeldict['rsrv1'] else 0
+                    if max_nr_retry:
+                        domain = 'bots_communication_failure_' + self.channeldict['idchannel']
+                        nr_retry = botslib.unique(domain)  #update nr_retry in database
+                        if nr_retry >= max_nr_retry:
+                            botslib.unique(domain,updatewith=0)    #reset nr_retry to zero
+                        else:
+                            return  #max_nr_retry is not reached. return without error
+                    raise
+                # ~ else:
+                    # ~ #in-connection OK. Reset database entry.
+                    # ~ #max_nr_retry : get this from channel. should be integer, but only textfields where left. so might be ''/None->use 0
+                    # ~ max_nr_retry = int(self.channeldict['rsrv1']) if self.channeldict['rsrv1'] else 0
+                    # ~ if max_nr_retry:
+                        # ~ domain = 'bots_communication_failure_' + self.channeldict['idchannel']
+                        # ~ botslib.unique(domain,updatewith=0)    #set nr_retry to zero
                 self.incommunicate()
                 self.disconnect()
             self.postcommunicate()
@@ -183,6 +177,7 @@ class _comsession(object):
         else:
             archivepath = botslib.join(self.channeldict['archivepath'],time.strftime('%Y%m%d'))
         archivezip = botsglobal.ini.getboolean('settings','archivezip',False)   #archive to zip or not
+        zerocopy = botsglobal.ini.getboolean('settings','zerocopy',False)   #hard link files in archive instead of copy
         if archivezip:
             archivepath += '.zip'
         checkedifarchivepathisthere = False  #for a outchannel that is less used, lots of empty dirs will be created. This var is used to check within loop if dir exist, but this is only checked one time.
@@ -233,7 +228,11 @@ class _comsession(object):
                 # if a file of the same name already exists, add a timestamp
                 if os.path.isfile(botslib.join(archivepath,archivename)):
                     archivename = os.path.splitext(archivename)[0] + time.strftime('_%H%M%S') + os.path.splitext(archivename)[1]
-                shutil.copy(absfilename,botslib.join(archivepath,archivename))
+                if zerocopy:
+                    botslib.linkfile(absfilename,botslib.join(archivepath,archivename))
+                else:
+                    botslib.copyfile(absfilename,botslib.join(archivepath,archivename))
+                    shutil.copymode(absfilename,botslib.join(archivepath,archivename))
 
         if archivezip and checkedifarchivepathisthere:
             archivezipfilehandler.close()
@@ -645,9 +644,120 @@ class _comsession(object):
     def connect(self):
         pass
 
+    def connect_tries(self):
+        ''' connect for incoming communication.
+            bots tries to connect several times (setting maxconnectiontries). this is probably a better stategy than having long time-outs.
+        '''
+        max_nr_connect_tries = botsglobal.ini.getint('settings','maxconnectiontries',3)        #how often does bots try to connect. TODO later version: setting per channel
+        nr_connect_tries = 0
+        while True:
+            nr_connect_tries += 1
+            try:
+                self.connect()
+            except:
+                if nr_connect_tries < max_nr_connect_tries:
+                    continue
+                raise
+            else:
+                break
+
     def disconnect(self):
         pass
 
+    def nr_sessions(self):
+        ''' number of sessions used to fetch files in parallel (ftp, sftp).
+            via user scripting (function 'parallelsessions' in communicationscript) else setting 'ftpsessions' in bots.ini.
+        '''
+        if self.userscript and hasattr(self.userscript,'parallelsessions'):
+            return botslib.runscript(self.userscript,self.scriptname,'parallelsessions',channeldict=self.channeldict)
+        return botsglobal.ini.getint('settings','ftpsessions',1)
+
+    def fetchfiles(self,lijst,scheme,functionname):
+        ''' fetch files in lijst from server; each fetched file is a transaction.
+            method retrieve(fromfilename,tofilename) of subclass does the transfer.
+            if more than 1 session: transfers are done in parallel, each session fetches other files.
+            transactions, removing of files on server and error reporting are always done in this (main) thread.
+        '''
+        startdatetime = datetime.datetime.now()
+        nr_sessions = min(self.nr_sessions(),len(lijst))
+        if nr_sessions > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=nr_sessions)
+            pool = queue.Queue()        #connected sessions not in use
+            sessions = []               #all connected sessions; disconnect at end
+        pending = collections.deque()   #files being fetched: (fromfilename,ta_from,ta_to,future)
+        try:
+            for fromfilename in lijst:  #fetch files from server.
+                if (datetime.datetime.now()-startdatetime).seconds >= self.maxsecondsperchannel:
+                    break
+                try:
+                    ta_from = botslib.NewTransaction(filename=scheme+posixpath.join(self.dirpath,fromfilename),
+                                                        status=EXTERNIN,
+                                                        fromchannel=self.channeldict['idchannel'],
+                                                        idroute=self.idroute)
+                    ta_to = ta_from.copyta(status=FILEIN)
+                except:
+                    txt = botslib.txtexc()
+                    botslib.ErrorProcess(functionname=functionname,errortext=txt,channeldict=self.channeldict)
+                    continue
+                if nr_sessions > 1:
+                    pending.append((fromfilename,ta_from,ta_to,executor.submit(self._retrieve_pooled,pool,sessions,fromfilename,str(ta_to.idta))))
+                    if len(pending) >= nr_sessions:
+                        fromfilename,ta_from,ta_to,future = pending.popleft()
+                        self._fetched(fromfilename,ta_from,ta_to,future.result,functionname)
+                else:
+                    self._fetched(fromfilename,ta_from,ta_to,lambda: self.retrieve(fromfilename,str(ta_to.idta)),functionname)
+            while pending:
+                fromfilename,ta_from,ta_to,future = pending.popleft()
+                self._fetched(fromfilename,ta_from,ta_to,future.result,functionname)
+        finally:
+            if nr_sessions > 1:
+                executor.shutdown(wait=True)
+                for session in sessions:
+                    try:
+                        session.disconnect()
+                    except:
+                        pass
+
+    def _fetched(self,fromfilename,ta_from,ta_to,transfer,functionname):
+        ''' do transfer (or get its result) and handle transactions for fetched file.'''
+        try:
+            filesize = transfer()
+        except botslib.BotsError:   #directory or empty file; handle exception but generate no error.
+            try:
+                ta_from.delete()
+                ta_to.delete()
+            except:
+                pass
+        except:
+            txt = botslib.txtexc()
+            botslib.ErrorProcess(functionname=functionname,errortext=txt,channeldict=self.channeldict)
+            try:
+                ta_from.delete()
+                ta_to.delete()
+            except:
+                pass
+        else:
+            ta_to.update(filename=str(ta_to.idta),statust=OK,filesize=filesize)
+            ta_from.update(statust=DONE)
+            if self.channeldict['remove']:
+                self.removefile(fromfilename)
+
+    def _retrieve_pooled(self,pool,sessions,fromfilename,tofilename):
+        ''' runs in thread: fetch file using a session from pool; connect new session if none is free.'''
+        try:
+            session = pool.get_nowait()
+        except queue.Empty:
+            session = self.__class__(self.channeldict,self.idroute,self.userscript,self.scriptname,self.command,self.rootidta)
+            session.connect_tries()
+            sessions.append(session)
+        try:
+            filesize = session.retrieve(fromfilename,tofilename)
+        except botslib.BotsError:   #directory or empty file: session is OK
+            pool.put(session)
+            raise
+        pool.put(session)           #for other errors session is not put back in pool: might be broken
+        return filesize
+
     @staticmethod
     def convertcodecformime(codec_in):
         convertdict = {
@@ -741,6 +851,9 @@ class file(_comsession):
         frompath = botslib.join(self.channeldict['path'],self.channeldict['filename'])
         filelist = sorted(filename for filename in glob.iglob(frompath) if os.path.isfile(filename))
         startdatetime = datetime.datetime.now()
+        #zerocopy: file is hard linked to data file, no copy. File is removed after its ta is committed.
+        #Only if channel removes files (else file and data file could be changed via the other), not with syslock (file is read while locked).
+        zerocopy = botsglobal.ini.getboolean('settings','zerocopy',False) and self.channeldict['remove'] and not self.channeldict['syslock']
         remove_ta = False
         #~ print('in communication 4.2')
         for fromfilename in filelist:
@@ -751,23 +864,31 @@ class file(_comsession):
                                                 idroute=self.idroute)
                 ta_to =   ta_from.copyta(status=FILEIN)
                 remove_ta = True
-                #open fromfile, syslock if indicated
-                fromfile = open(fromfilename,'rb')
-                filesize = os.fstat(fromfile.fileno()).st_size
-                if self.channeldict['syslock']:
-                    if os.name == 'nt':
-                        msvcrt.locking(fromfile.fileno(), msvcrt.LK_LOCK, 0x0fffffff)
-                    elif os.name == 'posix':
-                        fcntl.lockf(fromfile.fileno(), fcntl.LOCK_SH|fcntl.LOCK_NB)
-                    else:
-                        raise botslib.LockedFileError('Can not do a systemlock on this platform')
-                #open tofile
-                tofilename = str(ta_to.idta)
-                tofile = botslib.opendata_bin(tofilename, 'wb')
-                #copy
-                shutil.copyfileobj(fromfile,tofile,1048576)
-                tofile.close()
-                fromfile.close()
+                if zerocopy:
+                    tofilename = str(ta_to.idta)
+                    filesize = os.path.getsize(fromfilename)
+                    absfilename = botslib.abspathdata(tofilename)
+                    botslib.dirshouldbethere(os.path.dirname(absfilename))
+                    botslib.linkfile(fromfilename,absfilename)
+                else:
+                    #open fromfile, syslock if indicated
+                    fromfile = open(fromfilename,'rb')
+                    filesize = os.fstat(fromfile.fileno()).st_size
+                    if self.channeldict['syslock']:
+                        if os.name == 'nt':
+                            msvcrt.locking(fromfile.fileno(), msvcrt.LK_LOCK, 0x0fffffff)
+                        elif os.name == 'posix':
+                            fcntl.lockf(fromfile.fileno(), fcntl.LOCK_SH|fcntl.LOCK_NB)
+                        else:
+                            raise botslib.LockedFileError('Can not do a systemlock on this platform')
+                    #open tofile
+                    tofilename = str(ta_to.idta)
+                    tofile = botslib.opendata_bin(tofilename, 'wb')
+                    #copy
+                    shutil.copyfileobj(fromfile,tofile,1048576)
+                    tofile.close()
+                    fromfile.close()
+                    botsglobal.bytescopied += filesize
             except:
                 txt = botslib.txtexc()
                 botslib.ErrorProcess(functionname='file-incommunicate',errortext=txt,channeldict=self.channeldict)
@@ -1151,70 +1272,36 @@ class ftp(_comsession):
             each to be imported file is transaction.
             each imported file is transaction.
         '''
-        def writeline_callback(line):
-            ''' inline function to write to file for non-binary ftp
-            '''
-            tofile.write(line + '\n')
-        startdatetime = datetime.datetime.now()
         files = []
         try:            #some ftp servers give errors when directory is empty; catch these errors here
             files = self.session.nlst()
         except (ftplib.error_perm,ftplib.error_temp) as msg:
             if str(msg)[:3] not in ['550','450']:
                 raise
-
         lijst = fnmatch.filter(files,self.channeldict['filename'])
-        remove_ta = False
-        for fromfilename in lijst:  #fetch messages from ftp-server.
-            try:
-                ta_from = botslib.NewTransaction(filename='ftp:/'+posixpath.join(self.dirpath,fromfilename),
-                                                    status=EXTERNIN,
-                                                    fromchannel=self.channeldict['idchannel'],
-                                                    idroute=self.idroute)
-                ta_to =   ta_from.copyta(status=FILEIN)
-                remove_ta = True
-                tofilename = str(ta_to.idta)
-                try:
-                    if self.channeldict['ftpbinary']:
-                        tofile = botslib.opendata_bin(tofilename, 'wb')
-                        self.session.retrbinary('RETR ' + fromfilename, tofile.write)
-                    else:
-                        tofile = botslib.opendata(tofilename, 'wb',charset='latin-1')   #python3 gives back a 'string'.
-                        self.session.retrlines('RETR ' + fromfilename, writeline_callback)
-                except ftplib.error_perm as msg:
-                    if str(msg)[:3] in ['550',]:     #we are trying to download a directory...
-                        raise botslib.BotsError('To be catched')
-                    else:
-                        raise
-                tofile.close()
-                filesize = os.path.getsize(botslib.abspathdata(tofilename))
-                if not filesize:
-                    raise botslib.BotsError('To be catched; directory (or empty file)')
-            except botslib.BotsError:   #directory or empty file; handle exception but generate no error.
-                if remove_ta:
-                    try:
-                        ta_from.delete()
-                        ta_to.delete()
-                    except:
-                        pass
-            except:
-                txt = botslib.txtexc()
-                botslib.ErrorProcess(functionname='ftp-incommunicate',errortext=txt,channeldict=self.channeldict)
-                if remove_ta:
-                    try:
-                        ta_from.delete()
-                        ta_to.delete()
-                    except:
-                        pass
+        self.fetchfiles(lijst,'ftp:/','ftp-incommunicate')
+
+    def retrieve(self,fromfilename,tofilename):
+        ''' fetch file from ftp-server, data is written while received. Returns filesize.'''
+        try:
+            if self.channeldict['ftpbinary']:
+                with botslib.opendata_bin(tofilename, 'wb') as tofile:
+                    self.session.retrbinary('RETR ' + fromfilename, tofile.write)
             else:
-                ta_to.update(filename=tofilename,statust=OK,filesize=filesize)
-                ta_from.update(statust=DONE)
-                if self.channeldict['remove']:
-                    self.session.delete(fromfilename)
-            finally:
-                remove_ta = False
-                if (datetime.datetime.now()-startdatetime).seconds >= self.maxsecondsperchannel:
-                    break
+                with botslib.opendata(tofilename, 'wb',charset='latin-1') as tofile:   #python3 gives back a 'string'.
+                    self.session.retrlines('RETR ' + fromfilename, lambda line: tofile.write(line + '\n'))
+        except ftplib.error_perm as msg:
+            if str(msg)[:3] in ['550',]:     #we are trying to download a directory...
+                raise botslib.BotsError('To be catched')
+            else:
+                raise
+        filesize = os.path.getsize(botslib.abspathdata(tofilename))
+        if not filesize:
+            raise botslib.BotsError('To be catched; directory (or empty file)')
+        return filesize
+
+    def removefile(self,fromfilename):
+        self.session.delete(fromfilename)
 
     @botslib.log_session
     def outcommunicate(self):
@@ -1443,44 +1530,17 @@ class sftp(_comsession):
             each to be imported file is transaction.
             each imported file is transaction.
         '''
-        startdatetime = datetime.datetime.now()
         files = self.session.listdir('.')
         lijst = fnmatch.filter(files,self.channeldict['filename'])
-        remove_ta = False
-        for fromfilename in lijst:  #fetch messages from sftp-server.
-            try:
-                ta_from = botslib.NewTransaction(filename='sftp:/'+posixpath.join(self.dirpath,fromfilename),
-                                                    status=EXTERNIN,
-                                                    fromchannel=self.channeldict['idchannel'],
-                                                    idroute=self.idroute)
-                ta_to =   ta_from.copyta(status=FILEIN)
-                remove_ta = True
-                tofilename = str(ta_to.idta)
-                fromfile = self.session.open(fromfilename, 'r')    # SSH treats all files as binary. paramiko doc says: b-flag is ignored
-                content = fromfile.read()
-                filesize = len(content)
-                tofile = botslib.opendata_bin(tofilename, 'wb')
-                tofile.write(content)
-                tofile.close()
-                fromfile.close()
-            except:
-                txt = botslib.txtexc()
-                botslib.ErrorProcess(functionname='sftp-incommunicate',errortext=txt,channeldict=self.channeldict)
-                if remove_ta:
-                    try:
-                        ta_from.delete()
-                        ta_to.delete()
-                    except:
-                        pass
-            else:
-                ta_to.update(filename=tofilename,statust=OK,filesize=filesize)
-                ta_from.update(statust=DONE)
-                if self.channeldict['remove']:
-                    self.session.remove(fromfilename)
-            finally:
-                remove_ta = False
-                if (datetime.datetime.now()-startdatetime).seconds >= self.maxsecondsperchannel:
-                    break
+        self.fetchfiles(lijst,'sftp:/','sftp-incommunicate')
+
+    def retrieve(self,fromfilename,tofilename):
+        ''' fetch file from sftp-server, data is written while received (in blocks, with read-ahead). Returns filesize.'''
+        with botslib.opendata_bin(tofilename, 'wb') as tofile:
+            return self.session.getfo(fromfilename,tofile)    # SSH treats all files as binary.
+
+    def removefile(self,fromfilename):
+        self.session.remove(fromfilename)
 
     @botslib.log_session
     def outcommunicate(self):
@@ -1511,7 +1571,8 @@ class sftp(_comsession):
                 tofilename = self.filename_formatter(filename_mask,ta_from)
                 fromfile = botslib.opendata_bin(row[str('filename')], 'rb')
                 tofile = self.session.open(tofilename, mode)    # SSH treats all files as binary. paramiko doc says: b-flag is ignored
-                tofile.write(fromfile.read())
+                tofile.set_pipelined(True)     #do not wait for server acknowledgement of each block
+                shutil.copyfileobj(fromfile,tofile,1048576)
                 tofile.close()
                 fromfile.close()
                 #Rename filename after writing file.
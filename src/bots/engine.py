@@ -4,6 +4,7 @@ import sys
 import os
 import atexit
 import logging
+import logging.handlers
 import socket
 import time
 import warnings
@@ -13,6 +14,12 @@ from . import botsinit
 from . import botsglobal
 from . import router
 from . import cleanup
+from . import grammar
+from . import transform
+try:
+    import resource
+except ImportError:     #not on windows
+    resource = None
 ''' Start bots-engine.'''
 
 
@@ -24,6 +31,41 @@ def start():
         3: Database is locked, but "maxruntime" has not been exceeded.
     '''
     #NOTE: bots directory should always be on PYTHONPATH - otherwise it will not start.
+    configdir,commandstorun,routestorun,do_cleanup_parameter = parse_arguments(sys.argv[1:])
+    botsinit.generalinit(configdir)     #find locating of bots, configfiles, init paths etc.
+    #set working directory to bots installation. advantage: when using relative paths it is clear that this point paths within bots installation.
+    os.chdir(botsglobal.ini.get('directories','botspath'))
+
+    #**************check if another instance of bots-engine is running/if port is free******************************
+    routerun = botslib.is_routerun(commandstorun,routestorun,do_cleanup_parameter)
+    try:
+        enginelocks = botslib.lock_engine(routestorun if routerun else None)
+    except socket.error:
+        sys.exit(3)
+    else:
+        for enginelock in enginelocks:
+            atexit.register(enginelock.close)
+
+    #**************initialise logging******************************
+    try:
+        process_name = 'engine'
+        botsglobal.logger = botsinit.initenginelogging(process_name)
+        atexit.register(logging.shutdown)
+    except Exception as msg:
+        botslib.sendbotserrorreport('[Bots severe error] Bots is not running anymore','Bots does not run because logging is not possible.\nOften a rights problem.\n')
+        sys.exit(1)
+    else:
+        if botsglobal.ini.get('settings','log_file_number','') != 'daily':
+            for key,value in botslib.botsinfo():    #log info about environement, versions, etc
+                botsglobal.logger.info('%(key)s: "%(value)s".',{'key':key,'value':value})
+
+    scripts = initengine()
+    sys.exit(run(commandstorun,routestorun,do_cleanup_parameter,scripts))
+
+def parse_arguments(arguments):
+    ''' handle command line arguments of bots-engine.
+        returns configdir,commandstorun,routestorun,do_cleanup_parameter
+    '''
     #********command line arguments**************************
     usage = '''
     This is "%(name)s" version %(version)s, part of Bots open source edi translator (http://bots.sourceforge.net).
@@ -47,7 +89,7 @@ def start():
     commandstorun = []
     routestorun = []    #list with routes to run
     do_cleanup_parameter = False
-    for arg in sys.argv[1:]:
+    for arg in arguments:
         if arg.startswith('-c'):
             configdir = arg[2:]
             if not configdir:
@@ -66,32 +108,12 @@ def start():
         commandstorun = ['--new']
     commandstorun = [command[2:] for command in commandspossible if command in commandstorun]   #sort commands
     #***********end handling command line arguments**************************
+    return configdir,commandstorun,routestorun,do_cleanup_parameter
 
-    botsinit.generalinit(configdir)     #find locating of bots, configfiles, init paths etc.
-    #set working directory to bots installation. advantage: when using relative paths it is clear that this point paths within bots installation.
-    os.chdir(botsglobal.ini.get('directories','botspath'))
-
-    #**************check if another instance of bots-engine is running/if port is free******************************
-    try:
-        engine_socket = botslib.check_if_other_engine_is_running()
-    except socket.error:
-        sys.exit(3)
-    else:
-        atexit.register(engine_socket.close)
-
-    #**************initialise logging******************************
-    try:
-        process_name = 'engine'
-        botsglobal.logger = botsinit.initenginelogging(process_name)
-        atexit.register(logging.shutdown)
-    except Exception as msg:
-        botslib.sendbotserrorreport('[Bots severe error] Bots is not running anymore','Bots does not run because logging is not possible.\nOften a rights problem.\n')
-        sys.exit(1)
-    else:
-        if botsglobal.ini.get('settings','log_file_number','') != 'daily':
-            for key,value in botslib.botsinfo():    #log info about environement, versions, etc
-                botsglobal.logger.info('%(key)s: "%(value)s".',{'key':key,'value':value})
-
+def initengine():
+    ''' initialisation of bots-engine after logging is initialised: connect to database, import user scripts.
+        returns the user scripts.
+    '''
     #**************connect to database**********************************
     try:
         botsinit.connect()
@@ -101,6 +123,8 @@ def start():
     else:
         botsglobal.logger.info('Connected to database.')
         atexit.register(botsglobal.db.close)
+        botslib.begin_uniqueblocks()
+        atexit.register(botslib.end_uniqueblocks)   #give back unused unique numbers (before closing database)
 
     #************initialise user exits for the whole bots-engine*************************
     try:
@@ -117,9 +141,22 @@ def start():
         except botslib.BotsImportError:
             botsglobal.logger.info('In acceptance test there is no script file "bots_acceptancetest.py" to check the results of the acceptance test.')
 
+    warnings.simplefilter('error', UnicodeWarning)
+    return userscript,scriptname,acceptance_userscript,acceptance_scriptname
+
+def run(commandstorun,routestorun,do_cleanup_parameter,scripts):
+    ''' one run of bots-engine: database lock, run the routes, cleanup. Returns sysexit code (see start()).'''
+    userscript,scriptname,acceptance_userscript,acceptance_scriptname = scripts
+    botsglobal.routerun = botslib.is_routerun(commandstorun,routestorun,do_cleanup_parameter)
     #**************handle database lock****************************************
     #set a lock on the database; if not possible, the database is locked: an earlier instance of bots-engine was terminated unexpectedly.
-    if not botslib.set_database_lock():
+    if botsglobal.routerun:
+        #option parallel_routes: runs of routes have a database lock per run (see router.rundispatcher).
+        #lock of bots-engine is there: run of all routes has crashed; crash recovery is done by next run of all routes.
+        if botslib.is_database_locked():
+            botsglobal.logger.critical('Bots database is locked; routes are not run. Crash recovery is done by the next run of all routes.')
+            return 3
+    elif not botslib.set_database_lock():
         #for SQLite: do a integrity check on the database
         if botsglobal.settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
             cursor = botsglobal.db.execute('''PRAGMA integrity_check''')
@@ -131,7 +168,7 @@ def start():
                         'Bots has stopped processing EDI files.'
                 botsglobal.logger.critical(warn)
                 botslib.sendbotserrorreport('[Bots severe error]Database is damaged',warn)
-                sys.exit(1)
+                return 1
         warn =  '!Bots database is locked!\n'\
                 'Bots-engine has ended in an unexpected way during the last run.\n'\
                 'Most likely causes: sudden power-down, system crash, problems with disk I/O, bots-engine terminated by user, etc.\n'\
@@ -139,18 +176,20 @@ def start():
         botsglobal.logger.critical(warn)
         botslib.sendbotserrorreport('[Bots severe error]Database is locked',warn)
         commandstorun.insert(0,'crashrecovery')         #there is a database lock. Add a crashrecovery as first command to run.
-    atexit.register(botslib.remove_database_lock)
-
-    warnings.simplefilter('error', UnicodeWarning)
 
     #**************run the routes**********************************************
     #commandstorun determines the type(s) of run. eg: ['automaticretrycommunication','new']
+    errorinrun = 0      #detect if there has been some error. Only used for correct exit() code
     try:
         botslib.prepare_confirmrules()
+        botslib.prepare_translations()
         #in acceptance tests: run a user script before running eg to clean output directories******************************
         botslib.tryrunscript(acceptance_userscript,acceptance_scriptname,'pretest',routestorun=routestorun)
         botslib.tryrunscript(userscript,scriptname,'pre',commandstorun=commandstorun,routestorun=routestorun)
-        errorinrun = 0      #detect if there has been some error. Only used for correct exit() code
+        if botslib.parallel_routes() and not botsglobal.routerun:
+            #crash recovery of runs of routes (option parallel_routes). This run is the only bots-engine running.
+            for idroute in sorted(set(idroute for idroute,rootidta in botslib.crashed_routeruns())):
+                errorinrun += _runroute('crashrecovery',idroute)
         first_command_2_run = True
         for command in commandstorun:
             #if multiple commands in run: reports etc are based on timestamp; so there needs to be at least one second between these runs.
@@ -184,7 +223,13 @@ def start():
                 botsglobal.logger.info('Run all active routes from database: "%(routes)s".',{'routes':str(use_routestorun)})
             #************run routes for this command******************************
             botslib.tryrunscript(userscript,scriptname,'pre' + command,routestorun=use_routestorun)
-            errorinrun += router.rundispatcher(command,use_routestorun)
+            if botsglobal.routerun:     #each route is a run (report, crash recovery) of its own
+                for idroute in use_routestorun:
+                    if botslib.crashed_routeruns(idroute):
+                        errorinrun += _runroute('crashrecovery',idroute)
+                    errorinrun += _runroute(command,idroute)
+            else:
+                errorinrun += router.rundispatcher(command,use_routestorun)
             botslib.tryrunscript(userscript,scriptname,'post' + command,routestorun=use_routestorun)
             #*********finished running routes for this command****************************
         #*********finished all commands****************************************
@@ -194,15 +239,93 @@ def start():
         except Exception as msg:
             print(str(msg))
 
-        cleanup.cleanup(do_cleanup_parameter,userscript,scriptname)
+        if not botsglobal.routerun:     #cleanup is done in runs of all routes
+            cleanup.cleanup(do_cleanup_parameter,userscript,scriptname)
+        grammar.log_cache_statistics()
+        transform.log_ccode_cache_statistics()
     except Exception as msg:
         botsglobal.logger.exception('Severe error in bots system:\n%(msg)s',{'msg':str(msg)})    #of course this 'should' not happen.
-        sys.exit(1)
+        return 1
+    finally:
+        if not botsglobal.routerun:
+            botslib.remove_database_lock()
+    if errorinrun:
+        return 2 #indicate: error(s) in run(s)
     else:
-        if errorinrun:
-            sys.exit(2) #indicate: error(s) in run(s)
-        else:
-            sys.exit(0) #OK
+        return 0 #OK
+
+def _runroute(command,idroute):
+    ''' option parallel_routes: run for one route; root of run gets the idroute (used in report and crash recovery of the run).'''
+    botslib.setrouteid(idroute)
+    try:
+        return router.rundispatcher(command,[idroute])
+    finally:
+        botslib.setrouteid('')
+
+
+def worker(connection,configdir):
+    ''' warm bots-engine, started by bots-jobqueueserver (option engine_workers in bots.ini).
+        initialisation is done once; after that jobs (command line arguments for bots-engine) are received via connection and run.
+        for each job (sysexit code,stop) is send back. sysexit code None: job is not run.
+        worker stops after worker_max_jobs jobs, if memory use is more than worker_max_memory (MB) or if user scripts are changed.
+    '''
+    sys.stdout = sys.stderr = open(os.devnull,'w')     #as for bots-engine started by jobqueue server
+    botsinit.generalinit(configdir)
+    os.chdir(botsglobal.ini.get('directories','botspath'))
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    scripts = initengine()
+    max_jobs = botsglobal.ini.getint('jobqueue','worker_max_jobs',100)
+    max_memory = botsglobal.ini.getint('jobqueue','worker_max_memory',500)
+    starttime = time.time()
+    nr_jobs = 0
+    while True:
+        arguments = connection.recv()
+        if arguments is None:   #stop worker
+            break
+        if _usersys_changed(starttime):     #imported user scripts (mappings etc) would be used: job is run by a new worker
+            connection.send((None,True))
+            break
+        enginelocks = []
+        try:
+            dummy,commandstorun,routestorun,do_cleanup_parameter = parse_arguments(arguments)
+            routerun = botslib.is_routerun(commandstorun,routestorun,do_cleanup_parameter)
+            enginelocks = botslib.lock_engine(routestorun if routerun else None)
+            if nr_jobs:     #each run a new log file is used
+                for handler in botsglobal.logger.handlers:
+                    if isinstance(handler,logging.handlers.RotatingFileHandler):
+                        handler.doRollover()
+            botsglobal.not_import.clear()   #user scripts might be added since last job
+            result = run(commandstorun,routestorun,do_cleanup_parameter,scripts)
+        except socket.error:
+            result = 3
+        except SystemExit as msg:
+            result = msg.code
+        except Exception as msg:
+            botsglobal.logger.exception('Severe error in bots system:\n%(msg)s',{'msg':str(msg)})
+            result = 1
+        finally:
+            for enginelock in enginelocks:
+                enginelock.close()
+        botslib.end_uniqueblocks()      #give back unused unique numbers after each job
+        botslib.begin_uniqueblocks()
+        nr_jobs += 1
+        stop = nr_jobs >= max_jobs or (max_memory and resource is not None and resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024 >= max_memory)
+        connection.send((result,stop))
+        if stop:
+            break
+
+def _usersys_changed(since):
+    ''' check if imported modules from usersys are changed after time since.'''
+    prefix = botsglobal.usersysimportpath + '.'
+    for name,module in list(sys.modules.items()):
+        filename = getattr(module,'__file__',None)
+        if filename and name.startswith(prefix):
+            try:
+                if os.path.getmtime(filename) > since:
+                    return True
+            except OSError:
+                return True
+    return False
 
 
 if __name__ == '__main__':
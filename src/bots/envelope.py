@@ -1,6 +1,7 @@
 import sys
 import os
 import shutil
+import codecs
 import json as simplejson
 #bots-modules
 from . import botslib
@@ -8,6 +9,8 @@ from . import botsglobal
 from . import outmessage
 from .botsconfig import *
 
+MERGEFIELDS = ('editype','messagetype','envelope','rsrv3','frompartner','topartner','testindicator','charset')    #messages with the same values are merged
+
 
 def mergemessages(startstatus,endstatus,idroute,rootidta=None):
     ''' Merges and/or envelopes one or more messages to one file (status TRANSLATED---->MERGED).
@@ -34,6 +37,7 @@ def mergemessages(startstatus,endstatus,idroute,rootidta=None):
                                 ORDER BY idta
                                 ''',
                                 {'rootidta':rootidta,'status':startstatus,'statust':OK,'merge':False,'idroute':idroute}):
+        botslib.begin_unitofwork()      #changes in db-ta for this message are written and committed at once
         try:
             ta_info = dict(row)
             ta_fromfile = botslib.OldTransaction(ta_info['idta'])
@@ -50,62 +54,58 @@ def mergemessages(startstatus,endstatus,idroute,rootidta=None):
             ta_tofile.update(statust=OK,**ta_info)  #selection is used to update enveloped message;
         finally:
             ta_fromfile.update(statust=DONE)
+            botslib.end_unitofwork()
 
     #**********for messages to merge & envelope
     #editype,messagetype: needed to get right envelope
     #envelope: envelope to use
     #rsrv3 : user defined enveloping criterium
     #frompartner,topartner,testindicator,charset,nrmessages: needed for envelope (edifact, x12)
-    for row in botslib.query('''SELECT editype,messagetype,envelope,rsrv3,frompartner,topartner,testindicator,charset,rsrv5,sum(nrmessages) as nrmessages
-                                FROM ta
-                                WHERE idta>%(rootidta)s
-                                AND status=%(status)s
-                                AND statust=%(statust)s
-                                AND merge=%(merge)s
-                                AND idroute=%(idroute)s
-                                GROUP BY editype,messagetype,envelope,rsrv3,frompartner,topartner,testindicator,charset
-                                ORDER BY editype,messagetype,envelope,rsrv3,frompartner,topartner,testindicator,charset
-                                ''',
-                                {'rootidta':rootidta,'status':startstatus,'statust':OK,'merge':True,'idroute':idroute}):
+    #one query for all messages to merge. Grouped in python on the exact values of the merge criteria:
+    #database sort order may differ (eg mysql: case-insensitive, trailing spaces ignored).
+    #messages without frompartner/topartner (NULL) are merged with messages of the partner(s) (as before: 'frompartner=X OR frompartner IS NULL').
+    rows = botslib.query('''SELECT editype,messagetype,envelope,rsrv3,frompartner,topartner,testindicator,charset,rsrv5,nrmessages,idta,filename
+                            FROM ta
+                            WHERE idta>%(rootidta)s
+                            AND status=%(status)s
+                            AND statust=%(statust)s
+                            AND merge=%(merge)s
+                            AND idroute=%(idroute)s
+                            ORDER BY idta
+                            ''',
+                            {'rootidta':rootidta,'status':startstatus,'statust':OK,'merge':True,'idroute':idroute})
+    groups = {}     #merge key -> messages with exactly these values, in order of idta
+    for row in rows:
+        groups.setdefault(tuple(row[field] for field in MERGEFIELDS),[]).append(row)
+    merged = set()  #idta of messages already merged
+    frompartner,topartner = MERGEFIELDS.index('frompartner'),MERGEFIELDS.index('topartner')
+    sortkey = lambda key: tuple((value is None,value) for value in key)     #None sorts last: messages without partner go to first group of partner
+    for key in sorted(groups,key=sortkey):
+        keys = set(key[:frompartner] + (fromvalue,tovalue) + key[topartner+1:] for fromvalue in (key[frompartner],None) for tovalue in (key[topartner],None))
+        group = sorted((row for nullkey in keys for row in groups.get(nullkey,[]) if row['idta'] not in merged),key=lambda row: row['idta'])
+        if not group:   #all messages are merged in group(s) of partner
+            continue
+        merged.update(row['idta'] for row in group)
+        botslib.begin_unitofwork()      #changes in db-ta for this merged file are written (batched) and committed at once
         try:
-            ta_info = dict(row)
+            ta_info = dict(zip(MERGEFIELDS,key))
+            ta_info['rsrv5'] = group[0]['rsrv5']
+            ta_info['nrmessages'] = sum(row['nrmessages'] or 0 for row in group)
             ta_info['idroute'] = idroute
-            #do another query to gather idta's to be merged.
-            filename_list = []  #list of filenames...these will be used in actual merging.
-            for row2 in botslib.query('''SELECT idta,filename
-                                        FROM ta
-                                        WHERE idta>%(rootidta)s
-                                        AND status=%(status)s
-                                        AND statust=%(statust)s
-                                        AND merge=%(merge)s
-                                        AND editype=%(editype)s
-                                        AND messagetype=%(messagetype)s
-                                        AND (frompartner=%(frompartner)s OR frompartner IS NULL)
-                                        AND (topartner=%(topartner)s OR topartner IS NULL)
-                                        AND testindicator=%(testindicator)s
-                                        AND envelope=%(envelope)s
-                                        AND rsrv3=%(rsrv3)s
-                                        AND charset=%(charset)s
-                                        ORDER BY idta
-                                        ''',
-                                        {'rootidta':rootidta,'status':startstatus,'statust':OK,'merge':True,
-                                        'editype':ta_info['editype'],'messagetype':ta_info['messagetype'],'frompartner':ta_info['frompartner'],
-                                        'topartner':ta_info['topartner'],'testindicator':ta_info['testindicator'],'charset':ta_info['charset'],
-                                        'rsrv3':ta_info['rsrv3'],'envelope':ta_info['envelope']}):
-                ta_fromfile = botslib.OldTransaction(row2['idta'])             #edi message to be merged/envelope
-                if not filename_list:                                          #if first time in loop: copy ta to new/merged/target ta
-                    ta2_tofile = ta_fromfile.copyta(status=endstatus,parent=0) #copy db_ta; parent=0 as enveloping works via child, not parent
-                    ta_info['filename'] = unicode(ta2_tofile.idta)
-                ta_fromfile.update(child=ta2_tofile.idta,statust=DONE)         #add child-relation to the org ta
-                filename_list.append(row2['filename'])
+            ta2_tofile = botslib.OldTransaction(group[0]['idta']).copyta(status=endstatus,parent=0) #copy db_ta; parent=0 as enveloping works via child, not parent
+            ta_info['filename'] = str(ta2_tofile.idta)
+            for row in group:
+                botslib.OldTransaction(row['idta']).update(child=ta2_tofile.idta,statust=DONE)   #add child-relation to the org ta
             botsglobal.logger.debug('Merge and envelope: editype: %(editype)s, messagetype: %(messagetype)s, %(nrmessages)s messages',ta_info)
-            envelope(ta_info,filename_list)
+            envelope(ta_info,[row['filename'] for row in group])
             ta_info['filesize'] = os.path.getsize(botslib.abspathdata(ta_info['filename']))
         except:
             txt = botslib.txtexc()
             ta2_tofile.update(statust=ERROR,errortext=txt)
         else:
             ta2_tofile.update(statust=OK,**ta_info)
+        finally:
+            botslib.end_unitofwork()
 
 
 def envelope(ta_info,ta_list):
@@ -146,6 +146,16 @@ def envelope(ta_info,ta_list):
     env = classtocall(ta_info,ta_list,userscript,scriptname,envelope_content,syntax)
     env.run()
 
+def concatenable_charset(charset):
+    ''' check if files in charset can be concatenated as bytes: encoding of a text is the same as encoding its parts.
+        Not for charsets with a BOM (utf-16, utf-8-sig) or other state.
+    '''
+    try:
+        encode = codecs.lookup(charset).encode
+        return encode('aa')[0] == encode('a')[0] * 2
+    except Exception:
+        return False
+
 class Envelope(object):
     ''' Base Class for enveloping; use subclasses.
     '''
@@ -167,6 +177,15 @@ class Envelope(object):
         self.out.messagegrammarread(typeofgrammarfile='envelope')
 
     def writefilelist(self,tofile):
+        ''' write the files (messages) to tofile.
+            If the files can be concatenated as bytes (see concatenable_charset), the bytes are copied without decoding/encoding.
+        '''
+        if hasattr(tofile,'stream') and concatenable_charset(self.ta_info['charset']):
+            outstream = tofile.stream   #binary file under the codecs writer of opendata
+            for filename in self.ta_list:
+                with botslib.opendata_bin(filename,'rb') as fromfile:
+                    shutil.copyfileobj(fromfile,outstream,1048576)
+            return
         for filename in self.ta_list:
             fromfile = botslib.opendata(filename, 'rb',self.ta_info['charset'])
             shutil.copyfileobj(fromfile,tofile,1048576)
@@ -1,12 +1,66 @@
 from __future__ import print_function
 import sys
+import os
+import copy
+import collections
+import importlib
 #bots-modules
 from . import botslib
+from . import botsglobal
 from .botsconfig import *
 ERROR_IN_GRAMMAR = 'BOTS_error_1$%3@7#!%+_)_+[{]}'  #used in this module to indicate part of grammar is already read and/or has errors
                                                     #no record should be called like this ;-))
 
+#grammars are read and checked once per process, and kept in a LRU cache.
+#key: (editype,grammarname,typeofgrammarfile); value: (grammar, list of (module,mtime of grammar file))
+_grammarcache = collections.OrderedDict()
+_grammarcache_stats = {'hit':0,'miss':0}
+
 def grammarread(editype,grammarname,typeofgrammarfile):
+    ''' reads/imports a grammar; uses cache of grammars that are read before.
+        Each call gets its own copy of the grammar object with its own syntax (eg partner syntax is added to syntax by outmessage).
+        structure and recorddefs are shared (as these are from the imported grammar files anyway).
+        If a grammar file is changed (mtime) the grammar file is re-imported.
+    '''
+    cachesize = botsglobal.ini.getint('settings','grammar_cache_size',100)
+    if cachesize <= 0:
+        return _grammarread(editype,grammarname,typeofgrammarfile)
+    key = (editype,grammarname,typeofgrammarfile)
+    if key in _grammarcache:
+        cachedgrammar,modules = _grammarcache[key]
+        changedmodules = [module for module,mtime in modules if _getmtime(module) != mtime]
+        if not changedmodules:
+            _grammarcache_stats['hit'] += 1
+            _grammarcache[key] = _grammarcache.pop(key)     #move to end: most recently used
+            return _copygrammar(cachedgrammar)
+        #grammar file(s) are changed: re-import. Cached grammars using these files are not valid anymore.
+        for module in changedmodules:
+            importlib.reload(module)
+        for otherkey in [otherkey for otherkey,(othergrammar,othermodules) in _grammarcache.items() if any(module in changedmodules for module,mtime in othermodules)]:
+            del _grammarcache[otherkey]
+    _grammarcache_stats['miss'] += 1
+    messagegrammar = _grammarread(editype,grammarname,typeofgrammarfile)
+    _grammarcache[key] = (_copygrammar(messagegrammar),[(module,_getmtime(module)) for module in messagegrammar.modules])
+    while len(_grammarcache) > cachesize:
+        _grammarcache.popitem(last=False)   #remove least recently used
+    return messagegrammar
+
+def _copygrammar(messagegrammar):
+    newgrammar = copy.copy(messagegrammar)
+    newgrammar.syntax = messagegrammar.syntax.copy()
+    return newgrammar
+
+def _getmtime(module):
+    try:
+        return os.path.getmtime(module.__file__)
+    except (AttributeError,TypeError,OSError):
+        return None
+
+def log_cache_statistics():
+    ''' log the use of the grammar cache (at end of run).'''
+    botsglobal.logger.info('Grammar cache: %(hit)s hits, %(miss)s misses.',_grammarcache_stats)
+
+def _grammarread(editype,grammarname,typeofgrammarfile):
     ''' reads/imports a grammar (dispatch function for class Grammar and subclasses).
         typeofgrammarfile indicates some differences in reading/syntax handling:
         - envelope: read whole grammar, get right syntax
@@ -22,6 +76,7 @@ def grammarread(editype,grammarname,typeofgrammarfile):
     if typeofgrammarfile == 'grammars':
         #read grammar for a certain editype/messagetype
         messagegrammar = classtocall(typeofgrammarfile='grammars',editype=editype,grammarname=grammarname)
+        messagegrammar.modules = [messagegrammar.module]    #grammar files used; for cache
         #Get right syntax: 1. start with classtocall.defaultsyntax
         messagegrammar.syntax = classtocall.defaultsyntax.copy()
         #Find out what envelope is used:
@@ -30,6 +85,7 @@ def grammarread(editype,grammarname,typeofgrammarfile):
             try:
                 #read envelope grammar
                 envelopegrammar = classtocall(typeofgrammarfile='grammars',editype=editype,grammarname=envelope)
+                messagegrammar.modules.append(envelopegrammar.module)
                 #Get right syntax: 2. update with syntax from envelope
                 messagegrammar.syntax.update(envelopegrammar.original_syntaxfromgrammar)
             except botslib.BotsImportError:     #not all envelopes have grammar files; eg csvheader, user defined envelope.
@@ -51,6 +107,7 @@ def grammarread(editype,grammarname,typeofgrammarfile):
             syntax.update(envelopegrammar.original_syntaxfromgrammar)
         except botslib.BotsImportError:
             envelopegrammar = messagegrammar
+        envelopegrammar.modules = [messagegrammar.module,envelopegrammar.module]    #grammar files used; for cache
         #Get right syntax: 3. update with message syntax
         syntax.update(messagegrammar.original_syntaxfromgrammar)
         envelopegrammar.syntax = syntax
@@ -58,6 +115,7 @@ def grammarread(editype,grammarname,typeofgrammarfile):
         return envelopegrammar
     else:   #typeofgrammarfile == 'partners':
         messagegrammar = classtocall(typeofgrammarfile='partners',editype=editype,grammarname=grammarname)
+        messagegrammar.modules = [messagegrammar.module]    #grammar files used; for cache
         messagegrammar.syntax = messagegrammar.original_syntaxfromgrammar.copy()
         return messagegrammar
 
@@ -568,6 +626,7 @@ class fixed(Grammar):
         'checkcharsetout':'strict', #strict, ignore or botsreplace (replace with char as set in bots.ini).
         'checkfixedrecordtoolong':True,
         'checkfixedrecordtooshort':False,
+        'compact_records':False,    #incoming: store records compact; uses less memory for records with many fields, but access is slower.
         'contenttype':'text/plain',
         'decimaal':'.',
         'envelope':'',
@@ -634,6 +693,7 @@ class idoc(fixed):
         'checkcharsetout':'strict', #strict, ignore or botsreplace (replace with char as set in bots.ini).
         'checkfixedrecordtoolong':False,
         'checkfixedrecordtooshort':False,
+        'compact_records':False,    #incoming: store records compact; uses less memory for records with many fields, but access is slower.
         'contenttype':'text/plain',
         'decimaal':'.',
         'envelope':'',
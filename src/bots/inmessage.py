@@ -1,7 +1,13 @@
 from __future__ import print_function
 import sys
+import os
+import re
 import time
+import datetime
 import codecs
+import io
+import zipfile
+import operator
 try:
     from xml.etree import cElementTree as ET
 except ImportError:
@@ -17,6 +23,59 @@ from . import grammar
 from .botsconfig import *
 ''' Reading/lexing/parsing/splitting an edifile.'''
 
+PLAINNUMBER = re.compile(r'([+-]?)0*([0-9]+)(?:\.([0-9]+))?\Z')   #sign, integer part without leading zeros, decimals
+PLAININTEGER = re.compile(r'([+-]?)0*([0-9]+)\Z')
+
+def _validdate(value):
+    ''' check date YYMMDD or CCYYMMDD. Gives same result as time.strptime, but fast for values with digits only.'''
+    lenght = len(value)
+    if lenght == 6:
+        strformat = '%y%m%d'
+    elif lenght == 8:
+        strformat = '%Y%m%d'
+    else:
+        return False
+    if value.isascii() and value.isdigit():
+        if lenght == 6:
+            year = int(value[:2])
+            year += 2000 if year < 69 else 1900     #as time.strptime does for %y
+        else:
+            year = int(value[:4])
+        try:
+            datetime.date(year,int(value[-4:-2]),int(value[-2:]))
+        except ValueError:
+            return False
+        return True
+    try:
+        time.strptime(value,strformat)
+    except ValueError:
+        return False
+    return True
+
+def _validtime(value):
+    ''' check time HHMM, HHMMSS, HHMMSSD or HHMMSSDD. Gives same result as time.strptime, but fast for values with digits only.'''
+    lenght = len(value)
+    if value[:6].isascii() and value[:6].isdigit():
+        if lenght == 4:
+            return int(value[:2]) <= 23 and int(value[2:4]) <= 59
+        elif lenght == 6 or lenght == 7 or lenght == 8:
+            return int(value[:2]) <= 23 and int(value[2:4]) <= 59 and int(value[4:6]) <= 61 and (lenght == 6 or value[6:].isdigit())
+        return False
+    try:
+        if lenght == 4:
+            time.strptime(value,'%H%M')
+        elif lenght == 6:
+            time.strptime(value,'%H%M%S')
+        elif lenght == 7 or lenght == 8:
+            time.strptime(value[0:6],'%H%M%S')
+            if not value[6:].isdigit():
+                return False
+        else:
+            return False
+    except ValueError:
+        return False
+    return True
+
 def parse_edi_file(**ta_info):
     ''' Read,lex, parse edi-file. Is a dispatch function for Inmessage and subclasses.
         Error handling: there are different types of errors.
@@ -34,6 +93,8 @@ def parse_edi_file(**ta_info):
     #get information from error/exception; format this into ediobject.errorfatal
     try:
         ediobject.initfromfile()
+    except botslib.FileTooLargeError:   #file is not parsed at all
+        raise
     except UnicodeError as msg:
         #~ raise botslib.MessageError('')      #UNITTEST_CORRECTION
         content = botslib.get_relevant_text_for_UnicodeError(msg)
@@ -58,6 +119,7 @@ class Inmessage(message.Message):
     def __init__(self,ta_info):
         super(Inmessage,self).__init__(ta_info)
         self.lex_records = []       #init list of lex_records
+        self.streaming = False      #if True: messages are parsed one by one in nextmessage (only for big edifact, x12, tradacoms, xml, json files)
         # ~self.countpos = 0           #count chars in edi file. used in _lex, plus for EDIFACT set in _sniff (as UNA is not lexed)
 
     def messagegrammarread(self,typeofgrammarfile):
@@ -66,6 +128,14 @@ class Inmessage(message.Message):
         self.defmessage = grammar.grammarread(self.ta_info['editype'],self.ta_info['messagetype'],typeofgrammarfile)
         botslib.updateunlessset(self.ta_info,self.defmessage.syntax)
 
+    def _checkfilesize(self):
+        ''' file is read as a whole. If transform did not check maxfilesizeincoming (big file that might be streamed): check it now.'''
+        if self.ta_info.get('streaming') and not self.streaming:
+            filesize = os.path.getsize(botslib.abspathdata(self.ta_info['filename']))
+            maxfilesizeincoming = botsglobal.ini.getint('settings','maxfilesizeincoming',5000000)
+            if filesize > maxfilesizeincoming:
+                raise botslib.FileTooLargeError('File size of %(filesize)s is too big; option "maxfilesizeincoming" in bots.ini is %(maxfilesizeincoming)s.',
+                                                {'filesize':filesize,'maxfilesizeincoming':maxfilesizeincoming})
 
     def initfromfile(self):
         ''' Initialisation from a edi file.
@@ -74,26 +144,48 @@ class Inmessage(message.Message):
         #frompartner,topartner,filename,messagetype,testindicator,editype,charset,alt,fromchannel,frommail,tomail,idroute,command
         #inn.ta_info is initialised. defaults in grammar.py -> envelope -> messagetype
         self.messagegrammarread(typeofgrammarfile='grammars')
+        #lexing and parsing are done in nextmessage, message by message. Nodes of a message are released after the message is handled.
+        self.streaming = bool(self.ta_info.get('streaming') and isinstance(self,var) and self.defmessage.nextmessage is not None
+                                and not callable(self.ta_info.get('preprocess_lex')) and not callable(self.ta_info.get('preprocess_nodes')))
+        self._checkfilesize()
         #**from here: charset errors, lex errors
         self._readcontent_edifile()     #open file. variants: read with charset, read as binary & handled in sniff, only opened and read in _lex.
         self._sniff()           #some hard-coded examination of edi file; ta_info can be overruled by syntax-parameters in edi-file
-        #start lexing
-        self._lex()
-        #lex preprocessing via user exit indicated in syntax
-        preprocess_lex = self.ta_info.get('preprocess_lex',False)
-        if callable(preprocess_lex):
-            preprocess_lex(lex=self.lex_records,ta_info=self.ta_info)
-        if hasattr(self,'rawinput'):
-            del self.rawinput
+        if self.streaming:
+            #edi file is read again in blocks: once for counting the messages, once for lexing.
+            self.ta_info['total_number_of_messages'] = self._countmessages()
+            del self.lex_records
+            self.iternext_lex_record = self._iterlex()
+        else:
+            #start lexing
+            self._lex()
+            #lex preprocessing via user exit indicated in syntax
+            preprocess_lex = self.ta_info.get('preprocess_lex',False)
+            if callable(preprocess_lex):
+                preprocess_lex(lex=self.lex_records,ta_info=self.ta_info)
+            if hasattr(self,'rawinput'):
+                del self.rawinput
         self.set_syntax_used()
         #**from here: breaking parser errors
         self.root = node.Node()  #make root Node None.
+        self._envelopes = []     #while parsing: stack of (node,record_definition) of the records above the record being parsed
+        if self.streaming:
+            return
         self.iternext_lex_record = iter(self.lex_records)
-        leftover = self._parse(structure_level=self.defmessage.structure,inode=self.root)
+        for messagenode in self._parsemessages():   #not streaming: nothing is yielded
+            pass
+
+    def _parsemessages(self):
+        ''' generator; parse whole edi file. When streaming: yields each message (node) when it is parsed and checked.
+        '''
+        leftover = yield from self._parse(structure_level=self.defmessage.structure,inode=self.root)
         if leftover:
             raise botslib.InMessageError('[A50] line %(line)s pos %(pos)s: Found non-valid data at end of edi file; probably a problem with separators or message structure.',
                                             {'line':leftover[0][LIN], 'pos':leftover[0][POS]})  #probably not reached with edifact/x12 because of mailbag processing.
-        del self.lex_records
+        if self.streaming:
+            del self.rawinput
+        else:
+            del self.lex_records
         #self.root is now root of a tree (of nodes).
 
         #**from here: non-breaking parser errors
@@ -108,6 +200,12 @@ class Inmessage(message.Message):
                 self.ta_info.update(childnode.queries)
                 break
 
+    def _checkmessageenvelope(self,messagenode,inode):
+        ''' when streaming: check envelope of one message (eg UNH-UNT) before nodes of message are released.
+            method is specified in subclasses.
+        '''
+        pass
+
     def set_syntax_used(self):
         ''' write syntax dict in self/inmessage-object
         '''
@@ -123,97 +221,139 @@ class Inmessage(message.Message):
             Input: value (string), field definition.
             Output: the formatted value (string)
             Parameters of self.ta_info are used: triad, decimaal
-            for fixed field: same handling; length is not checked.
+            Uses the formatter made for field_definition (see _makefieldformatter).
+        '''
+        return self._fieldformatter(field_definition)(value,structure_record,node_instance)
+
+    def _fielderror(self,errortext,value,field_definition,structure_record,node_instance):
+        ''' add error for field to errorlist. In errortext can be used: linpos, record, field, content, max, min.'''
+        self.add2errorlist(errortext%{'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],
+                                        'content':value,'max':field_definition[LENGTH],'min':field_definition[MINLENGTH]})
+
+    def _makefieldformatter(self,field_definition):
+        ''' make formatter for field_definition: dispatch on format, lengths etc is done once, not for each value.
+            there are fast paths for usual values (dates and times with only digits, numbers without exponent etc).
         '''
         if field_definition[BFORMAT] == 'A':
-            if len(value) > field_definition[LENGTH]:
-                self.add2errorlist('[F05]%(linpos)s: Record "%(record)s" field "%(field)s" too big (max %(max)s): "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value,'max':field_definition[LENGTH]})
-            if len(value) < field_definition[MINLENGTH]:
-                self.add2errorlist('[F06]%(linpos)s: Record "%(record)s" field "%(field)s" too small (min %(min)s): "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value,'min':field_definition[MINLENGTH]})
-        elif field_definition[BFORMAT] in 'DT':
-            lenght = len(value)
-            if field_definition[BFORMAT] == 'D':
-                try:
-                    if lenght == 6:
-                        time.strptime(value,'%y%m%d')
-                    elif lenght == 8:
-                        time.strptime(value,'%Y%m%d')
-                    else:
-                        raise ValueError('To be catched')
-                except ValueError:
-                    self.add2errorlist('[F07]%(linpos)s: Record "%(record)s" date field "%(field)s" not a valid date: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            else:   #field_definition[BFORMAT] == 'T':
-                try:
-                    if lenght == 4:
-                        time.strptime(value,'%H%M')
-                    elif lenght == 6:
-                        time.strptime(value,'%H%M%S')
-                    elif lenght == 7 or lenght == 8:
-                        time.strptime(value[0:6],'%H%M%S')
-                        if not value[6:].isdigit():
-                            raise ValueError('To be catched')
-                    else:
-                        raise ValueError('To be catched')
-                except ValueError:
-                    self.add2errorlist('[F08]%(linpos)s: Record "%(record)s" time field "%(field)s" not a valid time: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-        else:   #elif field_definition[BFORMAT] in 'RNI':   #numerics (R, N, I)
-            if self.ta_info['lengthnumericbare']:
-                chars_not_counted = '-+' + self.ta_info['decimaal']
+            return self._makeformatter_alfanumeric(field_definition)
+        elif field_definition[BFORMAT] == 'D':
+            return self._makeformatter_date(field_definition)
+        elif field_definition[BFORMAT] == 'T':
+            return self._makeformatter_time(field_definition)
+        else:   #numerics (R, N, I)
+            return self._makeformatter_numeric(field_definition)
+
+    def _makeformatter_alfanumeric(self,field_definition):
+        maxlength = field_definition[LENGTH]
+        minlength = field_definition[MINLENGTH]
+        fielderror = self._fielderror
+        def formatter(value,structure_record,node_instance):
+            if len(value) > maxlength:
+                fielderror('[F05]%(linpos)s: Record "%(record)s" field "%(field)s" too big (max %(max)s): "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            if len(value) < minlength:
+                fielderror('[F06]%(linpos)s: Record "%(record)s" field "%(field)s" too small (min %(min)s): "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            return value
+        return formatter
+
+    def _makeformatter_date(self,field_definition):
+        fielderror = self._fielderror
+        def formatter(value,structure_record,node_instance):
+            if not _validdate(value):
+                fielderror('[F07]%(linpos)s: Record "%(record)s" date field "%(field)s" not a valid date: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            return value
+        return formatter
+
+    def _makeformatter_time(self,field_definition):
+        fielderror = self._fielderror
+        def formatter(value,structure_record,node_instance):
+            if not _validtime(value):
+                fielderror('[F08]%(linpos)s: Record "%(record)s" time field "%(field)s" not a valid time: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            return value
+        return formatter
+
+    def _makeformatter_numeric(self,field_definition):
+        maxlength = field_definition[LENGTH]
+        minlength = field_definition[MINLENGTH]
+        ta_info = self.ta_info
+        fielderror = self._fielderror
+        converter = self._makenumberconverter(field_definition)
+        def formatter(value,structure_record,node_instance):
+            if ta_info['lengthnumericbare']:
+                chars_not_counted = '-+' + ta_info['decimaal']
                 length = 0
                 for c in value:
                     if c not in chars_not_counted:
                         length += 1
             else:
                 length = len(value)
-            if length > field_definition[LENGTH]:
-                self.add2errorlist('[F10]%(linpos)s: Record "%(record)s" field "%(field)s" too big (max %(max)s): "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value,'max':field_definition[LENGTH]})
-            if length < field_definition[MINLENGTH]:
-                self.add2errorlist('[F11]%(linpos)s: Record "%(record)s" field "%(field)s" too small (min %(min)s): "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value,'min':field_definition[MINLENGTH]})
+            if length > maxlength:
+                fielderror('[F10]%(linpos)s: Record "%(record)s" field "%(field)s" too big (max %(max)s): "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            if length < minlength:
+                fielderror('[F11]%(linpos)s: Record "%(record)s" field "%(field)s" too small (min %(min)s): "%(content)s".\n',value,field_definition,structure_record,node_instance)
             if value[-1] == '-':    #if minus-sign at the end, put it in front.
                 value = value[-1] + value[:-1]
-            value = value.replace(self.ta_info['triad'],'')     #strip triad-separators
-            value = value.replace(self.ta_info['decimaal'],'.',1) #replace decimal sign by canonical decimal sign
+            value = value.replace(ta_info['triad'],'')     #strip triad-separators
+            value = value.replace(ta_info['decimaal'],'.',1) #replace decimal sign by canonical decimal sign
             if 'E' in value or 'e' in value:
-                self.add2errorlist('[F09]%(linpos)s: Record "%(record)s" field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            elif field_definition[BFORMAT] == 'R':
+                fielderror('[F09]%(linpos)s: Record "%(record)s" field "%(field)s" has non-numerical content: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                return value
+            return converter(value,structure_record,node_instance)
+        return formatter
+
+    def _makenumberconverter(self,field_definition):
+        ''' make converter for numeric value (R, N, I) with canonical decimal sign, without triad, sign in front.
+            plain numbers (digits, optional sign and decimals) are converted exactly with string operations;
+            other values (eg ".5", with spaces) are converted via float as before.
+        '''
+        decimals = field_definition[DECIMALS]
+        fielderror = self._fielderror
+        if field_definition[BFORMAT] == 'R':
+            def converter(value,structure_record,node_instance):
+                plain = PLAINNUMBER.match(value)
+                if plain:
+                    sign,integerpart,decimalpart = plain.groups()
+                    return ('-' if sign == '-' else '') + integerpart + ('.' + decimalpart if decimalpart else '')
                 lendecimal = len(value.partition('.')[2])
                 try:    #convert to float in order to check validity
-                    valuedecimal = float(value)
-                    value = '%.*F'%(lendecimal,valuedecimal)
+                    return '%.*F'%(lendecimal,float(value))
                 except:
-                    self.add2errorlist('[F16]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            elif field_definition[BFORMAT] == 'N':
+                    fielderror('[F16]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                    return value
+        elif field_definition[BFORMAT] == 'N':
+            def converter(value,structure_record,node_instance):
                 lendecimal = len(value.partition('.')[2])
-                if lendecimal != field_definition[DECIMALS]:
-                    self.add2errorlist('[F14]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has invalid nr of decimals: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
+                if lendecimal != decimals:
+                    fielderror('[F14]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has invalid nr of decimals: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                plain = PLAINNUMBER.match(value)
+                if plain:
+                    sign,integerpart,decimalpart = plain.groups()
+                    return ('-' if sign == '-' else '') + integerpart + ('.' + decimalpart if decimalpart else '')
                 try:    #convert to float in order to check validity
-                    valuedecimal = float(value)
-                    value = '%.*F'%(lendecimal,valuedecimal)
+                    return '%.*F'%(lendecimal,float(value))
                 except:
-                    self.add2errorlist('[F15]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            elif field_definition[BFORMAT] == 'I':
+                    fielderror('[F15]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                    return value
+        else:   #field_definition[BFORMAT] == 'I':
+            def converter(value,structure_record,node_instance):
                 if '.' in value:
-                    self.add2errorlist('[F12]%(linpos)s: Record "%(record)s" field "%(field)s" has format "I" but contains decimal sign: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-                else:
-                    try:    #convert to float in order to check validity
-                        valuedecimal = float(value)
-                        valuedecimal = valuedecimal / 10**field_definition[DECIMALS]
-                        value = '%.*F'%(field_definition[DECIMALS],valuedecimal)
-                    except:
-                        self.add2errorlist('[F13]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                            {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-        return value
+                    fielderror('[F12]%(linpos)s: Record "%(record)s" field "%(field)s" has format "I" but contains decimal sign: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                    return value
+                plain = PLAININTEGER.match(value)
+                if plain:   #put decimal sign in string of digits
+                    sign,digits = plain.groups()
+                    sign = '-' if sign == '-' else ''
+                    if not decimals:
+                        return sign + digits
+                    digits = digits.zfill(decimals + 1)
+                    return sign + digits[:-decimals] + '.' + digits[-decimals:]
+                try:    #convert to float in order to check validity
+                    valuedecimal = float(value)
+                    valuedecimal = valuedecimal / 10**decimals
+                    return '%.*F'%(decimals,valuedecimal)
+                except:
+                    fielderror('[F13]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+                    return value
+        return converter
 
     def _parse(self,structure_level,inode):
         ''' This is the heart of the parsing of incoming messages (but not for xml, json)
@@ -226,6 +366,7 @@ class Inmessage(message.Message):
             - structure_level: current grammar/segmentgroup of the grammar-structure.
             - inode: parent node; all parsed records are added as children of inode
             2x recursive: SUBTRANSLATION and segmentgroups
+            Is a generator: when streaming, each message is yielded after parsing. Returns the lex_record that is not parsed in this level.
         '''
         structure_index = 0     #keep track of where we are in the structure_level
         countnrofoccurences = 0 #number of occurences of current record in structure
@@ -291,17 +432,23 @@ class Inmessage(message.Message):
                 self.messagecount += 1
                 self.messagetypetxt = 'Message nr %(count)s, type %(type)s, '%{'count':self.messagecount,'type':messagetype}
                 #go recursive; parse using subtranslation grammar and newnode as root of this message
-                current_lex_record = self._parse(structure_level=defmessage.structure[0][LEVEL],inode=newnode)
+                current_lex_record = yield from self._parse(structure_level=defmessage.structure[0][LEVEL],inode=newnode)
                 newnode.queries = {'messagetype':messagetype}       #copy messagetype into 1st segment of subtranslation (eg UNH, ST)
                 newnode.queries.update(defmessage.syntax)
                 #~ newnode.queries = defmessage.syntax.copy()       #if using this line instead of previous 2: gives errors eg in incoming edifact...do not understand why
                 self.checkmessage(newnode,defmessage,subtranslation=True)      #check the results of the subtranslation
+                if self.streaming:
+                    self._checkmessageenvelope(newnode,inode)
+                    yield newnode       #message is handled (mapped) in nextmessage
+                    newnode.release()   #only record and messagetype are kept, for checking envelope and confirmations.
                 #~ end SUBTRANSLATION
                 self.messagetypetxt = ''
                 # get_next_lex_record is still False; we are trying to match the last (not matched) record from the SUBTRANSLATION (named 'current_lex_record').
             else:
                 if LEVEL in structure_level[structure_index]:        #if header, go parse segmentgroup (recursive)
-                    current_lex_record = self._parse(structure_level=structure_level[structure_index][LEVEL],inode=newnode)
+                    self._envelopes.append((newnode,structure_level[structure_index]))
+                    current_lex_record = yield from self._parse(structure_level=structure_level[structure_index][LEVEL],inode=newnode)
+                    self._envelopes.pop()
                     # get_next_lex_record is still False; the current_lex_record that was not matched in lower segmentgroups is still being parsed.
                 else:
                     get_next_lex_record = True
@@ -337,6 +484,10 @@ class Inmessage(message.Message):
     def nextmessage(self):
         ''' Passes each 'message' to the mapping script.
         '''
+        if self.streaming:
+            for message in self._nextmessage_streaming():
+                yield message
+            return
         #node preprocessing via user exit indicated in syntax, eg sorting
         preprocess_nodes = self.ta_info.get('preprocess_nodes',False)
         if callable(preprocess_nodes):
@@ -435,6 +586,55 @@ class Inmessage(message.Message):
                     yield self._initmessagefromnode(child,ta_info,self.syntax)
 
 
+    def _nextmessage_streaming(self):
+        ''' Passes each 'message' to the mapping script while parsing the edi file.
+            Messages are passed in order of edi file (also when using nextmessage2).
+            Errors in edi file are raised (file is in error); messages already handled are discarded by transform.
+        '''
+        parser = self._parsemessages()
+        count = 0
+        while True:
+            try:
+                messagenode = next(parser)
+            except StopIteration:
+                break
+            except:
+                self.errorfatal = True      #no decent node tree; parsing stopped
+                raise
+            self.checkforerrorlist()
+            envelope_content = [envelopenode.record for envelopenode,record_definition in self._envelopes]
+            if self.defmessage.nextmessage is not None and not any(self._mpathmatches(envelope_content + [messagenode.record],mpaths)
+                        for mpaths in (self.defmessage.nextmessage,self.defmessage.nextmessage2) if mpaths is not None):
+                continue    #not a message according to nextmessage (json without nextmessage: each node is a message)
+            #copy queries 'down the tree' (as processqueries does)
+            queries = {}
+            for envelopenode,record_definition in self._envelopes:
+                if QUERIES in record_definition:
+                    envelopenode.get_queries_from_edi(record_definition)
+                envelopenode.queries = queries
+                queries = envelopenode.queries
+            messagenode.queries = queries
+            count += 1
+            ta_info = self.ta_info.copy()
+            ta_info.update(messagenode.queries)
+            ta_info['message_number'] = count
+            ta_info['bots_accessenvelope'] = self.root   #give mappingscript access to envelope
+            yield self._initmessagefromnode(messagenode,ta_info,self.syntax,envelope_content)
+        self.checkforerrorlist()
+
+    @staticmethod
+    def _mpathmatches(records,mpaths):
+        ''' check if records (from envelope to message) are as in mpaths (nextmessage in grammar).'''
+        if len(records) != len(mpaths):
+            return False
+        for record,part in zip(records,mpaths):
+            for key,value in part.items():
+                if key == 'BOTSIDnr':
+                    continue
+                if key not in record or value != record[key]:
+                    return False
+        return True
+
     def _canonicaltree(self,node_instance,structure):
         ''' call the _canonicaltree for Message (check min/max, sort)
             do the QUERIES in the grammar structure.
@@ -460,12 +660,14 @@ class fixed(Inmessage):
     ''' class for record of fixed length.'''
     def _readcontent_edifile(self):
         ''' open the edi file.
+            file is read line by line in _lex; buffered reading (io), lines end with '\n', '\r' or '\r\n'.
         '''
         botsglobal.logger.debug('Read edi file "%(filename)s".',self.ta_info)
-        self.filehandler = botslib.opendata(filename=self.ta_info['filename'],mode='rb',charset=self.ta_info['charset'],errors=self.ta_info['checkcharsetin'])
+        self.filehandler = io.open(botslib.abspathdata(self.ta_info['filename']),'r',encoding=self.ta_info['charset'],errors=self.ta_info['checkcharsetin'],newline='')
 
     def _lex(self):
         ''' edi file->self.lex_records.'''
+        append = self.lex_records.append
         try:
             #there is a problem with the way python reads line by line: file/line offset is not correctly reported.
             #so the error is catched here to give correct/reasonable result.
@@ -474,18 +676,20 @@ class fixed(Inmessage):
                 for linenr,line in enumerate(self.filehandler, start=1):
                     if not line.isspace():
                         line = line.rstrip('\r\n')
-                        self.lex_records.append([{VALUE:botsid,LIN:linenr,POS:0,FIXEDLINE:line},])    #append record to recordlist
+                        append([{VALUE:botsid,LIN:linenr,POS:0,FIXEDLINE:line},])    #append record to recordlist
             else:
                 startrecordid = self.ta_info['startrecordID']
                 endrecordid = self.ta_info['endrecordID']
                 for linenr,line in enumerate(self.filehandler, start=1):
                     if not line.isspace():
                         line = line.rstrip('\r\n')
-                        self.lex_records.append([{VALUE:line[startrecordid:endrecordid].strip(),LIN:linenr,POS:0,FIXEDLINE:line},])    #append record to recordlist
+                        append([{VALUE:line[startrecordid:endrecordid].strip(),LIN:linenr,POS:0,FIXEDLINE:line},])    #append record to recordlist
         except UnicodeError as msg:
             rep_linenr = locals().get('linenr',0) + 1
             content = botslib.get_relevant_text_for_UnicodeError(msg)
             raise botslib.InMessageError('Characterset problem in file. At/after line %(line)s: "%(content)s"',{'line':rep_linenr,'content':content})
+        finally:
+            self.filehandler.close()
 
     def _parsefields(self,lex_record,record_definition):
         ''' Parse fields from one fixed message-record and check length of the fixed record.
@@ -500,95 +704,84 @@ class fixed(Inmessage):
             if record_definition[FIXED_RECORD_LENGTH] < lenfixed and self.ta_info['checkfixedrecordtoolong']:
                 raise botslib.InMessageError('[S53] line %(line)s: Record "%(record)s" too long; is %(pos)s pos, defined is %(defpos)s pos.',
                                                 line=lex_record[ID][LIN],record=lex_record[ID][VALUE],pos=lenfixed,defpos=record_definition[FIXED_RECORD_LENGTH])
-        pos = 0
-        for field_definition in record_definition[FIELDS]:
-            if field_definition[ID] == 'BOTSID' and self.ta_info['noBOTSID']:
+        #positions of fields depend on noBOTSID (BOTSID is in fixed record or not): index and slice plan are made once per record definition and noBOTSID.
+        noBOTSID = bool(self.ta_info['noBOTSID'])
+        if self.ta_info['compact_records']:
+            #fields are not sliced now, but when used (from fixedrecord).
+            fieldindexes = record_definition.setdefault(FIELDINDEX,{})
+            if noBOTSID not in fieldindexes:
+                fieldindexes[noBOTSID] = self._makefieldindex(record_definition)
+            record2build = node.CompactRecord(fieldindexes[noBOTSID],line=fixedrecord)
+            if noBOTSID:
                 record2build['BOTSID'] = lex_record[ID][VALUE]
-                continue
-            value = fixedrecord[pos:pos+field_definition[LENGTH]].strip()   #copy string to avoid memory problem
+            record2build['BOTSIDnr'] = record_definition[BOTSIDNR]
+            return record2build
+        sliceplans = record_definition.setdefault(SLICEPLAN,{})
+        if noBOTSID not in sliceplans:
+            sliceplans[noBOTSID] = self._makesliceplan(record_definition)
+        fieldids,slicer = sliceplans[noBOTSID]
+        if noBOTSID:
+            record2build['BOTSID'] = lex_record[ID][VALUE]
+        for fieldid,value in zip(fieldids,slicer(fixedrecord)):
+            value = value.strip()
             if value:
-                record2build[field_definition[ID]] = value
-            pos += field_definition[LENGTH]
+                record2build[fieldid] = value
         record2build['BOTSIDnr'] = record_definition[BOTSIDNR]
         return record2build
 
-    def _formatfield(self,value,field_definition,structure_record,node_instance):
-        ''' Format of a field is checked and converted if needed.
-            Input: value (string), field definition.
-            Output: the formatted value (string)
-            Parameters of self.ta_info are used: triad, decimaal
-            for fixed field: same handling; length is not checked.
-        '''
-        if field_definition[BFORMAT] == 'A':
-            pass
-        elif field_definition[BFORMAT] in 'DT':
-            lenght = len(value)
-            if field_definition[BFORMAT] == 'D':
-                try:
-                    if lenght == 6:
-                        time.strptime(value,'%y%m%d')
-                    elif lenght == 8:
-                        time.strptime(value,'%Y%m%d')
-                    else:
-                        raise ValueError('To be catched')
-                except ValueError:
-                    self.add2errorlist('[F07]%(linpos)s: Record "%(record)s" date field "%(field)s" not a valid date: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            else:   #if field_definition[BFORMAT] == 'T':
-                try:
-                    if lenght == 4:
-                        time.strptime(value,'%H%M')
-                    elif lenght == 6:
-                        time.strptime(value,'%H%M%S')
-                    elif lenght == 7 or lenght == 8:
-                        time.strptime(value[0:6],'%H%M%S')
-                        if not value[6:].isdigit():
-                            raise ValueError('To be catched')
-                    else:
-                        raise ValueError('To be catched')
-                except ValueError:
-                    self.add2errorlist('[F08]%(linpos)s: Record "%(record)s" time field "%(field)s" not a valid time: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-        else:   #elif field_definition[BFORMAT] in 'RNI':   #numerics (R, N, I)
+    def _makesliceplan(self,record_definition):
+        ''' field ids and slicer of fixed record: slicer(fixedrecord) gives the values of all fields (not stripped) in one call.'''
+        fieldids = []
+        slices = []
+        pos = 0
+        for field_definition in record_definition[FIELDS]:
+            if field_definition[ID] == 'BOTSID' and self.ta_info['noBOTSID']:
+                continue
+            fieldids.append(field_definition[ID])
+            slices.append(slice(pos,pos+field_definition[LENGTH]))
+            pos += field_definition[LENGTH]
+        if len(slices) > 1:
+            slicer = operator.itemgetter(*slices)
+        else:       #itemgetter with one item does not give a tuple
+            slicer = lambda fixedrecord: [fixedrecord[one_slice] for one_slice in slices]
+        return fieldids,slicer
+
+    def _makefieldindex(self,record_definition):
+        ''' for compact records: index of fields, with position of each field in fixed record.'''
+        fieldids = []
+        positions = []
+        pos = 0
+        for field_definition in record_definition[FIELDS]:
+            fieldids.append(field_definition[ID])
+            if field_definition[ID] == 'BOTSID' and self.ta_info['noBOTSID']:
+                positions.append((None,None))
+                continue
+            positions.append((pos,pos+field_definition[LENGTH]))
+            pos += field_definition[LENGTH]
+        fieldids.append('BOTSIDnr')
+        positions.append((None,None))
+        return node.CompactRecord.make_fieldindex(fieldids,positions)
+
+    def _makeformatter_alfanumeric(self,field_definition):
+        ''' for fixed: length is not checked.'''
+        def formatter(value,structure_record,node_instance):
+            return value
+        return formatter
+
+    def _makeformatter_numeric(self,field_definition):
+        ''' for fixed: length is not checked; conversion is done for content with exponent.'''
+        ta_info = self.ta_info
+        fielderror = self._fielderror
+        converter = self._makenumberconverter(field_definition)
+        def formatter(value,structure_record,node_instance):
             if value[-1] == '-':    #if minus-sign at the end, put it in front.
                 value = value[-1] + value[:-1]
-            value = value.replace(self.ta_info['triad'],'')     #strip triad-separators
-            value = value.replace(self.ta_info['decimaal'],'.',1) #replace decimal sign by canonical decimal sign
+            value = value.replace(ta_info['triad'],'')     #strip triad-separators
+            value = value.replace(ta_info['decimaal'],'.',1) #replace decimal sign by canonical decimal sign
             if 'E' in value or 'e' in value:
-                self.add2errorlist('[F09]%(linpos)s: Record "%(record)s" field "%(field)s" contains exponent: "%(content)s".\n'%
-                                    {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            if field_definition[BFORMAT] == 'R':
-                lendecimal = len(value.partition('.')[2])
-                try:    #convert to decimal in order to check validity
-                    valuedecimal = float(value)
-                    value = '%.*F'%(lendecimal,valuedecimal)
-                except:
-                    self.add2errorlist('[F16]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            elif field_definition[BFORMAT] == 'N':
-                lendecimal = len(value.partition('.')[2])
-                if lendecimal != field_definition[DECIMALS]:
-                    self.add2errorlist('[F14]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has invalid nr of decimals: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-                try:    #convert to decimal in order to check validity
-                    valuedecimal = float(value)
-                    value = '%.*F'%(lendecimal,valuedecimal)
-                except:
-                    self.add2errorlist('[F15]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-            elif field_definition[BFORMAT] == 'I':
-                if '.' in value:
-                    self.add2errorlist('[F12]%(linpos)s: Record "%(record)s" field "%(field)s" has format "I" but contains decimal sign: "%(content)s".\n'%
-                                        {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-                else:
-                    try:    #convert to decimal in order to check validity
-                        valuedecimal = float(value)
-                        valuedecimal = valuedecimal / 10**field_definition[DECIMALS]
-                        value = '%.*F'%(field_definition[DECIMALS],valuedecimal)
-                    except:
-                        self.add2errorlist('[F13]%(linpos)s: Record "%(record)s" numeric field "%(field)s" has non-numerical content: "%(content)s".\n'%
-                                            {'linpos':node_instance.linpos(),'record':self.mpathformat(structure_record[MPATH]),'field':field_definition[ID],'content':value})
-        return value
+                fielderror('[F09]%(linpos)s: Record "%(record)s" field "%(field)s" contains exponent: "%(content)s".\n',value,field_definition,structure_record,node_instance)
+            return converter(value,structure_record,node_instance)
+        return formatter
 
 
 class idoc(fixed):
@@ -601,8 +794,212 @@ class idoc(fixed):
 
 class var(Inmessage):
     ''' abstract class for edi-objects with records of variabele length.'''
+    streaming_blocksize = 2**20    #when streaming: edi file is read in blocks of this size
+
+    def _readcontent_edifile(self):
+        ''' when streaming: only the start of the edi file is read (for _sniff); the edi file is read in blocks when lexing.
+        '''
+        if not self.streaming:
+            return super(var,self)._readcontent_edifile()
+        botsglobal.logger.debug('Read start of edi file "%(filename)s".',self.ta_info)
+        blocks = self._iterblocks()
+        self.rawinput = next(blocks,'')
+        blocks.close()
+
+    def _iterblocks(self):
+        ''' generator: when streaming, reads the edi file in blocks (unicode).'''
+        filehandler = botslib.opendata(filename=self.ta_info['filename'],mode='r',charset=self.ta_info['charset'],errors=self.ta_info['checkcharsetin'])
+        try:
+            while True:
+                block = filehandler.read(self.streaming_blocksize)
+                if not block:
+                    return
+                yield block
+        finally:
+            filehandler.close()
+
+    def _iterwindows(self,record_end_chars):
+        ''' generator: yields the edi file in parts (windows) that end with a record separator; each record is in one window.
+            Not streaming: the edi file (as read in memory) is one window.
+            A record separator after an escape character is never used as end of a window.
+        '''
+        if not self.streaming:
+            yield self.rawinput
+            return
+        if not record_end_chars or self.ta_info['quote_char']:      #records can not be found without lexing: one window
+            yield ''.join(self._iterblocks())
+            return
+        escape = self.ta_info['escape']
+        skip_char = self.ta_info['skip_char']
+        leftover = ''
+        for block in self._iterblocks():
+            window = leftover + block
+            end = len(window)
+            while True:
+                end = max(window.rfind(char,0,end) for char in record_end_chars)
+                if end < 0 or not escape:
+                    break
+                before = end - 1
+                while before >= 0 and window[before] in skip_char:
+                    before -= 1
+                if before < 0 or window[before] != escape:
+                    break
+            if end < 0:
+                leftover = window
+                continue
+            leftover = window[end+1:]
+            yield window[:end+1]
+        if leftover:
+            yield leftover
+
+    def _kind_of_separators(self):
+        ''' separators, with same precedence as in _lex_charbychar. value is sfield of next token; None for record separator.'''
+        kind_of_sep = {}
+        for seps,kind in ((self.ta_info['reserve'],2),(self.ta_info['record_sep'],None),(self.ta_info['sfield_sep'],1),
+                            (self.ta_info['field_sep'] + self.ta_info['record_tag_sep'],0)):
+            for char in seps:
+                kind_of_sep[char] = kind
+        for char in self.ta_info['skip_char']:              #skip_char has precedence over separators
+            kind_of_sep.pop(char,None)
+        return kind_of_sep
+
     def _lex(self):
-        ''' lexes file with variable records to list of lex_records, fields and subfields (build self.lex_records).'''
+        ''' lexes file with variable records to list of lex_records, fields and subfields (build self.lex_records).
+        '''
+        self.lex_records.extend(self._iterlex())
+
+    def _iterlex(self):
+        ''' generator: lexes file with variable records; yields the lex_records one by one.
+            For speed a record is lexed as a whole: split on separators using regular expressions.
+            Records with escape or quote characters (and records with syntax errors) are lexed char by char (_lex_charbychar).
+            When streaming the edi file is lexed per window (_iterwindows); self.rawinput is the current window.
+        '''
+        field_sep   = self.ta_info['field_sep'] + self.ta_info['record_tag_sep']    #for tradacoms; field_sep and record_tag_sep have same function.
+        escape      = self.ta_info['escape']
+        quote_char  = self.ta_info['quote_char']
+        skip_char   = self.ta_info['skip_char']
+        skip_table  = dict.fromkeys(map(ord,skip_char))     #to delete skip_char from tokens
+        strict_syntax_check = self.ta_info.get('strict_syntax_check',False)
+        is_csv = isinstance(self,csv)
+        kind_of_sep = self._kind_of_separators()
+        record_end_chars = ''.join(char for char,kind in kind_of_sep.items() if kind is None)
+        field_end_chars = ''.join(char for char,kind in kind_of_sep.items() if kind is not None)
+        if not record_end_chars:
+            for rawinput in self._iterwindows(record_end_chars):
+                self.rawinput = rawinput
+                index,countline,countpos = 0,1,0
+                while index < len(rawinput):
+                    index,countline,countpos,lex_record = self._lex_charbychar(index,countline,countpos)
+                    if lex_record is not None:
+                        yield lex_record
+            return
+        record_end = re.compile('[%s]'%re.escape(record_end_chars))
+        #between records: skip_char and whitespace are skipped (except tab in tab-delimited csv).
+        between_records = []
+        if skip_char:
+            between_records.append('[%s]'%re.escape(skip_char))
+        if not strict_syntax_check:
+            significant_whitespace = ''.join(char for char in field_sep if char.isspace()) if is_csv else ''
+            between_records.append(r'[^\S%s]'%re.escape(significant_whitespace) if significant_whitespace else r'\s')
+        between_records = re.compile('(?:%s)*'%'|'.join(between_records)) if between_records else None
+
+        #keep track of line and position: countline is line number at index counted_up_to; linestart is index of last newline before that.
+        linecounter = [1,-1,0]      #countline, linestart, counted_up_to
+        def count_lines(index):
+            ''' count newlines up to (not including) index.'''
+            if index > linecounter[2]:
+                newlines = rawinput.count('\n',linecounter[2],index)
+                if newlines:
+                    linecounter[0] += newlines
+                    linecounter[1] = rawinput.rfind('\n',linecounter[2],index)
+                linecounter[2] = index
+        def linepos(index):
+            ''' line and position of char at index (as counted in _lex_charbychar)'''
+            count_lines(index+1)
+            return linecounter[0],index-linecounter[1]
+
+        fallback = re.compile('[%s]'%re.escape(escape+quote_char)) if escape or quote_char else None    #records with these chars are lexed char by char
+        not_plain = re.compile('[%s]'%re.escape('\n'+skip_char))      #plain record: one line, no skip_char
+        field_split = re.compile('([%s])'%re.escape(field_end_chars)) if field_end_chars else None
+        for rawinput in self._iterwindows(record_end_chars):
+            self.rawinput = rawinput    #used in _lex_charbychar
+            length = len(rawinput)
+            index = 0
+            while index < length:
+                if between_records:
+                    index = between_records.match(rawinput,index).end()
+                    if index >= length:
+                        break
+                match = record_end.search(rawinput,index)
+                if (match is None           #last record is not closed properly
+                        or (fallback and fallback.search(rawinput,index,match.start()))
+                        or (strict_syntax_check and rawinput[index].isspace() and not (is_csv and rawinput[index] in field_sep))
+                        or (strict_syntax_check and (field_split is None or field_split.search(rawinput,index,match.start()) is None))):
+                    #lex char by char; this also gives the same errors.
+                    count_lines(index)
+                    index,countline,countpos,lex_record = self._lex_charbychar(index,linecounter[0],index-1-linecounter[1])
+                    linecounter[:] = [countline,index-1-countpos,index]
+                    if lex_record is not None:
+                        yield lex_record
+                    continue
+                record_end_index = match.start()
+                lex_record = []
+                if not not_plain.search(rawinput,index,record_end_index):
+                    #plain record: split record; position of token is position of first char, for empty token position of separator.
+                    countline,position = linepos(index)
+                    sfield = 0
+                    tokens = iter(field_split.split(rawinput[index:record_end_index]) if field_split else [rawinput[index:record_end_index]])
+                    for value in tokens:
+                        lex_record.append({VALUE:value,SFIELD:sfield,LIN:countline,POS:position})
+                        position += len(value) + 1
+                        sep = next(tokens,None)
+                        if sep is not None:
+                            sfield = kind_of_sep[sep]
+                    if rawinput[record_end_index] == '\n' and not lex_record[-1][VALUE]:    #empty token at newline as record separator: newline has position 0
+                        lex_record[-1][LIN],lex_record[-1][POS] = linepos(record_end_index)
+                else:
+                    #record with newlines and/or skip_char
+                    sfield = 0
+                    token_start = index
+                    sep_indexes = [sep_match.start() for sep_match in field_split.finditer(rawinput,index,record_end_index)] if field_split else []
+                    sep_indexes.append(record_end_index)
+                    for sep_index in sep_indexes:
+                        value = rawinput[token_start:sep_index]
+                        if skip_char and value:
+                            stripped = value.lstrip(skip_char)
+                            token_start = sep_index - len(stripped)     #first char that is not skipped
+                            value = stripped.translate(skip_table)
+                        if not value:
+                            token_start = sep_index     #empty token: position of separator
+                        valueline,valuepos = linepos(token_start)
+                        lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})
+                        if sep_index < record_end_index:
+                            sfield = kind_of_sep[rawinput[sep_index]]
+                        token_start = sep_index + 1
+                yield lex_record
+                index = record_end_index + 1
+            #next window: line and position are counted on from end of this window.
+            count_lines(length)
+            linecounter[:] = [linecounter[0],linecounter[1]-length,0]
+
+    def _countmessages(self):
+        ''' when streaming: count the messages in edi file before lexing, by searching for the first record of the messages.
+            (an escaped record separator followed by eg 'UNH+' is counted as well.)
+        '''
+        first_records = set(mpaths[-1]['BOTSID'] for mpaths in (self.defmessage.nextmessage,self.defmessage.nextmessage2) if mpaths is not None)
+        first_record = re.compile(r'(?:^|[%s])[\s%s]*(?:%s)[%s]'%(re.escape(self.ta_info['record_sep']),
+                                                                    re.escape(self.ta_info['skip_char']),
+                                                                    '|'.join(re.escape(tag) for tag in first_records),
+                                                                    re.escape(self.ta_info['field_sep'] + self.ta_info['record_tag_sep'])))
+        record_end_chars = ''.join(char for char,kind in self._kind_of_separators().items() if kind is None)
+        return sum(len(first_record.findall(window)) for window in self._iterwindows(record_end_chars))
+
+    def _lex_charbychar(self,start,countline,countpos):
+        ''' lexes char by char, starting at start, till the end of a record (or end of file).
+            returns index after the record, countline, countpos and the lex_record (None if no record).
+        '''
+        rawinput = self.rawinput
+        length = len(rawinput)
         record_sep  = self.ta_info['record_sep']
         mode_inrecord = 0  # 1 indicates: lexing in record, 0 is lexing 'between records'.
         field_sep   = self.ta_info['field_sep'] + self.ta_info['record_tag_sep']    #for tradacoms; field_sep and record_tag_sep have same function.
@@ -620,111 +1017,111 @@ class var(Inmessage):
         value       = ''   #gather the content of (sub)field; the current token
         valueline   = 1    #record line of token
         valuepos    = 1    #record position of token in line
-        countline   = 1    #count number of lines; start with 1
-        countpos    = 0    #count position/number of chars within line
         sep = field_sep + sfield_sep + record_sep + escape + rep_sep
 
-        for char in self.rawinput:    #get next char
-            if char == '\n':
-                #count number lines/position; no action.
-                countline += 1      #count line
-                countpos = 0        #position back to 0
-            else:
-                countpos += 1       #position within line
-            if mode_quote:
-                #lexing within a quote; note that quote-char works as escape-char within a quote
-                if mode_2quote:
-                    mode_2quote = 0
-                    if char == quote_char: #after quote-char another quote-char: used to escape quote_char:
-                        value += char    #append quote_char
+        #lex in chunks, each chunk ends with a record separator. A record always ends at end of a chunk.
+        record_end = re.compile('[%s]'%re.escape(record_sep)) if record_sep else None
+        index = start
+        while index < length:
+            match = record_end.search(rawinput,index) if record_end else None
+            stop = match.end() if match else length
+            for char in rawinput[index:stop]:    #get next char
+                if char == '\n':
+                    #count number lines/position; no action.
+                    countline += 1      #count line
+                    countpos = 0        #position back to 0
+                else:
+                    countpos += 1       #position within line
+                if mode_quote:
+                    #lexing within a quote; note that quote-char works as escape-char within a quote
+                    if mode_2quote:
+                        mode_2quote = 0
+                        if char == quote_char: #after quote-char another quote-char: used to escape quote_char:
+                            value += char    #append quote_char
+                            continue
+                        else: #quote is ended:
+                            mode_quote = 0
+                            #continue parsing of this char
+                    elif mode_escape:        #tricky: escaping a quote char
+                        mode_escape = 0
+                        value += char
+                        continue
+                    elif char == quote_char:    #either end-quote or escaping quote_char,we do not know yet
+                        mode_2quote = 1
+                        continue
+                    elif char == escape:
+                        mode_escape = 1
                         continue
-                    else: #quote is ended:
-                        mode_quote = 0
-                        #continue parsing of this char
-                elif mode_escape:        #tricky: escaping a quote char
+                    else:                       #we are in quote, just append char to token
+                        value += char
+                        continue
+                if char in skip_char:
+                    #char is skipped. In csv these chars could be in a quote; in eg edifact chars will be skipped, even if after escape sign.
+                    continue
+                if not mode_inrecord:
+                    #get here after record-separator is found. we are 'between' records.
+                    #some special handling for whitespace characters; for other chars: go on lexing
+                    if char.isspace():  #whitespace = ' \t\n\r\v\f'....note that CRLF might be in skip_char
+                        if char in field_sep and isinstance(self,csv): #exception for tab-delimited csv/excel files: if first field is not filled: first TAB is significant!
+                            pass        #just go on lexing
+                        elif strict_syntax_check:  #for strict checks: no spaces between records
+                            raise botslib.InMessageError('[A67]: Found whitespace characters between segments. Line %(countline)s, position %(pos)s, position %(countpos)s.',{'countline':countline,'countpos':countpos})
+                        else:
+                            continue    #ignore whitespace character; continue for-loop with next character
+                    mode_inrecord = 1   #not whitespace - a new record has started
+                if mode_escape:
+                    #in escaped_mode: char after escape sign is appended to token
                     mode_escape = 0
                     value += char
                     continue
-                elif char == quote_char:    #either end-quote or escaping quote_char,we do not know yet
-                    mode_2quote = 1
+                if not value:
+                    #if no char in token: this is a new token, get line and pos for (new) token
+                    valueline = countline
+                    valuepos = countpos
+                if char == quote_char and (not value or value.isspace()):
+                    #for csv: handle new quote value. New quote value only makes sense for new field (value is empty) or field contains only whitespace
+                    mode_quote = 1
+                    continue
+                if char not in sep:
+                    value += char    #just a char: append char to value
+                    continue
+                if char in field_sep:
+                    #end of (sub)field. Note: first field of composite is marked as 'field'
+                    lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
+                    value = ''
+                    sfield = 0      #new token is field
+                    continue
+                if char == sfield_sep:
+                    #end of (sub)field. Note: first field of composite is marked as 'field'
+                    lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
+                    value = ''
+                    sfield = 1        #new token is sub-field
                     continue
-                elif char == escape:
+                if char in record_sep:      #end of record
+                    if strict_syntax_check and not lex_record:      #check for 'double' record seperator.
+                        raise botslib.InMessageError('[A69]: Found double record seperator. Line %(countline)s, position %(pos)s, position %(countpos)s.',{'countline':countline,'countpos':countpos})
+                    lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
+                    return stop,countline,countpos,lex_record      #record separator is always the last char of chunk
+                if char == escape:
                     mode_escape = 1
                     continue
-                else:                       #we are in quote, just append char to token
-                    value += char
+                if char == rep_sep:
+                    lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
+                    value = ''
+                    sfield = 2        #new token is repeating
                     continue
-            if char in skip_char:
-                #char is skipped. In csv these chars could be in a quote; in eg edifact chars will be skipped, even if after escape sign.
-                continue
-            if not mode_inrecord:
-                #get here after record-separator is found. we are 'between' records.
-                #some special handling for whitespace characters; for other chars: go on lexing
-                if char.isspace():  #whitespace = ' \t\n\r\v\f'....note that CRLF might be in skip_char
-                    if char in field_sep and isinstance(self,csv): #exception for tab-delimited csv/excel files: if first field is not filled: first TAB is significant!
-                        pass        #just go on lexing
-                    elif strict_syntax_check:  #for strict checks: no spaces between records
-                        raise botslib.InMessageError('[A67]: Found whitespace characters between segments. Line %(countline)s, position %(pos)s, position %(countpos)s.',{'countline':countline,'countpos':countpos})
-                    else:
-                        continue    #ignore whitespace character; continue for-loop with next character
-                mode_inrecord = 1   #not whitespace - a new record has started
-            if mode_escape:
-                #in escaped_mode: char after escape sign is appended to token
-                mode_escape = 0
-                value += char
-                continue
-            if not value:
-                #if no char in token: this is a new token, get line and pos for (new) token
-                valueline = countline
-                valuepos = countpos
-            if char == quote_char and (not value or value.isspace()):
-                #for csv: handle new quote value. New quote value only makes sense for new field (value is empty) or field contains only whitespace
-                mode_quote = 1
-                continue
-            if char not in sep:
-                value += char    #just a char: append char to value
-                continue
-            if char in field_sep:
-                #end of (sub)field. Note: first field of composite is marked as 'field'
-                lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
-                value = ''
-                sfield = 0      #new token is field
-                continue
-            if char == sfield_sep:
-                #end of (sub)field. Note: first field of composite is marked as 'field'
-                lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
-                value = ''
-                sfield = 1        #new token is sub-field
-                continue
-            if char in record_sep:      #end of record
-                if strict_syntax_check and not lex_record:      #check for 'double' record seperator.
-                    raise botslib.InMessageError('[A69]: Found double record seperator. Line %(countline)s, position %(pos)s, position %(countpos)s.',{'countline':countline,'countpos':countpos})
-                lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
-                self.lex_records.append(lex_record)                 #write lex_record to self.lex_records
-                lex_record = []
-                value = ''
-                sfield = 0      #new token is field
-                mode_inrecord = 0    #we are not in a record
-                continue
-            if char == escape:
-                mode_escape = 1
-                continue
-            if char == rep_sep:
-                lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #write current value to lex_record
-                value = ''
-                sfield = 2        #new token is repeating
-                continue
+            index = stop
         #end of for-loop. all characters have been processed.
         #in a perfect world, value should always be empty now, but:
         #it appears a csv record is not always closed properly, so force the closing of the last record of csv file:
         if mode_inrecord and self.ta_info.get('allow_lastrecordnotclosedproperly',False):
             lex_record.append({VALUE:value,SFIELD:sfield,LIN:valueline,POS:valuepos})    #append element in record
-            self.lex_records.append(lex_record)    #write record to recordlist
-        else:
-            leftover = value.strip('\x00\x1a')
-            if leftover:
-                raise botslib.InMessageError('[A51]: Found non-valid data at end of edi file; probably a problem with separators or message structure: "%(leftover)s".',
-                                                {'leftover':leftover})
+            return length,countline,countpos,lex_record
+        leftover = value.strip('\x00\x1a')
+        if leftover:
+            raise botslib.InMessageError('[A51]: Found non-valid data at end of edi file; probably a problem with separators or message structure: "%(leftover)s".',
+                                            {'leftover':leftover})
+        return length,countline,countpos,None
 
     def _parsefields(self,lex_record,record_definition):
         ''' Identify the fields in inmessage-record using the record_definition from the grammar
@@ -819,30 +1216,37 @@ class var(Inmessage):
 
 class csv(var):
     ''' class for ediobjects with Comma Separated Values'''
-    def _lex(self):
-        super(csv,self)._lex()
-        
-        if self.ta_info['skip_firstline']:
+    def _iterlex(self):
+        return self._csvlexrecords(super(csv,self)._iterlex())
+
+    def _csvlexrecords(self,lex_records):
+        ''' generator: skip first lines and add BOTSID to lex_records, as indicated in syntax.'''
+        lex_records = iter(lex_records)
+        skip_firstline = self.ta_info['skip_firstline']
+        if skip_firstline:
             # if it is an integer, skip that many lines
             # if True, skip just the first line
-            if isinstance(self.ta_info['skip_firstline'],bool):
-                del self.lex_records[0]
-            else:
-                del self.lex_records[0:self.ta_info['skip_firstline']]
-
+            for lex_record in lex_records:
+                skip_firstline -= 1
+                if not skip_firstline:
+                    break
         noBOTSID = self.ta_info['noBOTSID']
-        if noBOTSID: 
+        if noBOTSID:
             # if integer, swap fields in record
             # if True, add BOTSID to record
             if isinstance(noBOTSID,bool):
                 botsid = self.defmessage.structure[0][ID]   #add the recordname as BOTSID
-                for lex_record in self.lex_records:
+                for lex_record in lex_records:
                     lex_record[0:0] = [{VALUE: botsid, POS: 0, LIN:lex_record[0][LIN], SFIELD: False}]
+                    yield lex_record
             else:
-                for lex_record in self.lex_records:
+                for lex_record in lex_records:
                     botsid_record = lex_record.pop(noBOTSID)
                     lex_record[0:0] = [botsid_record]
-
+                    yield lex_record
+        else:
+            for lex_record in lex_records:
+                yield lex_record
 
     def set_syntax_used(self):
         self.syntax['record_sep'] = self.ta_info['record_sep']
@@ -850,94 +1254,277 @@ class csv(var):
         self.syntax['quote_char'] = self.ta_info['quote_char']
         self.syntax['escape']     = self.ta_info['escape']
 
-class excel(csv):
-    def initfromfile(self):
-        ''' initialisation from an excel file.
-            file is first converted to csv using python module xlrd
-        '''
-        try:
-            self.xlrd = botslib.botsbaseimport('xlrd')
-        except ImportError:
-            raise ImportError('Dependency failure: editype "excel" requires python library "xlrd".')
-        import csv as csvlib
+class XlsxReader(object):
+    ''' read first sheet of xlsx file (office open xml spreadsheet) using zipfile and iterparse; no external library is needed.
+        rows of sheet are read one at a time; xml elements of a row are removed after the row is read.
+        cells are (datatype,value) with datatypes as in xlrd (see excel.format_excelval).
+    '''
+    DATEFORMATS = frozenset(list(range(14,23)) + list(range(27,37)) + list(range(45,48)) + list(range(50,59)))  #built-in number formats that are dates (as in xlrd)
+    NONDATEFORMATS = ('0.00E+00','##0.0E+0','General','GENERAL','general','@')
+
+    def __init__(self,filename):
+        self.zipfile = zipfile.ZipFile(filename)
         try:
-            import StringIO
+            self._readworkbook()
         except:
-            import io as StringIO
+            self.zipfile.close()
+            raise
+
+    def _readworkbook(self):
+        ''' read datemode, name of first sheet, shared strings and date styles.'''
+        self.datemode = 0       #0: dates are days since 1899-12-30; 1: days since 1904-01-01
+        self.sheetname = 'xl/worksheets/sheet1.xml'
+        sheet_relationship = None
+        for element in ET.fromstring(self.zipfile.read('xl/workbook.xml')).iter():
+            tag = element.tag.rpartition('}')[2]
+            if tag == 'workbookPr' and element.get('date1904') in ('1','true'):
+                self.datemode = 1
+            elif tag == 'sheet' and sheet_relationship is None:     #first sheet
+                sheet_relationship = next((value for key,value in element.items() if key.endswith('}id')),None)
+        if sheet_relationship is not None and 'xl/_rels/workbook.xml.rels' in self.zipfile.namelist():
+            for relationship in ET.fromstring(self.zipfile.read('xl/_rels/workbook.xml.rels')):
+                if relationship.get('Id') == sheet_relationship:
+                    target = relationship.get('Target')
+                    self.sheetname = target[1:] if target.startswith('/') else 'xl/' + target
+        self.shared_strings = self._sharedstrings()
+        self.datestyles = self._datestyles()
+
+    def _sharedstrings(self):
+        ''' list of shared strings; cells with type 's' have index in this list.'''
+        shared_strings = []
+        if 'xl/sharedStrings.xml' not in self.zipfile.namelist():
+            return shared_strings
+        with self.zipfile.open('xl/sharedStrings.xml') as part:
+            iterator = ET.iterparse(part,events=('start','end'))
+            event,root = next(iterator)
+            for event,element in iterator:
+                if event == 'end' and element.tag.endswith('}si'):
+                    shared_strings.append(self._text(element))
+                    root.clear()
+        return shared_strings
+
+    @staticmethod
+    def _text(element):
+        ''' text of shared string or inline string: t, or t of rich text runs (r); phonetic runs (rPh) are not used.'''
+        texts = []
+        for child in element:
+            tag = child.tag.rpartition('}')[2]
+            if tag == 't':
+                texts.append(child.text or '')
+            elif tag == 'r':
+                for grandchild in child:
+                    if grandchild.tag.endswith('}t'):
+                        texts.append(grandchild.text or '')
+        return ''.join(texts)
+
+    def _datestyles(self):
+        ''' set of cell styles (attribute s of cell) with a number format that is a date.'''
+        if 'xl/styles.xml' not in self.zipfile.namelist():
+            return set()
+        styles = ET.fromstring(self.zipfile.read('xl/styles.xml'))
+        namespace = styles.tag[:styles.tag.find('}')+1]
+        dateformats = set(self.DATEFORMATS)
+        numfmts = styles.find(namespace + 'numFmts')
+        if numfmts is not None:
+            for numfmt in numfmts:
+                if self._isdateformat(numfmt.get('formatCode','')):
+                    dateformats.add(int(numfmt.get('numFmtId')))
+                else:
+                    dateformats.discard(int(numfmt.get('numFmtId')))
+        cellxfs = styles.find(namespace + 'cellXfs')
+        if cellxfs is None:
+            return set()
+        return set(index for index,xf in enumerate(cellxfs) if int(xf.get('numFmtId',0)) in dateformats)
+
+    @classmethod
+    def _isdateformat(cls,formatcode):
+        ''' number format is a date (as in xlrd): skip quoted text, escaped chars and [colours]; compare count of date chars and number chars.'''
+        formatcode = re.sub(r'"[^"]*"?|[\\_*].?','',formatcode)
+        formatcode = re.sub(r'\[[^\]]*\]','',formatcode)
+        if formatcode in cls.NONDATEFORMATS:
+            return False
+        date_count = sum(formatcode.count(char) for char in 'ymdhsYMDHS')
+        num_count = sum(formatcode.count(char) for char in '0#?')
+        return date_count > num_count
 
+    @staticmethod
+    def _columnindex(reference):
+        ''' column index (0-based) of cell reference (eg 'AB12').'''
+        index = 0
+        for char in reference:
+            if char.isdigit():
+                break
+            index = index * 26 + ord(char.upper()) - 64
+        return index - 1
+
+    def rows(self):
+        ''' generator; yields (rownumber,cells) for each row of sheet. Missing cells are empty (datatype 0).
+            Rows without values are skipped (as empty lines in csv); empty cells at end of row are not used.
+        '''
+        try:
+            with self.zipfile.open(self.sheetname) as part:
+                iterator = ET.iterparse(part,events=('start','end'))
+                event,root = next(iterator)
+                namespace = root.tag[:root.tag.find('}')+1]
+                tag_sheetdata,tag_row,tag_v,tag_is = namespace + 'sheetData',namespace + 'row',namespace + 'v',namespace + 'is'
+                rownumber = 0
+                for event,element in iterator:
+                    if event == 'start':
+                        if element.tag == tag_sheetdata:
+                            sheetdata = element
+                        continue
+                    if element.tag != tag_row:
+                        continue
+                    rownumber = int(element.get('r',rownumber + 1))
+                    cells = []
+                    for cell in element:
+                        reference = cell.get('r')
+                        if reference:
+                            cells.extend([(0,'')] * (self._columnindex(reference) - len(cells)))
+                        celltype = cell.get('t','n')
+                        if celltype == 'inlineStr':
+                            inline_string = cell.find(tag_is)
+                            cells.append((1,self._text(inline_string) if inline_string is not None else ''))
+                            continue
+                        value = cell.findtext(tag_v)
+                        if value is None:
+                            cells.append((0,''))
+                        elif celltype == 'n':
+                            cells.append((3 if int(cell.get('s',0)) in self.datestyles else 2,float(value)))
+                        elif celltype == 's':
+                            cells.append((1,self.shared_strings[int(value)]))
+                        elif celltype == 'b':
+                            cells.append((4,int(value)))
+                        elif celltype == 'e':
+                            cells.append((5,value))
+                        else:       #'str' (result of formula), 'd' (date as text)
+                            cells.append((1,value))
+                    sheetdata.clear()   #elements of rows that are read are not kept
+                    while cells and not cells[-1][0]:
+                        cells.pop()
+                    if cells:
+                        yield rownumber,cells
+        finally:
+            self.zipfile.close()
+
+
+class excel(csv):
+    ''' class for excel files; the first sheet is read.
+        xlsx files are read row by row (XlsxReader); xls files are read using python library xlrd.
+        rows are lexed as csv records (line is row number, pos is column number).
+    '''
+    XLS_ERRORS = {0x00:'#NULL!',0x07:'#DIV/0!',0x0F:'#VALUE!',0x17:'#REF!',0x1D:'#NAME?',0x24:'#NUM!',0x2A:'#N/A'}     #error codes in xls cells (as in xlrd)
+
+    def initfromfile(self):
+        ''' initialisation from an excel file.'''
         self.messagegrammarread(typeofgrammarfile='grammars')
         self.ta_info['charset'] = self.defmessage.syntax['charset']      #always use charset of edi file.
-        if self.ta_info['escape']:
-            doublequote = False
-        else:
-            doublequote = True
-
         botsglobal.logger.debug('Read edi file "%(filename)s".',self.ta_info)
-        #xlrd reads excel file; python's csv modules write this to file-like StringIO (as utf-8); read StringIO as self.rawinput; decode this (utf-8->unicode)
         infilename = botslib.abspathdata(self.ta_info['filename'])
         try:
-            xlsdata = self.read_xls(infilename)
+            if zipfile.is_zipfile(infilename):
+                xlsx = XlsxReader(infilename)
+                self.datemode,self.rows = xlsx.datemode,xlsx.rows()
+            else:
+                self.datemode,self.rows = self.read_xls(infilename)
+        except ImportError:
+            raise
         except:
-            txt = botslib.txtexc()
-            botsglobal.logger.error('Excel extraction failed, may not be an Excel file? Error:\n%(txt)s',
-                                            {'txt':txt})
-            raise botslib.InMessageError('Excel extraction failed, may not be an Excel file? Error:\n%(txt)s',
-                                            {'txt':txt})
-        rawinputfile = StringIO.StringIO()
-        csvout = csvlib.writer(rawinputfile, quotechar=self.ta_info['quote_char'], delimiter=self.ta_info['field_sep'], doublequote=doublequote, escapechar=self.ta_info['escape'])
-        csvout.writerows( map(self.utf8ize, xlsdata) )
-        rawinputfile.seek(0)
-        self.rawinput = rawinputfile.read()
-        rawinputfile.close()
-        self.rawinput = self.rawinput.decode('utf-8')
-        #start lexing and parsing as csv
-        self._lex()
-        if hasattr(self,'rawinput'):
-            del self.rawinput
+            raise self._extractionerror()
+        #lex_records are read by parser one at a time; all lex_records only if preprocess_lex needs these
+        preprocess_lex = self.ta_info.get('preprocess_lex',False)
+        if callable(preprocess_lex):
+            self._lex()
+            preprocess_lex(lex=self.lex_records,ta_info=self.ta_info)
+            self.iternext_lex_record = iter(self.lex_records)
+        else:
+            self.iternext_lex_record = self._iterlex()
+        self.set_syntax_used()
         self.root = node.Node()  #make root Node None.
-        self.iternext_lex_record = iter(self.lex_records)
-        leftover = self._parse(structure_level=self.defmessage.structure,inode=self.root)
-        if leftover:
-            raise botslib.InMessageError('[A52]: Found non-valid data at end of excel file: "%(leftover)s".',
-                                            {'leftover':leftover})
-        del self.lex_records
-        self.checkmessage(self.root,self.defmessage)
+        self._envelopes = []
+        for messagenode in self._parsemessages():   #not streaming: nothing is yielded
+            pass
+
+    @staticmethod
+    def _extractionerror():
+        txt = botslib.txtexc()
+        botsglobal.logger.error('Excel extraction failed, may not be an Excel file? Error:\n%(txt)s',
+                                        {'txt':txt})
+        return botslib.InMessageError('Excel extraction failed, may not be an Excel file? Error:\n%(txt)s',
+                                        {'txt':txt})
+
+    def _iterlex(self):
+        return self._csvlexrecords(self._iterrows())
+
+    def _iterrows(self):
+        ''' generator: rows of sheet as lex_records.'''
+        try:
+            for rownumber,cells in self.rows:
+                yield [{VALUE:str(self.format_excelval(self.datemode,datatype,value,False)),SFIELD:0,LIN:rownumber,POS:colnumber}
+                        for colnumber,(datatype,value) in enumerate(cells,1)]
+        except botslib.BotsError:
+            raise
+        except:
+            raise self._extractionerror()
 
     def read_xls(self,infilename):
-        # Read excel first sheet into a 2-d array
-        book       = self.xlrd.open_workbook(infilename)
-        sheet      = book.sheet_by_index(0)
-        #~ formatter  = lambda(t,v): self.format_excelval(book,t,v,False)  # python3
-        xlsdata = []
-        for row in range(sheet.nrows):
-            (types, values) = (sheet.row_types(row), sheet.row_values(row))
-            xlsdata.append(map(formatter, zip(types, values)))
-        return xlsdata
+        ''' read first sheet of xls file using xlrd. Returns datemode and rows (generator; as XlsxReader.rows).'''
+        try:
+            xlrd = botslib.botsbaseimport('xlrd')
+        except ImportError:
+            raise ImportError('Dependency failure: editype "excel" requires python library "xlrd" for xls files.')
+        book = xlrd.open_workbook(infilename)
+        sheet = book.sheet_by_index(0)
+        def rows():
+            for row in range(sheet.nrows):
+                cells = list(zip(sheet.row_types(row),sheet.row_values(row)))
+                while cells and cells[-1][0] in (0,6):     #as XlsxReader: no empty cells at end of row, no empty rows
+                    cells.pop()
+                if cells:
+                    yield row + 1,cells
+        return book.datemode,rows()
     #-------------------------------------------------------------------------------
-    def format_excelval(self,book,datatype,value,wanttupledate):
-        #  Convert excel data for some data types
+    def format_excelval(self,datemode,datatype,value,wanttupledate):
+        #  Convert excel data for some data types (datatypes as in xlrd)
         if datatype == 2:
             if value == int(value):
                 value = int(value)
         elif datatype == 3:
-            datetuple = self.xlrd.xldate_as_tuple(value, book.datemode)
+            datetuple = self.xldate_as_tuple(value,datemode)
             value = datetuple if wanttupledate else self.tupledate_to_isodate(datetuple)
         elif datatype == 5:
-            value = self.xlrd.error_text_from_code[value]
+            value = self.XLS_ERRORS.get(value,value)     #xls: error code; xlsx: error text
         return value
     #-------------------------------------------------------------------------------
+    @staticmethod
+    def xldate_as_tuple(xldate,datemode):
+        # Turns an excel date (days since 1899-12-30, or since 1904-01-01 if datemode is 1) into
+        # (year, month, day, hour, minute, nearest_second), as xlrd.xldate_as_tuple.
+        if xldate == 0:
+            return (0,0,0,0,0,0)
+        if xldate < 0:
+            raise botslib.InMessageError('Excel date "%(xldate)s" is negative.',{'xldate':xldate})
+        xldays = int(xldate)
+        seconds = int(round((xldate - xldays) * 86400.0))
+        if seconds == 86400:
+            xldays += 1
+            seconds = 0
+        minutes,second = divmod(seconds,60)
+        hour,minute = divmod(minutes,60)
+        if xldays == 0:
+            return (0,0,0,hour,minute,second)
+        if (datemode == 0 and xldays < 61) or xldays >= 2958466 - 1462 * datemode:
+            raise botslib.InMessageError('Excel date "%(xldate)s" is ambiguous (before 1900-03-01) or too big.',{'xldate':xldate})
+        date = (datetime.date(1904,1,1) if datemode else datetime.date(1899,12,30)) + datetime.timedelta(days=xldays)
+        return (date.year,date.month,date.day,hour,minute,second)
+    #-------------------------------------------------------------------------------
     def tupledate_to_isodate(self,tupledate):
         # Turns a gregorian (year, month, day, hour, minute, nearest_second) into a
         # standard YYYY-MM-DDTHH:MM:SS ISO date.
         (y,m,d, hh,mm,ss) = tupledate
-        nonzero = lambda n: n != 0
-        datestring = '%04d-%02d-%02d'  % (y,m,d)    if filter(nonzero,(y,m,d)) else ''
-        timestring = 'T%02d:%02d:%02d' % (hh,mm,ss) if filter(nonzero,(hh,mm,ss)) or not datestring else ''
+        datestring = '%04d-%02d-%02d'  % (y,m,d)    if any((y,m,d)) else ''
+        timestring = 'T%02d:%02d:%02d' % (hh,mm,ss) if any((hh,mm,ss)) or not datestring else ''
         return datestring+timestring
-    #-------------------------------------------------------------------------------
-    def utf8ize(self,l):
-        # Make string-like things into utf-8, leave other things alone
-        return [unicode(s).encode('utf-8') if hasattr(s,'encode') else s for s in l]
 
 
 class edifact(var):
@@ -952,7 +1539,27 @@ class edifact(var):
             is read as binary. In _sniff determine charset; then decode according to charset.
         '''
         botsglobal.logger.debug('Read edifact file "%(filename)s".',self.ta_info)
-        self.rawinput = botslib.readdata_bin(filename=self.ta_info['filename'])     #read as binary
+        if self.streaming:      #only start of file is read (for _sniff); file is read in blocks when lexing.
+            filehandler = botslib.opendata_bin(filename=self.ta_info['filename'],mode='rb')
+            self.rawinput = filehandler.read(self.streaming_blocksize)
+            filehandler.close()
+        else:
+            self.rawinput = botslib.readdata_bin(filename=self.ta_info['filename'])     #read as binary
+
+    def _iterblocks(self):
+        ''' generator: when streaming, reads the edi file in blocks. Blocks are decoded with charset as found in _sniff.'''
+        decoder = codecs.getincrementaldecoder(self.ta_info['charset'])(self.ta_info['checkcharsetin'])
+        filehandler = botslib.opendata_bin(filename=self.ta_info['filename'],mode='rb')
+        try:
+            while True:
+                data = filehandler.read(self.streaming_blocksize)
+                block = decoder.decode(data,final=not data)
+                if block:
+                    yield block
+                if not data:
+                    return
+        finally:
+            filehandler.close()
 
     def _sniff(self):
         ''' examine the beginning of edifact file for syntax parameters and charset.
@@ -1029,8 +1636,11 @@ class edifact(var):
         #*********** decode the file (to unicode).
         self.ta_info['charset'] = found_charset
         try:
-            self.rawinput = self.rawinput.decode(found_charset,self.ta_info['checkcharsetin'])
-            self.countpos = self.rawinput.find('UNB')       #import
+            if self.streaming:      #blocks of file are decoded when read (_iterblocks)
+                codecs.lookup(found_charset)
+            else:
+                self.rawinput = self.rawinput.decode(found_charset,self.ta_info['checkcharsetin'])
+                self.countpos = self.rawinput.find('UNB')       #import
         except LookupError:
             raise botslib.InMessageError('[A58]: Edifact file has unknown characterset "%(charset)s".',
                                             {'charset':found_charset})
@@ -1063,18 +1673,9 @@ class edifact(var):
                     self.add2errorlist('[E02]: Count of messages in UNZ is %(unzcount)s; should be equal to number of messages %(messagecount)s.\n'%{'unzcount':unzcount,'messagecount':messagecount})
             except:
                 self.add2errorlist('[E03]: Count of messages in UNZ is invalid: "%(count)s".\n'%{'count':unzcount})
-            for nodeunh in UNB.getloop({'BOTSID':'UNB'},{'BOTSID':'UNH'}):
-                unhreference = nodeunh.get({'BOTSID':'UNH','0062':None})
-                untreference = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0062':None})
-                if unhreference and untreference and unhreference != untreference:
-                    self.add2errorlist('[E04]: UNH-reference is "%(unhreference)s"; should be equal to UNT-reference "%(untreference)s".\n'%{'unhreference':unhreference,'untreference':untreference})
-                untcount = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0074':None})
-                segmentcount = nodeunh.getcount()
-                try:
-                    if int(untcount) != segmentcount:
-                        self.add2errorlist('[E05]: Segmentcount in UNT is %(untcount)s; should be equal to number of segments %(segmentcount)s.\n'%{'untcount':untcount,'segmentcount':segmentcount})
-                except:
-                    self.add2errorlist('[E06]: Count of segments in UNT is invalid: "%(count)s".\n'%{'count':untcount})
+            if not self.streaming:      #when streaming, messages are checked when parsed
+                for nodeunh in UNB.getloop({'BOTSID':'UNB'},{'BOTSID':'UNH'}):
+                    self._checkmessageenvelope(nodeunh,UNB)
             for nodeung in UNB.getloop({'BOTSID':'UNB'},{'BOTSID':'UNG'}):
                 ungreference = nodeung.get({'BOTSID':'UNG','0048':None})
                 unereference = nodeung.get({'BOTSID':'UNG'},{'BOTSID':'UNE','0048':None})
@@ -1087,20 +1688,26 @@ class edifact(var):
                         self.add2errorlist('[E08]: Groupcount in UNE is %(unecount)s; should be equal to number of groups %(groupcount)s.\n'%{'unecount':unecount,'groupcount':groupcount})
                 except:
                     self.add2errorlist('[E09]: Groupcount in UNE is invalid: "%(count)s".\n'%{'count':unecount})
-                for nodeunh in nodeung.getloop({'BOTSID':'UNG'},{'BOTSID':'UNH'}):
-                    unhreference = nodeunh.get({'BOTSID':'UNH','0062':None})
-                    untreference = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0062':None})
-                    if unhreference and untreference and unhreference != untreference:
-                        self.add2errorlist('[E10]: UNH-reference is "%(unhreference)s"; should be equal to UNT-reference "%(untreference)s".\n'%{'unhreference':unhreference,'untreference':untreference})
-                    untcount = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0074':None})
-                    segmentcount = nodeunh.getcount()
-                    try:
-                        if int(untcount) != segmentcount:
-                            self.add2errorlist('[E11]: Segmentcount in UNT is %(untcount)s; should be equal to number of segments %(segmentcount)s.\n'%{'untcount':untcount,'segmentcount':segmentcount})
-                    except:
-                        self.add2errorlist('[E12]: Count of segments in UNT is invalid: "%(count)s".\n'%{'count':untcount})
+                if not self.streaming:
+                    for nodeunh in nodeung.getloop({'BOTSID':'UNG'},{'BOTSID':'UNH'}):
+                        self._checkmessageenvelope(nodeunh,nodeung)
             botsglobal.logmap.debug('Parsing edifact envelopes is OK')
 
+    def _checkmessageenvelope(self,nodeunh,inode):
+        ''' check UNH-UNT counters & references of one message. inode is UNB or UNG.'''
+        codes = ('E10','E11','E12') if inode.record['BOTSID'] == 'UNG' else ('E04','E05','E06')
+        unhreference = nodeunh.get({'BOTSID':'UNH','0062':None})
+        untreference = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0062':None})
+        if unhreference and untreference and unhreference != untreference:
+            self.add2errorlist('[%(code)s]: UNH-reference is "%(unhreference)s"; should be equal to UNT-reference "%(untreference)s".\n'%{'code':codes[0],'unhreference':unhreference,'untreference':untreference})
+        untcount = nodeunh.get({'BOTSID':'UNH'},{'BOTSID':'UNT','0074':None})
+        segmentcount = nodeunh.getcount()
+        try:
+            if int(untcount) != segmentcount:
+                self.add2errorlist('[%(code)s]: Segmentcount in UNT is %(untcount)s; should be equal to number of segments %(segmentcount)s.\n'%{'code':codes[1],'untcount':untcount,'segmentcount':segmentcount})
+        except:
+            self.add2errorlist('[%(code)s]: Count of segments in UNT is invalid: "%(count)s".\n'%{'code':codes[2],'count':untcount})
+
     def handleconfirm(self,ta_fromfile,routedict,error):
         ''' done at end of edifact file handling.
             generates CONTRL messages (or not)
@@ -1296,21 +1903,26 @@ class x12(var):
                         self.add2errorlist('[E17]: Count in GE-GE01 is %(gecount)s; should be equal to number of transactions: %(messagecount)s.\n'%{'gecount':gecount,'messagecount':messagecount})
                 except:
                     self.add2errorlist('[E18]: Count of messages in GE is invalid: "%(count)s".\n'%{'count':gecount})
-                for nodest in nodegs.getloop({'BOTSID':'GS'},{'BOTSID':'ST'}):
-                    streference = nodest.get({'BOTSID':'ST','ST02':None})
-                    sereference = nodest.get({'BOTSID':'ST'},{'BOTSID':'SE','SE02':None})
-                    #referencefields are numerical; should I compare values??
-                    if streference and sereference and streference != sereference:
-                        self.add2errorlist('[E19]: ST-reference is "%(streference)s"; should be equal to SE-reference "%(sereference)s".\n'%{'streference':streference,'sereference':sereference})
-                    secount = nodest.get({'BOTSID':'ST'},{'BOTSID':'SE','SE01':None})
-                    segmentcount = nodest.getcount()
-                    try:
-                        if int(secount) != segmentcount:
-                            self.add2errorlist('[E20]: Count in SE-SE01 is %(secount)s; should be equal to number of segments %(segmentcount)s.\n'%{'secount':secount,'segmentcount':segmentcount})
-                    except:
-                        self.add2errorlist('[E21]: Count of segments in SE is invalid: "%(count)s".\n'%{'count':secount})
+                if not self.streaming:      #when streaming, messages are checked when parsed
+                    for nodest in nodegs.getloop({'BOTSID':'GS'},{'BOTSID':'ST'}):
+                        self._checkmessageenvelope(nodest,nodegs)
             botsglobal.logmap.debug('Parsing X12 envelopes is OK')
 
+    def _checkmessageenvelope(self,nodest,inode):
+        ''' check ST-SE counters & references of one message.'''
+        streference = nodest.get({'BOTSID':'ST','ST02':None})
+        sereference = nodest.get({'BOTSID':'ST'},{'BOTSID':'SE','SE02':None})
+        #referencefields are numerical; should I compare values??
+        if streference and sereference and streference != sereference:
+            self.add2errorlist('[E19]: ST-reference is "%(streference)s"; should be equal to SE-reference "%(sereference)s".\n'%{'streference':streference,'sereference':sereference})
+        secount = nodest.get({'BOTSID':'ST'},{'BOTSID':'SE','SE01':None})
+        segmentcount = nodest.getcount()
+        try:
+            if int(secount) != segmentcount:
+                self.add2errorlist('[E20]: Count in SE-SE01 is %(secount)s; should be equal to number of segments %(segmentcount)s.\n'%{'secount':secount,'segmentcount':segmentcount})
+        except:
+            self.add2errorlist('[E21]: Count of segments in SE is invalid: "%(count)s".\n'%{'count':secount})
+
     def try_to_retrieve_info(self):
         ''' when edi-file is not correct, (try to) get info about eg partnerID's in message
             for now: look around in lexed record
@@ -1439,18 +2051,25 @@ class tradacoms(var):
                 if firstmessage:
                     nodestx.queries = {'messagetype':nodemhd.queries['messagetype']}
                     firstmessage = False
-                mtrcount = nodemhd.get({'BOTSID':'MHD'},{'BOTSID':'MTR','NOSG':None})
-                segmentcount = nodemhd.getcount()
-                try:
-                    if int(mtrcount) != segmentcount:
-                        self.add2errorlist('[E24]: Count in MTR is %(mtrcount)s; should be equal to number of segments %(segmentcount)s.\n'%{'mtrcount':mtrcount,'segmentcount':segmentcount})
-                except:
-                    self.add2errorlist('[E25]: Count of segments in MTR is invalid: "%(count)s".\n'%{'count':mtrcount})
+                if not self.streaming:      #when streaming, messages are checked when parsed
+                    self._checkmessageenvelope(nodemhd,nodestx)
             botsglobal.logmap.debug('Parsing tradacoms envelopes is OK')
 
+    def _checkmessageenvelope(self,nodemhd,inode):
+        ''' check MHD-MTR counter of one message.'''
+        mtrcount = nodemhd.get({'BOTSID':'MHD'},{'BOTSID':'MTR','NOSG':None})
+        segmentcount = nodemhd.getcount()
+        try:
+            if int(mtrcount) != segmentcount:
+                self.add2errorlist('[E24]: Count in MTR is %(mtrcount)s; should be equal to number of segments %(segmentcount)s.\n'%{'mtrcount':mtrcount,'segmentcount':segmentcount})
+        except:
+            self.add2errorlist('[E25]: Count of segments in MTR is invalid: "%(count)s".\n'%{'count':mtrcount})
+
 
 class xml(Inmessage):
-    ''' class for ediobjects in XML. Uses ElementTree'''
+    ''' class for ediobjects in XML. Uses ElementTree (iterparse): xml file is read and converted to nodes in one pass.'''
+    records_need_children = False   #xml element in grammar is a record, also without children
+
     def initfromfile(self):
         botsglobal.logger.debug('Read edi file "%(filename)s".',self.ta_info)
         filename = botslib.abspathdata(self.ta_info['filename'])
@@ -1471,15 +2090,10 @@ class xml(Inmessage):
             except botslib.BotsImportError:
                 botsglobal.logger.error('Missing mailbag definitions for xml, should be there.')
                 raise
-            parser = ET.XMLParser()
-            try:
-                extra_character_entity = getattr(module, 'extra_character_entity')
-                for key,value in extra_character_entity.items():
-                    parser.entity[key] = value
-            except AttributeError:
-                pass    #there is no extra_character_entity in the mailbag definitions, is OK.
-            etree =  ET.ElementTree()   #ElementTree: lexes, parses, makes etree; etree is quite similar to bots-node trees but conversion is needed
-            etreeroot = etree.parse(filename, parser)
+            extra_character_entity = getattr(module,'extra_character_entity',{})   #extra_character_entity in the mailbag definitions is optional
+            self._checkfilesize()       #xpath-search needs the whole etree in memory
+            etree =  ET.ElementTree()
+            etree.parse(filename, self._xmlparser(extra_character_entity))
             for item in mailbagsearch:
                 if 'xpath' not in item or 'messagetype' not in item:
                     raise botslib.InMessageError('Invalid search parameters in xml mailbag.')
@@ -1491,91 +2105,323 @@ class xml(Inmessage):
                     break
             else:
                 raise botslib.InMessageError('Could not find right xml messagetype for mailbag.')
-
+            del etree   #xml file is read again below, converting to nodes in one pass
             self.messagegrammarread(typeofgrammarfile='grammars')
         else:
             self.messagegrammarread(typeofgrammarfile='grammars')
-            parser = ET.XMLParser()
-            for key,value in self.ta_info['extra_character_entity'].items():
-                parser.entity[key] = value
-            etree =  ET.ElementTree()   #ElementTree: lexes, parses, makes etree; etree is quite similar to bots-node trees but conversion is needed
-            etreeroot = etree.parse(filename, parser)
-        self._handle_empty(etreeroot)
-        self.stackinit()
-        self.root = self._etree2botstree(etreeroot)  #convert etree to bots-nodes-tree
-        self.checkmessage(self.root,self.defmessage)
+            extra_character_entity = self.ta_info['extra_character_entity']
+        self.xmlparser = self._xmlparser(extra_character_entity)
+        self.root = None
+        self._envelopes = []     #when streaming: (node,record_definition) of the records above the message being yielded
+        if (self.ta_info.get('streaming') and self.defmessage.nextmessage is not None and len(self.defmessage.nextmessage) > 1
+                and not callable(self.ta_info.get('preprocess_nodes'))):
+            #xml file is read in nextmessage. Nodes of a message are released after the message is handled.
+            self.streaming = True
+            self.ta_info['total_number_of_messages'] = self._countmessages(filename,extra_character_entity)
+            return
+        self._checkfilesize()
+        for messagenode in self._parsemessages():   #not streaming: nothing is yielded
+            pass
+
+    @staticmethod
+    def _xmlparser(extra_character_entity,target=None):
+        parser = ET.XMLParser(target=target)
+        for key,value in extra_character_entity.items():
+            parser.entity[key] = value
+        return parser
+
+    def _parsemessages(self):
+        ''' generator; read whole xml file. When streaming: yields each message (node) when it is read and checked.
+        '''
+        yield from self._iterparse(botslib.abspathdata(self.ta_info['filename']))
+        del self.xmlparser
+        self.checkmessage(self.root,self.defmessage)    #when streaming the messages are already checked; see _canonicaltree
         self.ta_info.update(self.root.queries)
 
-    def _handle_empty(self,xmlnode):
-        if xmlnode.text:
-            xmlnode.text = xmlnode.text.strip()
-        for key,value in xmlnode.items():
-            xmlnode.attrib[key] = value.strip()
-        for xmlchildnode in xmlnode:   #for every node in mpathtree
-            self._handle_empty(xmlchildnode)
-
-    def _etree2botstree(self,xmlnode):
-        ''' recursive. '''
-        newnode = node.Node(record=self._etreenode2botstreenode(xmlnode))   #make new node, use fields
-        for xmlchildnode in xmlnode:   #for every node in mpathtree
-            entitytype = self._entitytype(xmlchildnode)
-            if not entitytype:  #is a field, or unknown that looks like a field
-                if xmlchildnode.text:       #if xml element has content, add as field
-                    newnode.record[xmlchildnode.tag] = xmlchildnode.text      #add as a field
-                #convert the xml-attributes of this 'xml-filed' to fields in dict with attributemarker.
-                newnode.record.update((xmlchildnode.tag + self.ta_info['attributemarker'] + key, value) for key,value in xmlchildnode.items() if value)
-            elif entitytype == 1:  #childnode is a record according to grammar
-                newnode.append(self._etree2botstree(xmlchildnode))           #go recursive and add child (with children) as a node/record
-                self.stack.pop()    #handled the xmlnode, so remove it from the stack
-            else:   #is a record, but not in grammar
-                if self.ta_info['checkunknownentities']:
-                    self.add2errorlist('[S02]%(linpos)s: Unknown xml-tag "%(recordunkown)s" (within "%(record)s") in message.\n'%
-                                        {'linpos':newnode.linpos(),'recordunkown':xmlchildnode.tag,'record':newnode.record['BOTSID']})
+    def _iterparse(self,filename):
+        ''' generator; read xml file with iterparse and convert xml elements to nodes in the same pass.
+            white space around text and attributes is stripped.
+            xml elements are removed when converted, so there is never a complete etree.
+            When streaming: yields each message (node) when it is read and checked; the message is released after it is handled.
+        '''
+        #stack: xml elements from root to current element as [xml element, entitytype, record_definition, node]
+        #entitytype: 1 is record; 0 is field (or unknown that looks like a field); 2 is record but not in grammar, is skipped.
+        #node of a record is made at start of first child (text of record is complete then) or at end of the record.
+        stack = []
+        for event,xmlnode in ET.iterparse(filename,events=('start','end'),parser=self.xmlparser):
+            if event == 'start':
+                if not stack:   #root of xml
+                    stack.append([xmlnode,1,self.defmessage.structure[0],None])
+                    continue
+                parent = stack[-1]
+                if parent[1] == 0:      #parent has children, so is not a field
+                    parent[1],parent[2] = self._entitytype_haschildren()
+                if parent[1] == 1:
+                    if parent[3] is None:
+                        parent[3] = node.Node(record=self._etreenode2botstreenode(parent[0]))
+                    record_definition = self._recorddefinition(parent[2],xmlnode.tag)
+                    stack.append([xmlnode,0 if record_definition is None else 1,record_definition,None])
+                else:
+                    stack.append([xmlnode,2,None,None])
                 continue
-        return newnode  #return the new node
+            #event is 'end': xml element is complete
+            dummy,entitytype,record_definition,newnode = stack.pop()
+            if not stack:   #root of xml
+                self.root = newnode if newnode is not None else node.Node(record=self._etreenode2botstreenode(xmlnode))
+                continue
+            stack[-1][0].remove(xmlnode)    #release xml element
+            parentnode = stack[-1][3]
+            if entitytype == 1:
+                if newnode is None:
+                    newnode = node.Node(record=self._etreenode2botstreenode(xmlnode))
+                parentnode.append(newnode)
+                if self.streaming:
+                    envelope_content = [envelope[3].record for envelope in stack]
+                    if any(self._mpathmatches(envelope_content + [newnode.record],mpaths)
+                            for mpaths in (self.defmessage.nextmessage,self.defmessage.nextmessage2) if mpaths is not None):
+                        self._checkmessagenode(newnode,record_definition)
+                        self._envelopes = [(envelope[3],envelope[2]) for envelope in stack]
+                        self.root = self._envelopenode(stack)   #for bots_accessenvelope; the whole root is set at end of xml file
+                        yield newnode       #message is handled (mapped) in nextmessage
+                        newnode.release()
+                        #xml has no envelope checks or confirmations: keep only what is needed to count the messages.
+                        newnode.record = {'BOTSID':newnode.record['BOTSID'],'BOTSIDnr':newnode.record['BOTSIDnr']}
+            elif entitytype == 0:
+                if xmlnode.text:
+                    text = xmlnode.text.strip()
+                    if text:        #if xml element has content, add as field
+                        parentnode.record[xmlnode.tag] = text
+                if xmlnode.attrib:  #convert the xml-attributes of this 'xml-field' to fields in dict with attributemarker.
+                    parentnode.record.update(self._attributes2fields(xmlnode))
+            elif stack[-1][1] == 1 and self.ta_info['checkunknownentities']:    #not for xml elements within the unknown record
+                self.add2errorlist('[S02]%(linpos)s: Unknown xml-tag "%(recordunkown)s" (within "%(record)s") in message.\n'%
+                                    {'linpos':parentnode.linpos(),'recordunkown':xmlnode.tag,'record':parentnode.record['BOTSID']})
+
+    @staticmethod
+    def _envelopenode(stack):
+        ''' when streaming: node tree of the records above the message, without the messages.
+            records are shared with the nodes being read, so fields after the message are added when read.
+        '''
+        envelope = parent = node.Node(record=stack[0][3].record)
+        for envelope_content in stack[1:]:
+            child = node.Node(record=envelope_content[3].record)
+            parent.append(child)
+            parent = child
+        return envelope
 
     def _etreenode2botstreenode(self,xmlnode):
         ''' build a basic dict from xml-node. Add BOTSID, xml-attributes (of 'record'), xmlnode.text as BOTSCONTENT.'''
-        build = dict((xmlnode.tag + self.ta_info['attributemarker'] + key,value) for key,value in xmlnode.items() if value)   #convert xml attributes to fields.
+        build = dict(self._attributes2fields(xmlnode)) if xmlnode.attrib else {}    #convert xml attributes to fields.
         build['BOTSID'] = xmlnode.tag
         if xmlnode.text:
-            build['BOTSCONTENT'] = xmlnode.text
+            text = xmlnode.text.strip()
+            if text:
+                build['BOTSCONTENT'] = text
         return build
 
-    def _entitytype(self,xmlchildnode):
-        ''' check if xmlchildnode is field (or record)'''
-        structure_level = self.stack[-1]
-        if LEVEL in structure_level:
-            for structure_record in structure_level[LEVEL]:   #find xmlchildnode in structure
-                if xmlchildnode.tag == structure_record[ID]:
-                    self.stack.append(structure_record)
-                    return 1
-        #tag not in structure. Check for children; Return 2 if has children
-        if len(xmlchildnode):
-            return 2
-        return 0
-
-    def stackinit(self):
-        self.stack = [self.defmessage.structure[0],]     #stack to track where we are in stucture of grammar
+    def _attributes2fields(self,xmlnode):
+        ''' generator: (field, value) for each xml-attribute of xmlnode that has a value.'''
+        for key,value in xmlnode.items():
+            value = value.strip()
+            if value:
+                yield xmlnode.tag + self.ta_info['attributemarker'] + key, value
+
+    @staticmethod
+    def _recorddefinition(record_definition,tag):
+        ''' find xml element with tag in the level of record_definition; returns record_definition of xml element or None (field or unknown).'''
+        for structure_record in record_definition.get(LEVEL,()):
+            if tag == structure_record[ID]:
+                return structure_record
+        return None
+
+    @staticmethod
+    def _entitytype_haschildren():
+        ''' xml element that is not in grammar has children: is an unknown record. Returns entitytype, record_definition.'''
+        return 2,None
+
+    def _checkmessagenode(self,messagenode,record_definition):
+        ''' when streaming: check one message (as checkmessage does for the whole tree) before it is handled and released.'''
+        if not self.ta_info['has_structure']:
+            return
+        self._checkifrecordsingrammar(messagenode,record_definition,self.defmessage.grammarname)
+        self._canonicaltree(messagenode,record_definition)
+
+    def _canonicaltree(self,node_instance,structure):
+        ''' when streaming: messages are checked when read; do not check these again when the whole tree is checked.'''
+        if self.streaming and node_instance.structure is not None:
+            return
+        super(xml,self)._canonicaltree(node_instance,structure)
+
+    def _countmessages(self,filename,extra_character_entity):
+        ''' when streaming: count the messages in xml file before reading: xml elements with the tags of nextmessage at the depth of the message.
+            (fields in nextmessage are not checked.) No xml elements are built.
+        '''
+        paths = set(tuple(part['BOTSID'] for part in mpaths) for mpaths in (self.defmessage.nextmessage,self.defmessage.nextmessage2) if mpaths is not None)
+        counter = _XmlMessageCounter(paths,self.records_need_children)
+        parser = self._xmlparser(extra_character_entity,target=counter)
+        with open(filename,'rb') as xmlfile:
+            for block in iter(lambda: xmlfile.read(2**20),b''):
+                parser.feed(block)
+        return parser.close()
+
+class _XmlMessageCounter(object):
+    ''' target for xml parser: counts the xml elements with tag-path in paths.'''
+    def __init__(self,paths,records_need_children):
+        self.paths = paths
+        self.depths = set(len(path) for path in paths)
+        self.records_need_children = records_need_children
+        self.stack = []     #[tag, has children] from root to current element
+        self.count = 0
+
+    def start(self,tag,attrib):
+        if self.stack:
+            self.stack[-1][1] = True
+        self.stack.append([tag,False])
+
+    def end(self,tag):
+        if len(self.stack) in self.depths:
+            path = tuple(element_tag for element_tag,haschildren in self.stack)
+            if path in self.paths and (self.stack[-1][1] or not self.records_need_children):
+                self.count += 1
+        self.stack.pop()
+
+    def close(self):
+        return self.count
 
 class xmlnocheck(xml):
     ''' class for ediobjects in XML. Uses ElementTree'''
+    records_need_children = True    #xml element is a record only if it has children
+
     def checkmessage(self,node_instance,defmessage,subtranslation=False):
         pass
 
-    def _entitytype(self,xmlchildnode):
-        if len(xmlchildnode):
-            self.stack.append(0)
-            return 1
-        return 0
+    def _checkmessagenode(self,messagenode,record_definition):
+        pass
+
+    @staticmethod
+    def _recorddefinition(record_definition,tag):
+        return None
+
+    @staticmethod
+    def _entitytype_haschildren():
+        ''' xml element with children is a record. '''
+        return 1,{}
+
+class JsonListReader(object):
+    ''' read json file with a list of messages incrementally: the file is read in chunks, one list item is decoded at a time.
+        forms of list: [{,,,},{,,,}] or {rootdict:[{,,,},{,,,}]}.
+        islist: file starts as a list of messages. Is set to False if rootdict turns out to have other keys: {rootdict:[{,,,}],otherkey:...}.
+    '''
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self,filename,charset,errors,name,chunksize=2**16):
+        self.jsonfile = botslib.opendata(filename,'r',charset,errors)
+        self.chunksize = chunksize
+        self.decoder = simplejson.JSONDecoder()
+        self.buffer = ''
+        self.index = 0
+        self.eof = False
+        self.closing = self._liststart(name)
+        self.islist = self.closing is not None
+
+    def close(self):
+        self.jsonfile.close()
+
+    def _read(self):
+        ''' read next chunk; read at least as much as is buffered, so decoding a big list item is not retried too often.'''
+        chunk = self.jsonfile.read(max(self.chunksize,len(self.buffer) - self.index))
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.index:] + chunk
+        self.index = 0
+
+    def _nextchar(self):
+        ''' skip white space; return next char (empty string at end of file).'''
+        while True:
+            self.index = self.WHITESPACE.match(self.buffer,self.index).end()
+            if self.index < len(self.buffer) or self.eof:
+                return self.buffer[self.index:self.index+1]
+            self._read()
+
+    def _decode(self):
+        ''' decode json value at index; read more if value is not complete (eg number at end of buffer).'''
+        while True:
+            try:
+                value,end = self.decoder.raw_decode(self.buffer,self.index)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                if end < len(self.buffer) or self.eof:
+                    self.index = end
+                    return value
+            self._read()
+
+    def _liststart(self,name):
+        ''' read start of list. Returns what is expected after the list: '' for [{,,,}], '}' for {rootdict:[{,,,}]}; None if not a list of messages.'''
+        char = self._nextchar()
+        if char == '[':
+            self.index += 1
+            return ''
+        if char == '{':
+            self.index += 1
+            if self._nextchar() == '"' and self._decode() == name and self._nextchar() == ':':
+                self.index += 1
+                if self._nextchar() == '[':
+                    self.index += 1
+                    return '}'
+        return None
+
+    def __iter__(self):
+        ''' generator; yields the list items (python objects).'''
+        try:
+            if self._nextchar() == ']':
+                self.index += 1
+            else:
+                while True:
+                    self._nextchar()
+                    yield self._decode()
+                    char = self._nextchar()
+                    self.index += 1
+                    if char == ']':
+                        break
+                    if char != ',':
+                        raise botslib.InMessageError('[J57]: content of json not OK. Expected "," or "]" in list of messages, found "%(char)s".',
+                                                        {'char':char})
+            if self.closing:
+                if self._nextchar() != self.closing:
+                    self.islist = False     #rootdict has other keys
+                    return
+                self.index += 1
+            if self._nextchar():
+                raise botslib.InMessageError('[J57]: content of json not OK. Found data after end of list of messages.')
+        finally:
+            self.close()
 
-    def stackinit(self):
-        self.stack = [0,]     #stack to track where we are in structure of grammar
 
 class json(Inmessage):
     def initfromfile(self):
         self.messagegrammarread(typeofgrammarfile='grammars')
         name_root_dict_according_to_grammar = self._getrootid()
+        #list of messages (option 1, 2 and 4 below) is read incrementally, one message at a time.
+        self.jsonreader = JsonListReader(self.ta_info['filename'],self.ta_info['charset'],self.ta_info['checkcharsetin'],name_root_dict_according_to_grammar)
+        if self.jsonreader.islist:
+            self.root = node.Node()  #initialise new node.
+            self._envelopes = []     #json has no envelope records
+            if (self.ta_info.get('streaming') and self.defmessage.nextmessage is None and not self.ta_info.get('pass_all',False)
+                    and not callable(self.ta_info.get('preprocess_nodes'))):
+                #json file is read in nextmessage. Each message is passed to mapping script and released.
+                self.streaming = True
+                self.ta_info['total_number_of_messages'] = self._countmessages(name_root_dict_according_to_grammar)
+                return
+            self._checkfilesize()
+            for messagenode in self._parsemessages():   #not streaming: nothing is yielded
+                pass
+            if self.jsonreader.islist:
+                return
+        self.jsonreader.close()
+        #not a list of messages: read and convert whole json file
+        self._checkfilesize()
         self._readcontent_edifile()
         jsonobject = simplejson.loads(self.rawinput)
         del self.rawinput
@@ -1630,6 +2476,64 @@ class json(Inmessage):
                 self.ta_info.update(child.queries)
                 break
 
+    def _parsemessages(self):
+        ''' generator; read list of messages incrementally. When streaming: yields each message (node) when it is read and checked.
+            Not streaming: messages are added to root; if not a list of messages after all (see JsonListReader) root is not used.
+        '''
+        name_root_dict_according_to_grammar = self._getrootid()
+        IsNamed = None
+        count = 0
+        for jsonobject in self.jsonreader:
+            if not isinstance(jsonobject,dict):
+                if self.jsonreader.closing and not isinstance(jsonobject,(basestring,int,long,float)) and not self.ta_info['checkunknownentities']:
+                    continue    #as in _dojsonlist
+                raise botslib.InMessageError('[J56]: content of json not OK. Content is expected to be a list of objects, but is list of something else.')
+            if not self.jsonreader.closing:
+                if IsNamed is None:     #first message determines if messages are named
+                    IsNamed = len(jsonobject)==1 and name_root_dict_according_to_grammar in jsonobject
+                if IsNamed:
+                    # 1.List of messages, named: [{rootdict:{,,,}},{rootdict:{,,,}},]
+                    jsonobject = jsonobject[name_root_dict_according_to_grammar]
+                # else 2. List of messages, name via grammar: [{,,,},{,,,},].
+            # else 4. list of messages, named: {rootdict:[{,,,},{,,,},]}
+            messagenode = self._dojsonobject(jsonobject,name_root_dict_according_to_grammar)
+            if not messagenode:
+                continue
+            if self.streaming:
+                count += 1
+                self._checkmessagenode(messagenode)
+                if count == 1:
+                    self.ta_info.update(messagenode.queries)
+                yield messagenode
+            else:
+                self.root.children.append(messagenode)
+        if not self.jsonreader.islist:
+            if self.streaming:
+                raise botslib.InMessageError('[J53]: content of json not OK. Root object "%(name)s" has other keys than the list of messages.',
+                                                {'name':name_root_dict_according_to_grammar})
+            return
+        #check message(s) with grammar
+        if self.streaming:
+            if self.ta_info['has_structure']:
+                self._checkcountmessages(count,self.defmessage)
+        else:
+            self.checkmessage(self.root,self.defmessage)
+            for child in self.root.children:
+                self.ta_info.update(child.queries)
+                break
+
+    def _checkmessagenode(self,messagenode):
+        ''' when streaming: check one message (as checkmessage does for each message) before it is passed to mapping script.'''
+        if not self.ta_info['has_structure']:
+            return
+        self._checkonemessage(messagenode,self.defmessage,False)
+
+    def _countmessages(self,name):
+        ''' when streaming: count the messages in json file before reading, by decoding the list one item at a time.
+            (empty messages are counted as well.)
+        '''
+        return sum(1 for jsonobject in JsonListReader(self.ta_info['filename'],self.ta_info['charset'],self.ta_info['checkcharsetin'],name))
+
     def _getrootid(self):
         return self.defmessage.structure[0][ID]
 
@@ -3,8 +3,12 @@ from __future__ import print_function
 import sys
 import os
 import time
+import heapq
+import collections
+import logging
 import subprocess
 import threading
+import multiprocessing
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import xmlrpc.client as xmlrpclib
 from xmlrpc.server import SimpleXMLRPCServer
@@ -12,10 +16,13 @@ from xmlrpc.server import SimpleXMLRPCServer
 from . import botsinit
 from . import botslib
 from . import botsglobal
+from . import engine
 
 PRIORITY = 0
 JOBNUMBER = 1
 TASK = 2
+ADDED = 3       #time job is added to queue
+REMOVED = 4     #job is removed from queue (priority is changed)
 start_time = time.time()
 
 class HealthCheckHandler(BaseHTTPRequestHandler):
@@ -35,42 +42,201 @@ def health():
     uptime = time.time() - start_time
     return {"status": "OK", "uptime": uptime}
 
+def engineconfigdir(task_to_run):
+    ''' if task is bots-engine: return its config directory; else None.'''
+    if len(task_to_run) < 2 or os.path.basename(task_to_run[1]) not in ('bots-engine.py','bots-engine'):
+        return None
+    configdir = 'config'
+    for arg in task_to_run[2:]:
+        if arg.startswith('-c'):
+            configdir = arg[2:]
+    return configdir
+
+def conflictkeys(task_to_run,parallel_configdir=None):
+    ''' returns (exclusive keys, shared keys) of job. A job does not run at the same time as a job with a common exclusive key,
+        or with an exclusive key that is a shared key of the other job.
+        bots-engine: exclusive key per config directory (bots-engine checks this via port and database lock).
+        option parallel_routes (for config directory of jobqueue server): run of routes (botslib.is_routerun) has an exclusive
+        key per route and the config directory as shared key. So different routes run in parallel, a route is never run twice
+        at the same time, and other runs of bots-engine (eg all routes, cleanup) run on their own.
+        Other jobs: same job is not run twice at the same time.
+    '''
+    configdir = engineconfigdir(task_to_run)
+    if configdir is None:
+        return frozenset([tuple(task_to_run)]),frozenset()
+    if configdir == parallel_configdir:
+        try:
+            dummy,commandstorun,routestorun,do_cleanup_parameter = engine.parse_arguments(task_to_run[2:])
+        except SystemExit:      #not valid; bots-engine stops at once
+            pass
+        else:
+            if botslib.is_routerun(commandstorun,routestorun,do_cleanup_parameter):
+                return frozenset(('bots-engine',configdir,idroute) for idroute in routestorun),frozenset([('bots-engine',configdir)])
+    return frozenset([('bots-engine',configdir)]),frozenset()
+
+def conflicts(exclusive,shared,otherexclusive,othershared):
+    ''' check if job (exclusive and shared keys) conflicts with other job(s) (their exclusive and shared keys).'''
+    return not (exclusive.isdisjoint(otherexclusive) and exclusive.isdisjoint(othershared) and shared.isdisjoint(otherexclusive))
+
 class Jobqueue(object):
-    def __init__(self,logger):
-        self.jobqueue = []
+    ''' queue of jobs: heap of [priority,jobnumber,task,added,removed]; lowest priority first, for same priority first added first.
+        queued jobs are found by task for duplicates and change of priority: old entry is marked as removed and stays in heap.
+        a job is not given to a launcher if it conflicts with a running job or with an earlier job in queue (see conflictkeys).
+        parallel_configdir: config directory of jobqueue server if option parallel_routes is used.
+    '''
+    def __init__(self,logger,parallel_configdir=None):
+        self.jobqueue = []          #heap
+        self.entries = {}           #task (as tuple) -> entry in heap
+        self.running = {}           #jobnumber -> (entry,exclusive keys,shared keys,starttime)
+        self.runningkeys = set()    #exclusive keys of running jobs
+        self.runningshared = collections.Counter()     #shared keys of running jobs
+        self.parallel_configdir = parallel_configdir
+        self.statistics = {}        #priority -> statistics of wait time and run time
         self.jobcounter = 0
         self.logger = logger
 
     def addjob(self,task,priority):
-        for job in self.jobqueue:
-            if job[TASK] == task:
-                if job[PRIORITY] != priority:
-                    job[PRIORITY] = priority
-                    self.logger.info('Duplicate job, changed priority to %(priority)s: %(task)s',{'priority':priority,'task':task})
-                    self._sort()
-                    return 0
-                else:
-                    self.logger.info('Duplicate job not added: %(task)s',{'task':task})
-                    return 4
+        entry = self.entries.get(tuple(task))
+        if entry is not None:
+            if entry[PRIORITY] != priority:
+                newentry = [priority,entry[JOBNUMBER],task,entry[ADDED],False]
+                entry[REMOVED] = True
+                self.entries[tuple(task)] = newentry
+                heapq.heappush(self.jobqueue,newentry)
+                self.logger.info('Duplicate job, changed priority to %(priority)s: %(task)s',{'priority':priority,'task':task})
+                self._logqueue()
+                return 0
+            else:
+                self.logger.info('Duplicate job not added: %(task)s',{'task':task})
+                return 4
         self.jobcounter += 1
-        self.jobqueue.append([priority, self.jobcounter, task])
+        entry = [priority,self.jobcounter,task,time.time(),False]
+        self.entries[tuple(task)] = entry
+        heapq.heappush(self.jobqueue,entry)
         self.logger.info('Added job %(job)s, priority %(priority)s: %(task)s',{'job':self.jobcounter,'priority':priority,'task':task})
-        self._sort()
+        self._logqueue()
         return 0
 
     def clearjobq(self):
         del self.jobqueue[:]
+        self.entries.clear()
         self.logger.info('Job queue cleared.')
         return 0
 
     def getjob(self):
-        if len(self.jobqueue):
-            return self.jobqueue.pop()
+        ''' get first job that does not conflict with running jobs; return [priority,jobnumber,task] or 0.
+            launcher should call jobdone when job is finished.
+        '''
+        skipped = []
+        skippedkeys = set()         #a job does not start before an earlier job it conflicts with (eg run of all routes waits for running routes)
+        skippedshared = set()
+        job = 0
+        while self.jobqueue:
+            entry = heapq.heappop(self.jobqueue)
+            if entry[REMOVED]:
+                continue
+            exclusive,shared = conflictkeys(entry[TASK],self.parallel_configdir)
+            if conflicts(exclusive,shared,self.runningkeys,self.runningshared) or conflicts(exclusive,shared,skippedkeys,skippedshared):
+                skipped.append(entry)
+                skippedkeys |= exclusive
+                skippedshared |= shared
+                continue
+            del self.entries[tuple(entry[TASK])]
+            self.runningkeys |= exclusive
+            self.runningshared.update(shared)
+            self.running[entry[JOBNUMBER]] = (entry,exclusive,shared,time.time())
+            job = entry[:ADDED]
+            break
+        for entry in skipped:
+            heapq.heappush(self.jobqueue,entry)
+        return job
+
+    def jobdone(self,jobnumber):
+        ''' job is finished: other jobs with same conflictkeys can run; update statistics.'''
+        if jobnumber not in self.running:
+            return 1
+        entry,exclusive,shared,starttime = self.running.pop(jobnumber)
+        self.runningkeys -= exclusive
+        self.runningshared -= collections.Counter(shared)
+        waittime = starttime - entry[ADDED]
+        runtime = time.time() - starttime
+        statistics = self.statistics.setdefault(entry[PRIORITY],{'jobs':0,'waittime_total':0.0,'waittime_max':0.0,'runtime_total':0.0,'runtime_max':0.0})
+        statistics['jobs'] += 1
+        statistics['waittime_total'] += waittime
+        statistics['waittime_max'] = max(statistics['waittime_max'],waittime)
+        statistics['runtime_total'] += runtime
+        statistics['runtime_max'] = max(statistics['runtime_max'],runtime)
         return 0
 
-    def _sort(self):
-        self.jobqueue.sort(reverse=True)
-        self.logger.debug('Job queue changed. New queue: %(queue)s',{'queue':''.join(['\n    ' + repr(job) for job in self.jobqueue])})
+    def getstatistics(self):
+        ''' statistics per priority (wait time and run time in seconds); number of queued and running jobs.'''
+        priorities = {}
+        for priority,statistics in self.statistics.items():
+            statistics = statistics.copy()
+            statistics['waittime_average'] = statistics['waittime_total'] / statistics['jobs']
+            statistics['runtime_average'] = statistics['runtime_total'] / statistics['jobs']
+            priorities[str(priority)] = statistics     #xmlrpc: keys are strings
+        return {'queued':len(self.entries),'running':len(self.running),'priorities':priorities}
+
+    def _logqueue(self):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Job queue changed. New queue: %(queue)s',{'queue':''.join(['\n    ' + repr(entry[:ADDED]) for entry in sorted(self.entries.values())])})
+
+
+class EngineWorkers(object):
+    ''' warm bots-engine processes (engine.worker): initialised once, run jobs for bots-engine without starting a new process.
+        a worker is replaced by a new one when the worker stops (after a number of jobs, memory use, changed user scripts).
+    '''
+    def __init__(self,logger,configdir,number):
+        self.logger = logger
+        self.configdir = configdir
+        self.context = multiprocessing.get_context('spawn')    #no fork: jobqueue server has threads
+        self.lock = threading.Lock()
+        self.idle = [self._start() for i in range(number)]
+
+    def _start(self):
+        parent_connection,child_connection = self.context.Pipe()
+        process = self.context.Process(target=engine.worker,args=(child_connection,self.configdir),name='bots-engine-worker')
+        process.daemon = True
+        process.start()
+        child_connection.close()
+        self.logger.info('Started bots-engine worker %(pid)s.',{'pid':process.pid})
+        return process,parent_connection
+
+    def canrun(self,task_to_run):
+        ''' workers can run task if task is bots-engine with same configdir.'''
+        return engineconfigdir(task_to_run) == self.configdir
+
+    def run(self,task_to_run):
+        ''' run task in a worker; returns sysexit code of bots-engine.'''
+        with self.lock:
+            process,connection = self.idle.pop() if self.idle else self._start()
+        try:
+            connection.send(task_to_run[2:])
+            result,stop = connection.recv()
+        except (EOFError,OSError) as msg:   #worker has died
+            self.logger.error('Bots-engine worker %(pid)s stopped unexpectedly: %(msg)s',{'pid':process.pid,'msg':msg})
+            result,stop = 1,True
+        if stop:
+            connection.close()
+            process.join(10)
+            with self.lock:
+                self.idle.append(self._start())     #new worker gets warm before next job
+        else:
+            with self.lock:
+                self.idle.append((process,connection))
+        if result is None:  #job not run by worker (user scripts changed): run with new worker
+            return self.run(task_to_run)
+        return result
+
+    def stop(self):
+        with self.lock:
+            for process,connection in self.idle:
+                try:
+                    connection.send(None)
+                except (EOFError,OSError):
+                    pass
+            self.idle = []
 
 
 def action_when_time_out(logger,maxruntime,jobnumber,task_to_run):
@@ -80,7 +246,7 @@ def action_when_time_out(logger,maxruntime,jobnumber,task_to_run):
                                     'job':jobnumber,'maxruntime':maxruntime,'task':task_to_run
                                 })
 
-def launcher(logger,port,lauchfrequency,maxruntime):
+def launcher(logger,port,lauchfrequency,maxruntime,engineworkers=None):
     print(f"DEBUG: Launcher function started with port={port}, freq={lauchfrequency}")
     DEVNULL = open(os.devnull, 'wb')
     print(f"DEBUG: Creating XML-RPC client to localhost:{port}")
@@ -98,12 +264,18 @@ def launcher(logger,port,lauchfrequency,maxruntime):
                 priority, jobnumber, task_to_run = job
                 logger.info('Starting job %(job)s',{'job':jobnumber})
                 starttime = time.time()
-                process = subprocess.Popen(task_to_run, stdout=DEVNULL, stderr=DEVNULL)
                 timer = threading.Timer(maxseconds, action_when_time_out,
                                         args=(logger, maxruntime, jobnumber, task_to_run))
                 timer.start()
-                result = process.wait()
-                timer.cancel()
+                try:
+                    if engineworkers is not None and engineworkers.canrun(task_to_run):
+                        result = engineworkers.run(task_to_run)
+                    else:
+                        process = subprocess.Popen(task_to_run, stdout=DEVNULL, stderr=DEVNULL)
+                        result = process.wait()
+                finally:
+                    timer.cancel()
+                    xmlrpcclient.jobdone(jobnumber)     #conflicting jobs can run now
                 time_taken = time.time() - starttime
                 logger.info('Finished job %(job)s, elapsed time %(time_taken)s, result %(result)s',
                             {'job':jobnumber,'time_taken':time_taken,'result':result})
@@ -160,14 +332,15 @@ def start():
     lauchfrequency = botsglobal.ini.getint('jobqueue','lauchfrequency',5)
     maxruntime = botsglobal.ini.getint('settings','maxruntime',60)
     print(f"DEBUG: Config loaded - freq={lauchfrequency}, maxruntime={maxruntime}")
+    nr_engine_workers = botsglobal.ini.getint('jobqueue','engine_workers',0)
+    engineworkers = EngineWorkers(logger,configdir,nr_engine_workers) if nr_engine_workers > 0 else None
 
-    print(f"DEBUG: About to create launcher thread with port={port}, freq={lauchfrequency}, maxruntime={maxruntime}")
-    launcher_thread = threading.Thread(name='launcher', target=launcher,
-                                       args=(logger, port, lauchfrequency, maxruntime))
-    launcher_thread.daemon = True
-    print("DEBUG: Starting launcher thread...")
-    launcher_thread.start()
-    print("DEBUG: Launcher thread started, logging message...")
+    nr_launchers = max(1,botsglobal.ini.getint('jobqueue','launchers',1))
+    for counter in range(nr_launchers):     #each launcher runs one job at a time
+        launcher_thread = threading.Thread(name='launcher%s'%counter, target=launcher,
+                                           args=(logger, port, lauchfrequency, maxruntime, engineworkers))
+        launcher_thread.daemon = True
+        launcher_thread.start()
     logger.info('Jobqueue launcher started.')
     
     print("DEBUG: About to log server started message...")
@@ -180,13 +353,15 @@ def start():
     ).start()
     
     server = SimpleXMLRPCServer(('0.0.0.0', port), logRequests=False)
-    server.register_instance(Jobqueue(logger))
+    server.register_instance(Jobqueue(logger,configdir if botslib.parallel_routes() else None))
     server.register_function(health, 'health')
     
     try:
         server.serve_forever()
     except (KeyboardInterrupt, SystemExit):
         pass
+    if engineworkers is not None:
+        engineworkers.stop()
     sys.exit(0)
 
 if __name__ == '__main__':
@@ -19,6 +19,7 @@ class Message(object):
         self.messagetypetxt = ''    #used in reporting errors.
         self.messagecount = 0       #count messages in edi file; used in reporting errors.
         self.syntax = {}
+        self._fieldformatters = {}  #formatter (check/format value) per field_definition; see _fieldformatter
 
 
     def add2errorlist(self,errortxt):
@@ -94,6 +95,10 @@ class Message(object):
             for childnode in node_instance.children:
                 count += 1
                 self._checkonemessage(childnode,defmessage,subtranslation)
+        self._checkcountmessages(count,defmessage)
+
+    def _checkcountmessages(self,count,defmessage):
+        ''' check number of messages (occurences of root record) with grammar.'''
         if count < defmessage.structure[0][MIN]:
             self.add2errorlist('[S03] Root record "%(mpath)s" occurs %(count)d times, min is %(mincount)d.\n'%
                                 {'mpath':defmessage.structure[0][ID],'count':count,'mincount':defmessage.structure[0][MIN]})
@@ -179,14 +184,13 @@ class Message(object):
         if node_instance.structure is None:
             node_instance.structure = structure
         if LEVEL in structure:
+            childgroups = self._groupchildren(node_instance)
             for record_definition in structure[LEVEL]:  #for every record_definition (in grammar) of this level
-                count = 0                           #count number of occurences of record
-                for childnode in node_instance.children:            #for every node in mpathtree; SPEED: delete nodes from list when found
-                    if childnode.record['BOTSID'] != record_definition[ID] or childnode.record['BOTSIDnr'] != record_definition[BOTSIDNR]:   #if it is not the right NODE":
-                        continue
-                    count += 1
+                childnodes = childgroups.get((record_definition[ID],record_definition[BOTSIDNR]),())
+                count = len(childnodes)             #number of occurences of record
+                for childnode in childnodes:
                     self._canonicaltree(childnode,record_definition)         #use rest of index in deeper level
-                    sortednodelist.append(childnode)
+                sortednodelist.extend(childnodes)
                 if record_definition[MIN] > count:
                     self.add2errorlist('[S03]%(linpos)s: Record "%(mpath)s" occurs %(count)d times, min is %(mincount)d.\n'%
                                         {'linpos':node_instance.linpos(),'mpath':self.mpathformat(record_definition[MPATH]),'count':count,'mincount':record_definition[MIN]})
@@ -195,12 +199,27 @@ class Message(object):
                                         {'linpos':node_instance.linpos(),'mpath':self.mpathformat(record_definition[MPATH]),'count':count,'maxcount':record_definition[MAX]})
             node_instance.children = sortednodelist
 
+    @staticmethod
+    def _groupchildren(node_instance):
+        ''' group child nodes by record (BOTSID, BOTSIDnr) in one pass; order of nodes within a group is kept.
+            Returns dict: (BOTSID, BOTSIDnr) -> list of child nodes.
+        '''
+        childgroups = {}
+        for childnode in node_instance.children:
+            key = (childnode.record['BOTSID'],childnode.record['BOTSIDnr'])
+            if key in childgroups:
+                childgroups[key].append(childnode)
+            else:
+                childgroups[key] = [childnode]
+        return childgroups
+
     def _canonicalfields(self,node_instance,record_definition):
         ''' For all fields: check M/C, format.
             Fields are not sorted (a dict can not be sorted).
             Fields are never added.
         '''
         noderecord = node_instance.record
+        fieldformatter = self._fieldformatter
         for field_definition in record_definition[FIELDS]:       #loop over fields in grammar
             if field_definition[ISFIELD]:    #if field (no composite)
                 if field_definition[MAXREPEAT] == 1:    #if non-repeating
@@ -210,7 +229,7 @@ class Message(object):
                             self.add2errorlist('[F02]%(linpos)s: Record "%(mpath)s" field "%(field)s" is mandatory.\n'%
                                                 {'linpos':node_instance.linpos(),'mpath':self.mpathformat(record_definition[MPATH]),'field':field_definition[ID]})
                         continue
-                    noderecord[field_definition[ID]] = self._formatfield(value,field_definition,record_definition,node_instance)
+                    noderecord[field_definition[ID]] = fieldformatter(field_definition)(value,record_definition,node_instance)
                 else: #repeating field;
                     #a list of values; values can be empty or None; at least one field should have value, else dropped
                     valuelist = noderecord.get(field_definition[ID])
@@ -234,7 +253,7 @@ class Message(object):
                             value = unicode(value).strip()
                             if value:
                                 repeating_field_has_data = True
-                        newlist.append(self._formatfield(value,field_definition,record_definition,node_instance))
+                        newlist.append(fieldformatter(field_definition)(value,record_definition,node_instance))
                     if not repeating_field_has_data:
                         if field_definition[MANDATORY]:
                             self.add2errorlist('[F43]%(linpos)s: Record "%(mpath)s" repeating field "%(field)s" is mandatory.\n'%
@@ -261,7 +280,7 @@ class Message(object):
                                 self.add2errorlist('[F04]%(linpos)s: Record "%(mpath)s" subfield "%(field)s" is mandatory.\n'%
                                                     {'linpos':node_instance.linpos(),'mpath':self.mpathformat(record_definition[MPATH]),'field':grammarsubfield[ID]})
                             continue
-                        noderecord[grammarsubfield[ID]] = self._formatfield(value,grammarsubfield,record_definition,node_instance)
+                        noderecord[grammarsubfield[ID]] = fieldformatter(grammarsubfield)(value,record_definition,node_instance)
                 else:   #if repeating composite: list of dicts
                     valuelist = noderecord.get(field_definition[ID])
                     if valuelist is None:   #empty lists are catched in node.put()
@@ -308,7 +327,7 @@ class Message(object):
                                         self.add2errorlist('[F46]%(linpos)s: Record "%(mpath)s" subfield "%(field)s" in repeating composite is mandatory.\n'%
                                                             {'linpos':node_instance.linpos(),'mpath':self.mpathformat(record_definition[MPATH]),'field':grammarsubfield[ID]})
                                     continue
-                                comp[grammarsubfield[ID]] = self._formatfield(value,grammarsubfield,record_definition,node_instance)
+                                comp[grammarsubfield[ID]] = fieldformatter(grammarsubfield)(value,record_definition,node_instance)
                         else:
                             comp = {}
                         newlist.append(comp)
@@ -322,6 +341,24 @@ class Message(object):
                         noderecord[field_definition[ID]] = newlist
 
 
+    def _fieldformatter(self,field_definition):
+        ''' get function formatter(value,structure_record,node_instance) to check and format value of field_definition.
+            formatter is made once for each field_definition (by _makefieldformatter).
+        '''
+        try:
+            return self._fieldformatters[id(field_definition)][1]
+        except KeyError:
+            formatter = self._makefieldformatter(field_definition)
+            self._fieldformatters[id(field_definition)] = (field_definition,formatter)  #field_definition is kept, so its id is not re-used
+            return formatter
+
+    def _makefieldformatter(self,field_definition):
+        ''' default: formatter uses _formatfield.'''
+        formatfield = self._formatfield
+        def formatter(value,structure_record,node_instance):
+            return formatfield(value,field_definition,structure_record,node_instance)
+        return formatter
+
     def _logmessagecontent(self,node_instance):
         botsglobal.logger.debug('Record "%(BOTSID)s":',node_instance.record)
         self._logfieldcontent(node_instance.record)    #handle fields of this record
@@ -530,7 +530,7 @@ class report(models.Model):
     type = StripCharField(max_length=35)
     status = models.BooleanField()
     rsrv1 = StripCharField(max_length=35,blank=True,null=True)  #added 20100501. 20131230: used to store the commandline for the run.
-    rsrv2 = models.IntegerField(null=True)                       #added 20100501.
+    rsrv2 = models.IntegerField(null=True)                       #added 20100501. used to store KB copied when receiving and archiving files.
     filesize = models.IntegerField(null=True)                    #added 20121030: total size of messages that have been translated.
     acceptance = models.IntegerField(null=True)                            #added 20130114:
     class Meta:
@@ -675,3 +675,16 @@ class routeschedule(models.Model):
             else:
                 return f"Every {self.interval} month(s)"
         return "Custom schedule"
+
+
+#***signal running bots-engines that user codes or partners are changed via GUI (transform caches these).
+CCODECACHE_DOMEIN = 'bots__ccodecache'     #counter in table uniek; same string is used in transform.py
+
+def codes_changed(sender=None,**kwargs):
+    ''' user codes or partners are changed: increase change counter.'''
+    if not uniek.objects.filter(domein=CCODECACHE_DOMEIN).update(nummer=models.F('nummer')+1):
+        uniek.objects.create(domein=CCODECACHE_DOMEIN,nummer=1)
+
+for _sender in (ccodetrigger,ccode,partner):
+    models.signals.post_save.connect(codes_changed,sender=_sender)
+    models.signals.post_delete.connect(codes_changed,sender=_sender)
@@ -1,5 +1,9 @@
 from __future__ import print_function
 import sys
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 try:
     import cdecimal as decimal
 except ImportError:
@@ -10,12 +14,168 @@ from . import botsglobal
 from .botsconfig import *
 
 
+class _FromLine(object):
+    ''' marker in CompactRecord: value is taken from fixed line. Stays the same object when copied/pickled.'''
+    __slots__ = ()
+    def __reduce__(self):
+        return '_FROMLINE'
+_FROMLINE = _FromLine()
+
+class CompactRecord(MutableMapping):
+    ''' record of a node (as dict), stored compact; used for incoming records with many fields (fixed, idoc).
+        fieldindex is shared by all records of a record definition: (dict field-ID->index, list of field-IDs, list of (start,end) in fixed line).
+        values of present fields are in a list (in order of fieldindex); a bitmask indicates which fields are present.
+        for fixed records a value is taken from the fixed line (as long as the value is not changed).
+        fields not in fieldindex are stored in a dict.
+    '''
+    __slots__ = ('_fieldindex','_line','_present','_values','_extra')
+    def __init__(self,fieldindex,line=None):
+        self._fieldindex = fieldindex
+        self._line = line
+        self._present = 0
+        self._values = []
+        self._extra = None
+        if line is not None:    #present are the fields that are not empty in fixed line
+            present = 0
+            for index,(start,end) in enumerate(fieldindex[2]):
+                if start is not None and line[start:end].strip():
+                    present |= 1 << index
+            self._present = present
+            self._values = [_FROMLINE] * present.bit_count()
+
+    @staticmethod
+    def make_fieldindex(fieldids,positions=None):
+        ''' make fieldindex for a record definition. positions: for each field (start,end) in fixed line or (None,None).'''
+        fieldids = list(fieldids)
+        if positions is None:
+            positions = [(None,None)] * len(fieldids)
+        return (dict((fieldid,index) for index,fieldid in enumerate(fieldids)),fieldids,list(positions))
+
+    def _value(self,index,position):
+        value = self._values[position]
+        if value is _FROMLINE:
+            start,end = self._fieldindex[2][index]
+            return self._line[start:end].strip()
+        return value
+
+    def __getitem__(self,key):
+        index = self._fieldindex[0].get(key)
+        if index is not None:
+            bit = 1 << index
+            if self._present & bit:
+                return self._value(index,(self._present & (bit-1)).bit_count())
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self,key,default=None):
+        index = self._fieldindex[0].get(key)
+        if index is not None:
+            bit = 1 << index
+            if self._present & bit:
+                return self._value(index,(self._present & (bit-1)).bit_count())
+            return default
+        if self._extra:
+            return self._extra.get(key,default)
+        return default
+
+    def __contains__(self,key):
+        index = self._fieldindex[0].get(key)
+        if index is not None:
+            return bool(self._present & (1 << index))
+        return bool(self._extra) and key in self._extra
+
+    def __setitem__(self,key,value):
+        index = self._fieldindex[0].get(key)
+        if index is not None:
+            bit = 1 << index
+            position = (self._present & (bit-1)).bit_count()
+            if self._present & bit:
+                if self._values[position] is not _FROMLINE or value != self._value(index,position):    #keep using fixed line if value is not changed
+                    self._values[position] = value
+            else:
+                self._values.insert(position,value)
+                self._present |= bit
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self,key):
+        index = self._fieldindex[0].get(key)
+        if index is not None:
+            bit = 1 << index
+            if self._present & bit:
+                del self._values[(self._present & (bit-1)).bit_count()]
+                self._present &= ~bit
+                return
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+            return
+        raise KeyError(key)
+
+    def _indexes(self):
+        ''' generator: indexes of present fields, in order.'''
+        present = self._present
+        while present:
+            lowest = present & -present
+            yield lowest.bit_length() - 1
+            present ^= lowest
+
+    def __iter__(self):
+        fieldids = self._fieldindex[1]
+        for index in self._indexes():
+            yield fieldids[index]
+        if self._extra:
+            for key in list(self._extra):
+                yield key
+
+    def __len__(self):
+        return self._present.bit_count() + (len(self._extra) if self._extra else 0)
+
+    def items(self):
+        fieldids = self._fieldindex[1]
+        terug = [(fieldids[index],self._value(index,position)) for position,index in enumerate(self._indexes())]
+        if self._extra:
+            terug.extend(self._extra.items())
+        return terug
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+#compiled mpaths for get/getloop: mpaths are checked and compiled once.
+#key: (kind of query, checklevel, items of each part of mpaths); value: [compiled parts, mpaths with BOTSIDnr, dict of structures checked with grammar]
+#compiled part: (value of BOTSID (or _ANY), tuple of other (key,value) to match, tuple of keys with value None)
+_compiled_mpaths = {}
+MAX_COMPILED_MPATHS = 10000
+CHILDINDEX_MINIMUM = 16     #use index of children by BOTSID for nodes with at least this number of children
+_ANY = object()
+_NOTFOUND = object()
+
+def _compile_mpaths(mpaths):
+    ''' compile mpaths: returns (compiled parts, mpaths with BOTSIDnr).'''
+    compiled = []
+    normalised = []
+    for part in mpaths:
+        part = dict(part)
+        part.setdefault('BOTSIDnr','1')
+        normalised.append(part)
+        items = tuple((key,value) for key,value in part.items() if key != 'BOTSID' and value is not None)
+        nonekeys = tuple(key for key,value in part.items() if value is None)
+        compiled.append((part.get('BOTSID',_ANY),items,nonekeys))
+    return tuple(compiled),tuple(normalised)
+
+
 class Node(object):
     ''' Node class for building trees in inmessage and outmessage
     '''
     #slots: python optimalisation to preserve memory. Disadv.: no dynamic attr in this class
     #in tests: for normal translations less memory and faster; no effect fo one-on-one translations.
-    __slots__ = ('record','children','_queries','linpos_info','structure')
+    __slots__ = ('record','children','_queries','linpos_info','structure','_childindex')
     def __init__(self,record=None,linpos_info=None):
         if record:
             record.setdefault('BOTSIDnr', '1')
@@ -24,6 +184,7 @@ class Node(object):
         self.linpos_info = linpos_info
         self._queries = None
         self.structure = None
+        self._childindex = None     #index of children by BOTSID, build when needed: (children,number of children,last child,dict BOTSID->list of children)
 
     def linpos(self):
         if self.linpos_info:
@@ -35,6 +196,15 @@ class Node(object):
         '''append child to node'''
         self.children.append(childnode)
 
+    def release(self):
+        ''' release the children of a parsed message when streaming.
+            record and messagetype are kept; these are used for checking envelope and confirmations.
+        '''
+        self.children = []
+        self._childindex = None
+        if self._queries:
+            self._queries = {'messagetype':self._queries.get('messagetype')}
+
     #********************************************************
     #*** queries ********************************************
     #********************************************************
@@ -231,55 +401,78 @@ class Node(object):
             if more than one value can be found: first one is returned
             starts searching in current node, then deeper
         '''
-        if Node.checklevel:
-            self._mpath_sanity_check(mpaths[:-1])
-            #sanity check of last part of mpaths: None only allowed in last section of Mpath; check last part
-            if not isinstance(mpaths[-1],dict):
-                raise botslib.MappingFormatError('Must be dicts in tuple: get(%(mpath)s)',{'mpath':mpaths})
-            if 'BOTSID' not in mpaths[-1]:
-                raise botslib.MappingFormatError('Last section without "BOTSID": get(%(mpath)s)',{'mpath':mpaths})
-            count = 0
-            for key,value in mpaths[-1].items():
-                if not isinstance(key,basestring):
-                    raise botslib.MappingFormatError('Keys must be strings in last section: get(%(mpath)s)',{'mpath':mpaths})
-                if value is None:
-                    count += 1
-                elif not isinstance(value,basestring):
-                    raise botslib.MappingFormatError('Values must be strings (or none) in last section: get(%(mpath)s)',{'mpath':mpaths})
-            if count > 1:
-                raise botslib.MappingFormatError('Max one "None" in last section: get(%(mpath)s)',{'mpath':mpaths})
-        for part in mpaths:
-            part.setdefault('BOTSIDnr', '1')
-        if Node.checklevel == 2:
-            self._mpath_grammar_check(mpaths)
-        terug =  self._getcore(mpaths)
+        terug =  self._getcore(self._compiledmpaths('get',mpaths),0)
         botsglobal.logmap.debug('"%(terug)s" for get%(mpaths)s',{'terug':terug,'mpaths':unicode(mpaths)})
         return terug
 
-    def _getcore(self,mpaths):
-        if len(mpaths) != 1:    #node is not end-node
-            for key,value in mpaths[0].items():          #check all items in mpath;
-                if key not in self.record or value != self.record[key]:  #does not match/is not right node
-                    return None
-            else:   #all items in mpath are matched and OK; recursuve search
-                for childnode in self.children:
-                    terug =  childnode._getcore(mpaths[1:]) #recursive search for rest of mpaths
-                    if terug is not None:
-                        return terug
-                else:   #nothing found in children
-                    return None
-        else:   #node is end-node
-            terug = 1 #default return value: if there is no 'None' in the mpath, but everything is matched, 1 is returned (like True)
-            for key,value in mpaths[0].items():          #check all items in mpath;
-                if key not in self.record:  #does not match/is not right node
-                    return None
-                elif value is None:   #item has None-value; remember this value because this might be the right node
-                    terug = self.record[key][:]    #copy to avoid memory problems
-                elif value != self.record[key]:   #compare values
-                    return None     #does not match/is not right node
-            else:   #all keys/values in this mpathr are matched and OK.
-                return terug        #either the remembered value is returned or 1 (as a boolean, indicated 'found)
-
+    def _getcore(self,parts,level):
+        botsid,items,nonekeys = parts[level]
+        record = self.record
+        if botsid is not _ANY and record.get('BOTSID',_NOTFOUND) != botsid:  #does not match/is not right node
+            return None
+        for key,value in items:          #check all items in mpath;
+            if record.get(key,_NOTFOUND) != value:  #does not match/is not right node
+                return None
+        if level + 1 < len(parts):    #node is not end-node
+            if nonekeys:    #'None' only in last section of mpath
+                return None
+            #all items in mpath are matched and OK; recursive search
+            for childnode in self._childnodes(parts[level+1][0]):
+                terug =  childnode._getcore(parts,level+1) #recursive search for rest of mpaths
+                if terug is not None:
+                    return terug
+            return None     #nothing found in children
+        #node is end-node
+        terug = 1 #default return value: if there is no 'None' in the mpath, but everything is matched, 1 is returned (like True)
+        for key in nonekeys:    #item has None-value; return this value
+            terug = record.get(key)
+            if terug is None:
+                return None
+        return terug        #either the value is returned or 1 (as a boolean, indicated 'found)
+
+    def _childnodes(self,botsid):
+        ''' children of node that can match BOTSID.
+            for nodes with many children an index of children by BOTSID is used.
+            The index is rebuild if the list of children is replaced, or if number or last of children is changed (append, remove, etc).
+            Where children are reordered in place (sort), the index is dropped (_childindex = None).
+        '''
+        children = self.children
+        if botsid is _ANY or len(children) < CHILDINDEX_MINIMUM:
+            return children
+        childindex = self._childindex
+        if childindex is None or childindex[0] is not children or childindex[1] != len(children) or childindex[2] is not children[-1]:
+            index = {}
+            for childnode in children:
+                index.setdefault(childnode.record.get('BOTSID'),[]).append(childnode)
+            childindex = self._childindex = (children,len(children),children[-1],index)
+        return childindex[3].get(botsid,())
+
+    def _compiledmpaths(self,kind,mpaths):
+        ''' get compiled mpaths for get (kind 'get') or getloop (kind 'getloop').
+            mpaths are checked (according to checklevel) and compiled once; result is cached.
+        '''
+        try:
+            key = (kind,Node.checklevel) + tuple(tuple(part.items()) for part in mpaths)
+            cached = _compiled_mpaths.get(key)
+        except (AttributeError,TypeError):  #not dicts or not hashable: not cached
+            key = cached = None
+        if cached is None:
+            if Node.checklevel:
+                if kind == 'get':
+                    self._mpath_sanity_check_get(mpaths)
+                else:
+                    self._mpath_sanity_check(mpaths)
+            if key is None:
+                if Node.checklevel or not all(isinstance(part,dict) for part in mpaths):
+                    raise botslib.MappingFormatError('Parameter mpath must be dicts with strings in a tuple: %(mpaths)s',{'mpaths':mpaths})
+                return _compile_mpaths(mpaths)[0]   #no checks: values that are not hashable (eg a list) are compared, not cached
+            if len(_compiled_mpaths) >= MAX_COMPILED_MPATHS:
+                _compiled_mpaths.clear()
+            cached = _compiled_mpaths[key] = list(_compile_mpaths(mpaths)) + [{}]
+        if Node.checklevel == 2 and self.structure and id(self.structure) not in cached[2]:
+            self._mpath_grammar_check(cached[1])
+            cached[2][id(self.structure)] = self.structure  #keep reference: id is not reused
+        return cached[0]
 
     def getcount(self):
         '''count the number of nodes/records under the node/in whole tree'''
@@ -308,57 +501,52 @@ class Node(object):
     def getloop(self,*mpaths):
         ''' generator. Returns one by one the nodes as indicated in mpath
         '''
-        if Node.checklevel:
-            self._mpath_sanity_check(mpaths)
-        for part in mpaths:
-            part.setdefault('BOTSIDnr', '1')
-        if Node.checklevel == 2:
-            self._mpath_grammar_check(mpaths)
-        for terug in self._getloopcore(mpaths):
+        for terug in self._getloopcore(self._compiledmpaths('getloop',mpaths),0):
             botsglobal.logmap.debug('getloop %(mpaths)s returns "%(record)s".',{'mpaths':mpaths,'record':terug.record})
             yield terug
 
-    def _getloopcore(self,mpaths):
+    def _matches(self,part):
+        ''' check if record of node matches with compiled part of mpath'''
+        botsid,items,nonekeys = part
+        record = self.record
+        if nonekeys or (botsid is not _ANY and record.get('BOTSID',_NOTFOUND) != botsid):
+            return False
+        for key,value in items:
+            if record.get(key,_NOTFOUND) != value:
+                return False
+        return True
+
+    def _getloopcore(self,parts,level):
         ''' recursive part of getloop()
         '''
-        for key,value in mpaths[0].items():
-            if key not in self.record or value != self.record[key]:
-                return
-        else:   #all items are checked and OK.
-            if len(mpaths) == 1:
-                yield self      #found!
-            else:
-                for childnode in self.children:
-                    for terug in childnode._getloopcore(mpaths[1:]): #search recursive for rest of mpaths
-                        yield terug
+        if not self._matches(parts[level]):
+            return
+        if level + 1 == len(parts):
+            yield self      #found!
+        else:
+            for childnode in self._childnodes(parts[level+1][0]):
+                for terug in childnode._getloopcore(parts,level+1): #search recursive for rest of mpaths
+                    yield terug
 
     def getloop_including_mpath(self,*mpaths):
         ''' generator. Returns one by one the nodes as indicated in mpath
             like getloop(), but returns a list: [mpath,mpath,etc,,node] ->node is same as returned by getloop()
         '''
-        if Node.checklevel:
-            self._mpath_sanity_check(mpaths)
-        for part in mpaths:
-            part.setdefault('BOTSIDnr', '1')
-        if Node.checklevel == 2:
-            self._mpath_grammar_check(mpaths)
-        for terug in self._getloopcore_including_mpath(mpaths):
+        for terug in self._getloopcore_including_mpath(self._compiledmpaths('getloop',mpaths),0):
             botsglobal.logmap.debug('getloop %(mpaths)s returns "%(terug)s".',{'mpaths':mpaths,'terug':terug})
             yield terug
 
-    def _getloopcore_including_mpath(self,mpaths):
+    def _getloopcore_including_mpath(self,parts,level):
         ''' recursive part of getloop()
         '''
-        for key,value in mpaths[0].items():
-            if key not in self.record or value != self.record[key]:
-                return
-        else:   #all items are checked and OK.
-            if len(mpaths) == 1:
-                yield [self]      #found!
-            else:
-                for childnode in self.children:
-                    for terug in childnode._getloopcore_including_mpath(mpaths[1:]): #search recursive for rest of mpaths
-                        yield [self.record] + terug if terug is not None else None
+        if not self._matches(parts[level]):
+            return
+        if level + 1 == len(parts):
+            yield [self]      #found!
+        else:
+            for childnode in self._childnodes(parts[level+1][0]):
+                for terug in childnode._getloopcore_including_mpath(parts,level+1): #search recursive for rest of mpaths
+                    yield [self.record] + terug if terug is not None else None
 
     def getnozero(self,*mpaths):
         ''' like get, but either return a numerical value (as string) or None. If value to return is equal to zero, None is returned.
@@ -529,12 +717,33 @@ class Node(object):
                     n.children.sort(key=lambda s: s.getdecimal(*comparekey) or sort_if_none,reverse=reverse)
                 else:
                     n.children.sort(key=lambda s: s.get(*comparekey) or sort_if_none,reverse=reverse)
+                n._childindex = None
         finally:
             Node.checklevel = remember_checklevel
 
     #********************************************************
     #*** utility functions **********************************
     #********************************************************
+    @staticmethod
+    def _mpath_sanity_check_get(mpaths):
+        ''' sanity check of mpaths for get: None is allowed in last part of mpaths. '''
+        Node._mpath_sanity_check(mpaths[:-1])
+        #sanity check of last part of mpaths: None only allowed in last section of Mpath; check last part
+        if not isinstance(mpaths[-1],dict):
+            raise botslib.MappingFormatError('Must be dicts in tuple: get(%(mpath)s)',{'mpath':mpaths})
+        if 'BOTSID' not in mpaths[-1]:
+            raise botslib.MappingFormatError('Last section without "BOTSID": get(%(mpath)s)',{'mpath':mpaths})
+        count = 0
+        for key,value in mpaths[-1].items():
+            if not isinstance(key,basestring):
+                raise botslib.MappingFormatError('Keys must be strings in last section: get(%(mpath)s)',{'mpath':mpaths})
+            if value is None:
+                count += 1
+            elif not isinstance(value,basestring):
+                raise botslib.MappingFormatError('Values must be strings (or none) in last section: get(%(mpath)s)',{'mpath':mpaths})
+        if count > 1:
+            raise botslib.MappingFormatError('Max one "None" in last section: get(%(mpath)s)',{'mpath':mpaths})
+
     @staticmethod
     def _mpath_sanity_check(mpaths):
         ''' sanity check of mpaths. '''
@@ -1,4 +1,6 @@
 import sys
+import io
+import re
 import time
 try:
     import cdecimal as decimal
@@ -13,6 +15,8 @@ try:
     import elementtree.ElementInclude as ETI
 except ImportError:
     from xml.etree import ElementInclude as ETI
+from xml.etree import ElementTree        #for prefixes of namespaces registered with register_namespace
+from xml.sax.saxutils import escape
 import json as simplejson
 try:
     from collections import OrderedDict
@@ -26,6 +30,10 @@ from . import grammar
 from . import node
 from .botsconfig import *
 
+XMLATTRIBUTE_ENTITIES = {'"':'&quot;','\r':'&#13;','\n':'&#10;','\t':'&#09;'}   #escaping of xml attributes as ElementTree does
+NOXMLFIELDS = ('BOTSID','BOTSIDnr','BOTSCONTENT')   #in records, but not written as xml-field-entities
+_escapetables = {}      #translate-tables for escaping in record2string; per set of separators etc (Outmessage._escapetables)
+
 def outmessage_init(**ta_info):
     ''' dispatch function class Outmessage or subclass
         ta_info: needed is editype, messagetype, filename, charset, merge
@@ -154,13 +162,18 @@ class Outmessage(message.Message):
             The nodes are already sorted
         '''
         self._tree2recordfields(node_instance.record,structure)    #write node->lex_record
+        if not node_instance.children:
+            return
+        if LEVELINDEX not in structure:     #index of records of level is made once per structure: (BOTSID, BOTSIDnr) -> structure_record
+            levelindex = {}
+            for structure_record in structure[LEVEL]:
+                levelindex.setdefault((structure_record[ID],structure_record[BOTSIDNR]),structure_record)  #first one in grammar is used
+            structure[LEVELINDEX] = levelindex
+        levelindex = structure[LEVELINDEX]
         for childnode in node_instance.children:
-            botsid_childnode = childnode.record['BOTSID'].strip()   #speed up: use local var
-            botsidnr_childnode = childnode.record['BOTSIDnr']       #speed up: use local var
-            for structure_record in structure[LEVEL]:  #for structure_record of this level in grammar
-                if botsid_childnode == structure_record[ID] and botsidnr_childnode == structure_record[BOTSIDNR]:   #check if is is the right node
-                    self._tree2recordscore(childnode,structure_record)         #use rest of index in deeper level
-                    break       #childnode was found and used; break to go to next child node
+            structure_record = levelindex.get((childnode.record['BOTSID'].strip(),childnode.record['BOTSIDnr']))
+            if structure_record is not None:    #childnode not in grammar: is not written
+                self._tree2recordscore(childnode,structure_record)         #use rest of index in deeper level
 
     def _tree2recordfields(self,noderecord,structure_record):
         ''' from noderecord->lex_record; use structure_record as guide.
@@ -408,71 +421,97 @@ class Outmessage(message.Message):
         ''' write lex_records to a file.
             using the right editype (edifact, x12, etc) and charset.
             write (all fields of) each record using the right separators, escape etc
+            escaping is done with translate-tables (see _escapetables); record-string is collected in list and joined.
         '''
         sfield_sep = self.ta_info['sfield_sep']
         record_tag_sep = self.ta_info['record_tag_sep'] or self.ta_info['field_sep']
         record_sep = self.ta_info['record_sep'] + ('' if self.ta_info['record_sep'] in '\r\n' else self.ta_info['add_crlfafterrecord_sep'])
         field_sep = self.ta_info['field_sep']
         quote_char = self.ta_info['quote_char']
-        escape = self.ta_info['escape']
         forcequote = self.ta_info['forcequote']
-        escapechars = self._getescapechars()
+        escapetable,escapesearch,escapetable_quote,escapesearch_quote,escapeerror = self._escapetables()
+        escapesearch = escapesearch.search if escapesearch else None
+        escapesearch_quote = escapesearch_quote.search if escapesearch_quote else None
         noBOTSID = self.ta_info.get('noBOTSID',False)
         rep_sep     = self.ta_info['reserve']
 
-        lijst = []
+        lijst = []      #to collect the formatted strings of all records.
+        append = lijst.append
         for lex_record in lex_records:
             if noBOTSID:  #for csv/fixed: do not write BOTSID so remove it
                 del lex_record[0]
             fieldcount = 0
-            mode_quote = False
-            value = ''     #to collect the formatted record-string.
             for field in lex_record:        #loop all fields in lex_record
                 if not field[SFIELD]:   #is a field:
                     if fieldcount == 0:  #do nothing because first field in lex_record is not preceded by a separator
                         fieldcount = 1
                     elif fieldcount == 1:
-                        value += record_tag_sep
+                        append(record_tag_sep)
                         fieldcount = 2
                     else:
-                        value += field_sep
+                        append(field_sep)
                 elif field[SFIELD] == 1:   #is a subfield:
-                    value += sfield_sep
+                    append(sfield_sep)
                 else:                   #repeat
-                    value += rep_sep
+                    append(rep_sep)
+                content = field[VALUE]
+                if escapeerror:     #x12 without replacechar: error if content contains separator
+                    found = escapesearch(content)
+                    if found:
+                        raise botslib.OutMessageError('[F51]: Character "%(char)s" is used as separator in this x12 file, so it can not be used in content. Field: "%(content)s".',
+                                                        {'char':found.group(),'content':content})
                 if quote_char:      #quote char only used for csv
-                    start_to__quote = False
                     if forcequote == 2:
-                        if field[FORMATFROMGRAMMAR] in ['AN','A','AR']:
-                            start_to__quote = True
+                        start_to__quote = field[FORMATFROMGRAMMAR] in ['AN','A','AR']
                     elif forcequote:    #always quote; this catches values 1, '1', '0'
                         start_to__quote = True
                     else:
-                        if field_sep in field[VALUE] or quote_char in field[VALUE] or record_sep in field[VALUE]:
-                            start_to__quote = True
+                        start_to__quote = field_sep in content or quote_char in content or record_sep in content
                     if start_to__quote:
-                        value += quote_char
-                        mode_quote = True
-                for char in field[VALUE]:   #use escape (edifact, tradacom). For x12 is warned if content contains separator
-                    if char in escapechars:
-                        if isinstance(self,x12):
-                            if self.ta_info['replacechar'] is not None:
-                                char = self.ta_info['replacechar']
-                            else:
-                                raise botslib.OutMessageError('[F51]: Character "%(char)s" is used as separator in this x12 file, so it can not be used in content. Field: "%(content)s".',
-                                                                {'char':char,'content':field[VALUE]})
-                        else:
-                            value += escape
-                    elif mode_quote and char == quote_char:
-                        value += quote_char
-                    value += char
-                if mode_quote:
-                    value += quote_char
-                    mode_quote = False
-            value += record_sep
-            lijst.append(value)
+                        append(quote_char)
+                        append(content.translate(escapetable_quote) if escapesearch_quote and escapesearch_quote(content) else content)
+                        append(quote_char)
+                        continue
+                #translate is only done if needed: most content has nothing to escape, and translate with table is relatively slow.
+                append(content.translate(escapetable) if escapesearch and escapesearch(content) else content)
+            append(record_sep)
         return ''.join(lijst)
 
+    def _escapetables(self):
+        ''' get translate-tables for escaping content, with compiled regex to search if content has something to escape:
+            (table, regex, table for quoted content, regex for quoted content, escapeerror).
+            escapechars are escaped (edifact, tradacoms, csv); for x12 escapechars are replaced by replacechar,
+            if no replacechar: escapeerror is True (error for content with escapechars). In quoted content quote_char is doubled.
+            these only depend on separators etc, so are kept per set of these.
+        '''
+        escapechars = self._getescapechars()
+        quote_char = self.ta_info['quote_char']
+        replacechar = self.ta_info['replacechar'] if isinstance(self,x12) else None
+        key = (escapechars,self.ta_info['escape'],quote_char,replacechar,isinstance(self,x12))
+        try:
+            return _escapetables[key]
+        except KeyError:
+            pass
+        escapeerror = False
+        if isinstance(self,x12):
+            if replacechar is not None:
+                escapetable = dict((ord(char),replacechar) for char in escapechars)
+            else:
+                escapetable = {}
+                escapeerror = bool(escapechars)
+        else:
+            escapetable = dict((ord(char),self.ta_info['escape'] + char) for char in escapechars)
+        escapetable_quote = dict(escapetable)
+        if len(quote_char) == 1 and ord(quote_char) not in escapetable:
+            escapetable_quote[ord(quote_char)] = quote_char * 2
+        escapesearch = re.compile('[%s]'%re.escape(escapechars)) if escapechars else None
+        escapechars_quote = escapechars + quote_char if len(quote_char) == 1 else escapechars
+        escapesearch_quote = re.compile('[%s]'%re.escape(escapechars_quote)) if escapechars_quote else None
+        if len(_escapetables) >= 100:
+            _escapetables.clear()
+        terug = _escapetables[key] = (escapetable,escapesearch,escapetable_quote,escapesearch_quote,escapeerror)
+        return terug
+
     def _getescapechars(self):
         return ''
 
@@ -575,81 +614,176 @@ class x12(var):
         return terug
 
 class xml(Outmessage):
-    ''' Some problems with right xml prolog, standalone, DOCTYPE, processing instructons: Different ET versions give different results.
-        Things work OK for python 2.7
-        celementtree in 2.7 is version 1.0.6, but different implementation in 2.6??
-        For python <2.7: do not generate standalone, DOCTYPE, processing instructions for encoding !=utf-8,ascii OR if elementtree package is installed (version 1.3.0 or bigger)
+    ''' xml messages are written while walking the node tree: there is no ElementTree for the message.
+        Output is as ElementTree writes it (with botslib.indent_xml if indented).
+        Envelopes (with xinclude of the messages) are written using ElementTree.
     '''
     def _write(self,node_instance):
         ''' write normal XML messages (no envelope)'''
-        xmltree = ET.ElementTree(self._node2xml(node_instance))
-        root = xmltree.getroot()
-        self._xmlcorewrite(xmltree,root)
+        self._registernamespaces()
+        textstream = self._textstream()
+        self._xmlprolog(textstream.write)
+        qnames,namespaces = self._xmlnamespaces(node_instance)
+        self._node2xmlstream(textstream.write,node_instance,qnames,0,namespaces)
+        textstream.detach()     #flushes; self._outstream stays open
 
     def envelopewrite(self,node_instance):
         ''' write envelope for XML messages'''
         self._initwrite()
         self.checkmessage(node_instance,self.defmessage)
         self.checkforerrorlist()
+        self._registernamespaces()
         xmltree = ET.ElementTree(self._node2xml(node_instance))
         root = xmltree.getroot()
         ETI.include(root)
-        self._xmlcorewrite(xmltree,root)
+        textstream = self._textstream()
+        self._xmlprolog(textstream.write)
+        textstream.detach()
+        #indent the xml elements
+        if self.ta_info['indented']:
+            botslib.indent_xml(root)
+        xmltree.write(self._outstream,encoding=self.ta_info['charset'],xml_declaration=False)
         self._closewrite()
 
-    def _xmlcorewrite(self,xmltree,root):
-        if sys.version_info[0] == 2 and sys.version_info[1] == 6:
-            python26 = True
-        else:
-            python26 = False
-        if not python26 and self.ta_info['namespace_prefixes']:   # Register any namespace prefixes specified in syntax
+    def _registernamespaces(self):
+        ''' Register any namespace prefixes specified in syntax'''
+        if self.ta_info['namespace_prefixes']:
             for eachns in self.ta_info['namespace_prefixes']:
                 ET.register_namespace(eachns[0], eachns[1])
-        #xml prolog: always use.*********************************
-        #standalone, DOCTYPE, processing instructions: only possible in python >= 2.7 or if encoding is utf-8/ascii
-        if not python26 or self.ta_info['charset'] in ['us-ascii','utf-8'] or ET.VERSION >= '1.3.0':
-            if self.ta_info['indented']:
-                indentstring = '\n'
-            else:
-                indentstring = ''
-            if self.ta_info['standalone']:
-                standalonestring = 'standalone="%s" '%(self.ta_info['standalone'])
+
+    def _textstream(self):
+        ''' text stream on self._outstream; characters not in charset are written as character references (as ElementTree does).'''
+        return io.TextIOWrapper(self._outstream,encoding=self.ta_info['charset'],errors='xmlcharrefreplace',newline='\n')
+
+    def _xmlprolog(self,write):
+        ''' xml prolog (always), DOCTYPE and processing instructions.'''
+        if self.ta_info['indented']:
+            indentstring = '\n'
+        else:
+            indentstring = ''
+        if self.ta_info['standalone']:
+            standalonestring = 'standalone="%s" '%(self.ta_info['standalone'])
+        else:
+            standalonestring = ''
+        write('<?xml version="%s" encoding="%s" %s?>'%(self.ta_info['version'],self.ta_info['charset'],standalonestring) + indentstring)
+        #doctype /DTD **************************************
+        if self.ta_info['DOCTYPE']:
+            write('<!DOCTYPE ' + self.ta_info['DOCTYPE'] + '>' + indentstring)
+        #processing instructions (other than prolog) ************
+        if self.ta_info['processing_instructions']:
+            for eachpi in self.ta_info['processing_instructions']:
+                if eachpi[1]:
+                    write('<?%s %s?>'%(eachpi[0],eachpi[1]) + indentstring)
+                else:
+                    write('<?%s?>'%(eachpi[0]) + indentstring)
+
+    def _xmlnamespaces(self,node_instance):
+        ''' namespaces are declared in the root element, so all qualified names ('{uri}tag') in the tree are collected first.
+            prefixes as ElementTree gives them: registered prefix or ns0, ns1, etc in order of appearance.
+            returns qnames (qualified name -> prefix:tag; only for qualified names), namespaces (uri -> prefix).
+        '''
+        qnames = {}
+        namespaces = {}
+        if not self._hasqnames(node_instance):
+            return qnames,namespaces
+        def add_qname(qname):
+            if qname[:1] == '{' and qname not in qnames:
+                uri,tag = qname[1:].rsplit('}',1)
+                prefix = namespaces.get(uri)
+                if prefix is None:
+                    prefix = ElementTree._namespace_map.get(uri)    #registered prefixes
+                    if prefix is None:
+                        prefix = 'ns%d'%len(namespaces)
+                    if prefix != 'xml':
+                        namespaces[uri] = prefix
+                qnames[qname] = '%s:%s'%(prefix,tag) if prefix else tag
+        def collect(node_instance):
+            recordtag,recordattributes,content,xmlfields = self._xmlrecord(node_instance.record)
+            add_qname(recordtag)
+            for key in recordattributes:
+                add_qname(key)
+            for fieldtag,attributes,content in xmlfields:
+                add_qname(fieldtag)
+                for key in attributes:
+                    add_qname(key)
+            for childnode in node_instance.children:
+                collect(childnode)
+        collect(node_instance)
+        return qnames,namespaces
+
+    def _hasqnames(self,node_instance):
+        ''' check if there are qualified names ('{uri}tag') in tags or fields.'''
+        if '{' in node_instance.record['BOTSID'] or any('{' in key for key in node_instance.record):
+            return True
+        return any(self._hasqnames(childnode) for childnode in node_instance.children)
+
+    def _node2xmlstream(self,write,node_instance,qnames,level,namespaces=None):
+        ''' recursive method: write node as xml-record-entity with xml-field-entities and child nodes.
+            namespaces: declared in the root element.
+        '''
+        recordtag,recordattributes,content,xmlfields = self._xmlrecord(node_instance.record)
+        recordtag = qnames.get(recordtag,recordtag)
+        write('<' + recordtag)
+        if namespaces:
+            for uri,prefix in sorted(namespaces.items(),key=lambda x: x[1]):    #sort on prefix
+                write(' xmlns%s="%s"'%(':' + prefix if prefix else '',escape(uri,XMLATTRIBUTE_ENTITIES)))
+        for key,value in recordattributes.items():
+            write(' %s="%s"'%(qnames.get(key,key),escape(value,XMLATTRIBUTE_ENTITIES)))
+        if not xmlfields and not node_instance.children:
+            if content:
+                write('>' + escape(content) + '</' + recordtag + '>')
             else:
-                standalonestring = ''
-            processing_instruction = ET.ProcessingInstruction('xml', 'version="%s" encoding="%s" %s'%(self.ta_info['version'],self.ta_info['charset'], standalonestring))
-            self._outstream.write(ET.tostring(processing_instruction) + indentstring) #do not use encoding here. gives double xml prolog; possibly because ET.ElementTree.write i used again by write()
-            #doctype /DTD **************************************
-            if self.ta_info['DOCTYPE']:
-                self._outstream.write('<!DOCTYPE ' + self.ta_info['DOCTYPE'].encode('ascii') + '>' + indentstring)
-            #processing instructions (other than prolog) ************
-            if self.ta_info['processing_instructions']:
-                for eachpi in self.ta_info['processing_instructions']:
-                    processing_instruction = ET.ProcessingInstruction(eachpi[0], eachpi[1])
-                    self._outstream.write(ET.tostring(processing_instruction) + indentstring) #do not use encoding here. gives double xml prolog; possibly because ET.ElementTree.write i used again by write()
-        #indent the xml elements
+                write(' />')
+            return
+        write('>')
         if self.ta_info['indented']:
-            botslib.indent_xml(root)
-        #write tree to file; this is different for different python/elementtree versions
-        if python26 and ET.VERSION < '1.3.0':
-            xmltree.write(self._outstream,encoding=self.ta_info['charset'])
+            #as botslib.indent_xml: white space before each xml-entity within this xml-entity and before end-tag
+            indentstring = '\n' + level * '    '
+            write(escape(content) if content and content.strip() else indentstring + '    ')
+            separator = indentstring + '    '
         else:
-            xmltree.write(self._outstream,encoding=self.ta_info['charset'],xml_declaration=False)
+            indentstring = ''
+            if content:
+                write(escape(content))
+            separator = ''
+        first = True
+        for fieldtag,attributes,content in xmlfields:
+            if not first:
+                write(separator)
+            first = False
+            fieldtag = qnames.get(fieldtag,fieldtag)
+            write('<' + fieldtag)
+            for key,value in attributes.items():
+                write(' %s="%s"'%(qnames.get(key,key),escape(value,XMLATTRIBUTE_ENTITIES)))
+            if content:
+                write('>' + escape(content) + '</' + fieldtag + '>')
+            else:
+                write(' />')
+        for childnode in node_instance.children:
+            if not first:
+                write(separator)
+            first = False
+            self._node2xmlstream(write,childnode,qnames,level+1)
+        write(indentstring + '</' + recordtag + '>')
 
     def _node2xml(self,node_instance):
-        ''' recursive method.
+        ''' recursive method: build ElementTree (for envelopes).
         '''
-        newnode = self._node2xmlfields(node_instance.record)
+        recordtag,recordattributes,content,xmlfields = self._xmlrecord(node_instance.record)
+        newnode = ET.Element(recordtag,recordattributes)
+        newnode.text = content      #add BOTSCONTENT as the content of the xml-record-entity
+        for fieldtag,attributes,content in xmlfields:
+            ET.SubElement(newnode,fieldtag,attributes).text = content
         for childnode in node_instance.children:
             newnode.append(self._node2xml(childnode))
         return newnode
 
-    def _node2xmlfields(self,noderecord):
-        ''' write record as xml-record-entity plus xml-field-entities within the xml-record-entity.
-            output is sorted according to grammar, attributes alfabetically.
+    def _xmlrecord(self,noderecord):
+        ''' record as xml-record-entity plus xml-field-entities within the xml-record-entity.
+            output is sorted according to grammar, attributes in order of record.
+            returns: tag, attributes, content (BOTSCONTENT) of xml-record-entity; list of (tag, attributes, content) of xml-field-entities.
         '''
-        recordtag = noderecord.pop('BOTSID')
-        del noderecord['BOTSIDnr']
-        BOTSCONTENT = noderecord.pop('BOTSCONTENT',None)
+        recordtag = noderecord['BOTSID']
         #collect all values used as attributes from noderecord***************************
         attributemarker = self.ta_info['attributemarker']
         attributedict = {}  #is a dict of dicts
@@ -658,51 +792,44 @@ class xml(Outmessage):
                 field,attribute = key.split(attributemarker,1)
                 attributedict.setdefault(field,{})
                 attributedict[field][attribute] = value
-                #~ del noderecord[key]
-        #generate xml-record-entity***************************
-        xmlrecord = ET.Element(recordtag,attributedict.get(recordtag,{}))
-        #***add BOTSCONTENT as the content of the xml-record-entity
-        xmlrecord.text = BOTSCONTENT
-        #generate the xml-field-entities within the xml-record-entity***************************
-        for field_def in self.defmessage.recorddefs[recordtag]:  #loop over remaining fields in 'record': write these as subelements
+        #the xml-field-entities within the xml-record-entity***************************
+        xmlfields = []
+        for field_def in self.defmessage.recorddefs[recordtag]:  #loop over fields in 'record': write these as subelements
             if attributemarker in field_def[ID]:  #skip fields that are marked as xml attributes
                 continue
-            content = noderecord.get(field_def[ID],None)
+            content = noderecord.get(field_def[ID]) if field_def[ID] not in NOXMLFIELDS else None
             attributes = attributedict.get(field_def[ID],{})
             if content is not None or attributes:
-                ET.SubElement(xmlrecord, field_def[ID],attributes).text=content    #add xml element to xml record
-        return xmlrecord
+                xmlfields.append((field_def[ID],attributes,content))
+        return recordtag,attributedict.get(recordtag,{}),noderecord.get('BOTSCONTENT'),xmlfields
 
     def _initwrite(self):
         botsglobal.logger.debug('Start writing to file "%(filename)s".',self.ta_info)
         self._outstream = botslib.opendata_bin(self.ta_info['filename'],'wb')
 
 class xmlnocheck(xml):
-    def _node2xmlfields(self,noderecord):
-        ''' write record as xml-record-entity plus xml-field-entities within the xml-record-entity.
-            output is sorted alfabetically, attributes alfabetically.
+    def _xmlrecord(self,noderecord):
+        ''' record as xml-record-entity plus xml-field-entities within the xml-record-entity.
+            output is sorted alfabetically, attributes in order of record.
         '''
-        recordtag = noderecord.pop('BOTSID')
-        del noderecord['BOTSIDnr']
-        BOTSCONTENT = noderecord.pop('BOTSCONTENT',None)
+        recordtag = noderecord['BOTSID']
         #***collect from noderecord all entities and attributes***************************
         attributemarker = self.ta_info['attributemarker']
         attributedict = {}  #is a dict of dicts
         for key,value in noderecord.items():
+            if key in NOXMLFIELDS:
+                continue
             if attributemarker in key:
                 field,attribute = key.split(attributemarker,1)
                 attributedict.setdefault(field,{})
                 attributedict[field][attribute] = value
             else:
                 attributedict.setdefault(key,{})
-        #***generate the xml-record-entity***************************
-        xmlrecord = ET.Element(recordtag,attributedict.pop(recordtag,{}))   #pop from attributedict->do not use later
-        #***add BOTSCONTENT as the content of the xml-record-entity
-        xmlrecord.text = BOTSCONTENT
-        #***generate the xml-field-entities within the xml-record-entity***************************
-        for key in sorted(attributedict.keys()):       #sorted: predictable output
-            ET.SubElement(xmlrecord, key,attributedict[key]).text=noderecord.get(key)
-        return xmlrecord
+        recordattributes = attributedict.pop(recordtag,{})   #pop from attributedict->do not use later
+        #***the xml-field-entities within the xml-record-entity***************************
+        xmlfields = [(key,attributedict[key],noderecord.get(key) if key not in NOXMLFIELDS else None)
+                        for key in sorted(attributedict.keys())]       #sorted: predictable output
+        return recordtag,recordattributes,noderecord.get('BOTSCONTENT'),xmlfields
 
 class json(Outmessage):
     def _initwrite(self):
@@ -716,43 +843,81 @@ class json(Outmessage):
             self._outstream.write('[')
 
     def _write(self,node_instance):
-        ''' convert node tree to appropriate python object.
-            python objects are written to json by simplejson.
+        ''' node tree is written to json while walking the tree; python objects are only made for one record at a time.
+            output is as simplejson.dump of the python objects (see _jsonobject).
         '''
         if self.nrmessagewritten:
             self._outstream.write(',')
-        if self.ta_info['named_root_object']:
-            jsonobject = {node_instance.record['BOTSID']:self._node2json(node_instance)}
-        else:
-            jsonobject = self._node2json(node_instance)
         if self.ta_info['indented']:
-            indent = 2
+            encoder = simplejson.JSONEncoder(ensure_ascii=False,check_circular=False,indent=2)
         else:
-            indent = None
-        simplejson.dump(jsonobject, self._outstream, skipkeys=False, ensure_ascii=False, check_circular=False, indent=indent)
+            encoder = simplejson.JSONEncoder(ensure_ascii=False,check_circular=False)
+        if self.ta_info['named_root_object']:
+            jsonobject = {node_instance.record['BOTSID']:node_instance}
+        else:
+            jsonobject = self._jsonobject(node_instance)
+        self._json2stream(self._outstream.write,jsonobject,encoder,0)
 
     def _closewrite(self):
         if self.write_json_list :
             self._outstream.write(']')
         super(json,self)._closewrite()
 
-    def _node2json(self,node_instance):
-        ''' recursive method.
+    def _jsonobject(self,node_instance):
+        ''' json object for node: record fields, child nodes (as node or list of nodes). Child nodes are written later by _json2stream.
         '''
-        #newjsonobject is the json object assembled in the function.
-        newjsonobject = node_instance.record.copy()    #init newjsonobject with record fields from node
-        for childnode in node_instance.children: #fill newjsonobject with the lex_records from childnodes.
+        jsonobject = node_instance.record.copy()    #init jsonobject with record fields from node
+        for childnode in node_instance.children:
             key = childnode.record['BOTSID']
             if childnode.linpos_info == 'OK':           #linpos_info indicates here this node occurs only once -> dict in json, not a list of dicts
-                newjsonobject[key] = self._node2json(childnode)
+                jsonobject[key] = childnode
             else:
-                if key in newjsonobject:
-                    newjsonobject[key].append(self._node2json(childnode))
+                if isinstance(jsonobject.get(key),list):
+                    jsonobject[key].append(childnode)
+                elif key in jsonobject:
+                    raise botslib.OutMessageError('[J60]: Key "%(key)s" is used for a field or a record that occurs once and for a record that occurs more than once.',
+                                                    {'key':key})
                 else:
-                    newjsonobject[key] = [self._node2json(childnode)]
-        del newjsonobject['BOTSID']
-        newjsonobject.pop('BOTSIDnr',None)
-        return newjsonobject
+                    jsonobject[key] = [childnode]
+        del jsonobject['BOTSID']
+        jsonobject.pop('BOTSIDnr',None)
+        return jsonobject
+
+    def _json2stream(self,write,value,encoder,level):
+        ''' recursive method: write value (node, dict, list or field value) as json, as encoder would do.
+        '''
+        if isinstance(value,node.Node):
+            value = self._jsonobject(value)
+        if isinstance(value,dict):
+            if not value:
+                write('{}')
+                return
+            items,begin,end = value.items(),'{','}'
+        elif isinstance(value,list):
+            if not value:
+                write('[]')
+                return
+            items,begin,end = ((None,item) for item in value),'[',']'
+        else:
+            if encoder.indent is None:
+                write(encoder.encode(value))
+            else:
+                write(encoder.encode(value).replace('\n','\n' + ' ' * encoder.indent * level))
+            return
+        if encoder.indent is None:
+            indentstring = endstring = ''
+        else:
+            indentstring = '\n' + ' ' * encoder.indent * (level + 1)
+            endstring = '\n' + ' ' * encoder.indent * level
+        write(begin)
+        separator = indentstring
+        for key,item in items:
+            write(separator)
+            if key is not None:
+                write(encoder.encode(key) + encoder.key_separator)
+            self._json2stream(write,item,encoder,level + 1)
+            separator = encoder.item_separator + indentstring
+        write(endstring + end)
 
     def _canonicaltree(self,node_instance,structure):
         ''' some specific handling: if max one occurence of record: not as a list, but as a record.
@@ -768,10 +933,9 @@ class json(Outmessage):
         if node_instance.structure is None:
             node_instance.structure = structure
         if LEVEL in structure:
+            childgroups = self._groupchildren(node_instance)
             for record_definition in structure[LEVEL]:  #for every record_definition (in grammar) of this level
-                for childnode in node_instance.children:            #for every node in mpathtree; SPEED: delete nodes from list when found
-                    if childnode.record['BOTSID'] != record_definition[ID] or childnode.record['BOTSIDnr'] != record_definition[BOTSIDNR]:   #if it is not the right NODE":
-                        continue
+                for childnode in childgroups.get((record_definition[ID],record_definition[BOTSIDNR]),()):
                     if record_definition[MAX] == 1:
                         childnode.linpos_info = 'OK'        #misuse linpos_info to indicate this node occurs only once -> dict in json, not a list of dicts
                     self.correct_max_one_occurence(childnode,record_definition)         #use rest of index in deeper level
@@ -813,20 +977,22 @@ class jsonnocheck(json):
         if self.write_json_list:
             self._outstream.write('[')
     
-    def _node2json(self,node_instance):
-        ''' recursive method.
+    def _jsonobject(self,node_instance):
+        ''' json object for node: record fields (sorted), child nodes (as list of nodes).
         '''
-        #newjsonobject is the json object assembled in the function.
-        newjsonobject = OrderedDict(sorted(node_instance.record.items()))    #init newjsonobject with record fields from node; sorted
-        for childnode in node_instance.children: #fill newjsonobject with the lex_records from childnodes.
+        jsonobject = OrderedDict(sorted(node_instance.record.items()))    #init jsonobject with record fields from node; sorted
+        for childnode in node_instance.children:
             key = childnode.record['BOTSID']
-            if key in newjsonobject:
-                newjsonobject[key].append(self._node2json(childnode))
+            if isinstance(jsonobject.get(key),list):
+                jsonobject[key].append(childnode)
+            elif key in jsonobject:
+                raise botslib.OutMessageError('[J60]: Key "%(key)s" is used for a field or a record that occurs once and for a record that occurs more than once.',
+                                                {'key':key})
             else:
-                newjsonobject[key] = [self._node2json(childnode)]
-        del newjsonobject['BOTSID']
-        newjsonobject.pop('BOTSIDnr',None)
-        return newjsonobject
+                jsonobject[key] = [childnode]
+        del jsonobject['BOTSID']
+        jsonobject.pop('BOTSIDnr',None)
+        return jsonobject
 
 class templatehtml(Outmessage):
     ''' uses Genshi library for templating. Genshi is very similar to Kid, and is the fork/follow-up of Kid.
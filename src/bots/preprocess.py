@@ -127,32 +127,100 @@ def mailbag(ta_from,endstatus,frommessagetype,**argv):
         in bots > 3.0.0 all mailbag, edifact, x12 and tradacoms go via mailbag.
     '''
     edifile = botslib.readdata(filename=ta_from.filename,charset='iso-8859-1')
+    nr_interchanges = 0
+    for editype,headpos,endpos in split_interchanges(edifile):
+        interchange = edifile[headpos:endpos]
+        ta_to = ta_from.copyta(status=endstatus)  #make transaction for translated message; gets ta_info of ta_frommes
+        tofilename = unicode(ta_to.idta)
+        filesize = len(interchange)
+        tofile = botslib.opendata(tofilename,'wb',charset='iso-8859-1')
+        tofile.write(interchange)
+        tofile.close()
+        #editype is now either edifact, x12 or tradacoms
+        #frommessagetype is the original frommessagetype (from route).
+        #frommessagetype would normally be edifact, x12, tradacoms or mailbag, but could also be eg ORDERSD96AUNEAN007.
+        #If so, we want to preserve that.
+        if frommessagetype != 'mailbag' and frommessagetype != editype:
+            messagetype = frommessagetype
+        else:
+            messagetype = editype
+        ta_to.update(statust=OK,filename=tofilename,editype=editype,messagetype=messagetype,filesize=filesize) #update outmessage transaction with ta_info;
+        nr_interchanges += 1
+        botsglobal.logger.debug('        File written: "%(tofilename)s".',{'tofilename':tofilename})
+    if nr_interchanges:
+        return
+    if edifile.strip(string.whitespace+'\x1A\x00'):  #there is content...but not valid
+        #no interchanges found, content is not a valid edifact/x12/tradacoms interchange
+        if frommessagetype == 'mailbag':    #if indicated 'mailbag': guess if this is an xml file.....
+            sniffxml = edifile[:25]
+            sniffxml = sniffxml.lstrip(' \t\n\r\f\v\xFF\xFE\xEF\xBB\xBF\x00')       #to find first ' real' data; some char are because of BOM, UTF-16 etc
+            if sniffxml and sniffxml[0] == '<':
+                #is a xml file; inmessage.py can determine the right xml messagetype via xpath.
+                filesize = len(edifile)
+                ta_to = ta_from.copyta(status=endstatus,statust=OK,filename=ta_from.filename,editype='xml',messagetype='mailbag',filesize=filesize)
+                return
+        raise botslib.InMessageError('[M51]: Edi file does not start with a valid interchange.')
+    else:   #no edifact/x12/tradacoms envelope at all
+        raise botslib.InMessageError('[M52]: Edi file contains only whitespace.')
+
+#patterns for trailer of interchange; compiled per editype and separators
+TRAILERS = {
+    'x12':r"""%(record_sep)s
+            \s*
+            I[\n\r]*E[\n\r]*A
+            .+?
+            %(record_sep)s
+            """,
+    'x12_noterminator':r"""%(record_sep)s
+            \s*
+            I[\n\r]*E[\n\r]*A
+            """,
+    'edifact':r"""[^%(escape)s\n\r]
+            [\n\r]*?
+            %(record_sep)s
+            \s*
+            U[\n\r]*N[\n\r]*Z
+            .+?
+            [^%(escape)s\n\r]
+            [\n\r]*?
+            %(record_sep)s
+            """,
+    'tradacoms':r"""[^%(escape)s\n\r]
+            [\n\r]*?
+            %(record_sep)s
+            \s*
+            E[\n\r]*N[\n\r]*D
+            .+?
+            [^%(escape)s\n\r]
+            [\n\r]*?
+            %(record_sep)s
+            """,
+    }
+_trailers = {}      #(editype,escape,record_sep) -> compiled pattern
+
+def _trailer(editype,escape,record_sep):
+    ''' get compiled pattern to search the trailer of an interchange.'''
+    key = (editype,escape,record_sep)
+    if key not in _trailers:
+        _trailers[key] = re.compile(TRAILERS[editype] % {'escape': escape, 'record_sep': re.escape(record_sep)},re.DOTALL|re.VERBOSE)
+    return _trailers[key]
+
+def split_interchanges(edifile):
+    ''' generator: find interchanges (edifact, x12, tradacoms) in edifile (mailbag).
+        yields (editype,startpos,endpos) of each interchange. Searching is done with positions in edifile: no copies of the content.
+        if no interchange is found at start of file: just returns (no interchanges).
+    '''
     startpos = 0
     nr_interchanges = 0
     while True:
-        found = HEADER.match(edifile[startpos:])
+        found = HEADER.match(edifile,startpos)
         if found is None:
-            if edifile[startpos:].strip(string.whitespace+'\x1A\x00'):  #there is content...but not valid
-                if nr_interchanges:    #found interchanges, but remainder is not valid
-                    raise botslib.InMessageError('[M50]: Found data not in a valid interchange at position %(pos)s.',{'pos':startpos})
-                else:   #no interchanges found, content is not a valid edifact/x12/tradacoms interchange
-                    if frommessagetype == 'mailbag':    #if indicated 'mailbag': guess if this is an xml file.....
-                        sniffxml = edifile[:25]
-                        sniffxml = sniffxml.lstrip(' \t\n\r\f\v\xFF\xFE\xEF\xBB\xBF\x00')       #to find first ' real' data; some char are because of BOM, UTF-16 etc
-                        if sniffxml and sniffxml[0] == '<':
-                            #is a xml file; inmessage.py can determine the right xml messagetype via xpath.
-                            filesize = len(edifile)
-                            ta_to = ta_from.copyta(status=endstatus,statust=OK,filename=ta_from.filename,editype='xml',messagetype='mailbag',filesize=filesize)
-                            return
-                    raise botslib.InMessageError('[M51]: Edi file does not start with a valid interchange.')
-            else:   #no parseble content
-                if nr_interchanges:    #OK: there are interchanges, but no new interchange is found.
-                    return
-                else:   #no edifact/x12/tradacoms envelope at all
-                    raise botslib.InMessageError('[M52]: Edi file contains only whitespace.')
+            if nr_interchanges and edifile[startpos:].strip(string.whitespace+'\x1A\x00'):  #found interchanges, but remainder is not valid
+                raise botslib.InMessageError('[M50]: Found data not in a valid interchange at position %(pos)s.',{'pos':startpos})
+            return
         elif found.group('x12'):
             editype = 'x12'
-            headpos = startpos + found.start('x12')
+            headpos = found.start('x12')
             #determine field_sep and record_sep
             count = 0
             for char in edifile[headpos:headpos+120]:  #search first 120 characters to determine separators
@@ -168,28 +236,16 @@ def mailbag(ta_from,endstatus,frommessagetype,**argv):
                 elif count == 106:
                     record_sep = char
                     break
-            foundtrailer = re.search(
-                                        r"""%(record_sep)s
-                                        \s*
-                                        I[\n\r]*E[\n\r]*A
-                                        .+?
-                                        %(record_sep)s
-                                        """ % {'record_sep': re.escape(record_sep)},
-                                        edifile[headpos:],re.DOTALL|re.VERBOSE)
+            foundtrailer = _trailer('x12','',record_sep).search(edifile,headpos)
             if not foundtrailer:
-                foundtrailer2 = re.search(
-                                            r"""%(record_sep)s
-                                            \s*
-                                            I[\n\r]*E[\n\r]*A
-                                            """ % {'record_sep': re.escape(record_sep)},
-                                            edifile[headpos:],re.DOTALL|re.VERBOSE)
+                foundtrailer2 = _trailer('x12_noterminator','',record_sep).search(edifile,headpos)
                 if foundtrailer2:
                     raise botslib.InMessageError('[M60]: Found no segment terminator for IEA trailer at position %(pos)s.',{'pos':foundtrailer2.start()})
                 else:
                     raise botslib.InMessageError('[M54]: Found no valid IEA trailer for the ISA header at position %(pos)s.',{'pos':headpos})
         elif found.group('edifact'):
             editype = 'edifact'
-            headpos = startpos + found.start('edifact')
+            headpos = found.start('edifact')
             #parse UNA. valid UNA: UNA:+.? '
             if found.group('UNA'):
                 count = 0
@@ -217,18 +273,7 @@ def mailbag(ta_from,endstatus,frommessagetype,**argv):
                 else:
                     raise botslib.InMessageError('[M57]: Edifact file with non-standard separators. UNA segment should be used.')
             #search trailer
-            foundtrailer = re.search(
-                                        r"""[^%(escape)s\n\r]
-                                        [\n\r]*?
-                                        %(record_sep)s
-                                        \s*
-                                        U[\n\r]*N[\n\r]*Z
-                                        .+?
-                                        [^%(escape)s\n\r]
-                                        [\n\r]*?
-                                        %(record_sep)s
-                                        """ % {'escape': escape, 'record_sep': re.escape(record_sep)},
-                                        edifile[headpos:],re.DOTALL|re.VERBOSE)
+            foundtrailer = _trailer('edifact',escape,record_sep).search(edifile,headpos)
             if not foundtrailer:
                 raise botslib.InMessageError('[M58]: Found no valid UNZ trailer for the UNB header at position %(pos)s.',{'pos':headpos})
         elif found.group('tradacoms'):
@@ -236,41 +281,15 @@ def mailbag(ta_from,endstatus,frommessagetype,**argv):
             #~ field_sep = '='     #the tradacoms 'after-segment-tag-separator'
             record_sep = "'"
             escape = '?'
-            headpos = startpos + found.start('STX')
-            foundtrailer = re.search(
-                                        r"""[^%(escape)s\n\r]
-                                        [\n\r]*?
-                                        %(record_sep)s
-                                        \s*
-                                        E[\n\r]*N[\n\r]*D
-                                        .+?
-                                        [^%(escape)s\n\r]
-                                        [\n\r]*?
-                                        %(record_sep)s
-                                        """ % {'escape': escape, 'record_sep': re.escape(record_sep)},
-                                        edifile[headpos:],re.DOTALL|re.VERBOSE)
+            headpos = found.start('STX')
+            foundtrailer = _trailer('tradacoms',escape,record_sep).search(edifile,headpos)
             if not foundtrailer:
                 raise botslib.InMessageError('[M59]: Found no valid END trailer for the STX header at position %(pos)s.',{'pos':headpos})
         #so: found an interchange (from headerpos until endpos)
-        endpos = headpos + foundtrailer.end()
-        ta_to = ta_from.copyta(status=endstatus)  #make transaction for translated message; gets ta_info of ta_frommes
-        tofilename = unicode(ta_to.idta)
-        filesize = len(edifile[headpos:endpos])
-        tofile = botslib.opendata(tofilename,'wb',charset='iso-8859-1')
-        tofile.write(edifile[headpos:endpos])
-        tofile.close()
-        #editype is now either edifact, x12 or tradacoms
-        #frommessagetype is the original frommessagetype (from route).
-        #frommessagetype would normally be edifact, x12, tradacoms or mailbag, but could also be eg ORDERSD96AUNEAN007.
-        #If so, we want to preserve that.
-        if frommessagetype != 'mailbag' and frommessagetype != editype:
-            messagetype = frommessagetype
-        else:
-            messagetype = editype
-        ta_to.update(statust=OK,filename=tofilename,editype=editype,messagetype=messagetype,filesize=filesize) #update outmessage transaction with ta_info;
+        endpos = foundtrailer.end()
+        yield editype,headpos,endpos
         startpos = endpos
         nr_interchanges += 1
-        botsglobal.logger.debug('        File written: "%(tofilename)s".',{'tofilename':tofilename})
 
 
 def botsunzip(ta_from,endstatus,password=None,pass_non_zip=False,**argv):
@@ -12,8 +12,20 @@ from .botsconfig import *
 @botslib.log_session
 def rundispatcher(command,routestorun):
     ''' one run for each command (new, resend etc)
+        option parallel_routes: run of a route has its own database lock, this is used for crash recovery of the route.
     '''
+    if botsglobal.routerun:
+        mutexk = -botslib._Transaction.processlist[-1]
+        botslib.set_database_lock(mutexk)
+        try:
+            return _rundispatcher(command,routestorun)
+        finally:
+            botslib.remove_database_lock(mutexk)
+    return _rundispatcher(command,routestorun)
+
+def _rundispatcher(command,routestorun):
     classtocall = globals()[command]           #get the route class from this module
+    botsglobal.bytescopied = 0
     botsglobal.currentrun = classtocall(command,routestorun)
     if botsglobal.currentrun.run():
         return botsglobal.currentrun.evaluate()      #return result of evaluation of run: nr of errors, 0 (no error)
@@ -26,6 +38,7 @@ class new(object):
         self.routestorun = routestorun
         self.command = command
         self.minta4query = botslib._Transaction.processlist[-1]     #the idta of rundispatcher is rootidta of run.
+        self.routeofrun = botslib.getrouteid()      #option parallel_routes: run is for this route only (engine._runroute); else ''
         self.keep_track_if_outchannel_deferred = {}
 
     def run(self):
@@ -77,7 +90,12 @@ class new(object):
             foundroute = True
             botsglobal.logger.info('Running route %(idroute)s %(seq)s',routedict)
             #~ print('run route part')
-            self.routepart(routedict)
+            channellocks = botslib.lock_channels([routedict['fromchannel'],routedict['tochannel']])
+            try:
+                self.routepart(routedict)
+            finally:
+                for channellock in channellocks:
+                    channellock.close()
             #handle deferred-logic: mark if channel is deffered, unmark if run
             self.keep_track_if_outchannel_deferred[routedict['tochannel']] = routedict['defer']
             botsglobal.logger.debug('Finished route %(idroute)s %(seq)s',routedict)
@@ -215,7 +233,7 @@ class new(object):
 
     def evaluate(self):
         try:
-            return automaticmaintenance.evaluate(self.command,self.get_minta4query())
+            return automaticmaintenance.evaluate(self.command,self.get_minta4query(),self.routeofrun)
         except:
             botsglobal.logger.exception('Error in automatic maintenance.')
             return 1
@@ -230,33 +248,45 @@ class crashrecovery(new):
     ''' a crashed run is rerun.
         cleanup things first (all TA not OK or DONE.)
         not a new run, so no incommunication.
+        option parallel_routes: crash recovery of the runs of one route (self.routeofrun), only ta's of this route.
     '''
     def run(self):
         #get rootidta of crashed run
-        for row in botslib.query('''SELECT MAX(idta) as crashed_idta
-                                    FROM ta
-                                    WHERE idta < %(rootidta_of_current_run)s
-                                    AND script = 0 ''',
-                                    {'rootidta_of_current_run':self.minta4query}):
-            self.minta4query_crash = row['crashed_idta']
+        if self.routeofrun:
+            crashedruns = [rootidta for idroute,rootidta in botslib.crashed_routeruns(self.routeofrun) if rootidta < self.minta4query]
+            self.minta4query_crash = min(crashedruns) if crashedruns else None
+            routeselection = ' AND idroute=%(idroute)s '
+        else:
+            for row in botslib.query('''SELECT MAX(idta) as crashed_idta
+                                        FROM ta
+                                        WHERE idta < %(rootidta_of_current_run)s
+                                        AND script = 0
+                                        AND idroute = '' ''',
+                                        {'rootidta_of_current_run':self.minta4query}):
+                self.minta4query_crash = row['crashed_idta']
+            crashedruns = [self.minta4query_crash]
+            routeselection = ''
         if not self.minta4query_crash:
             return False    #no run
 
+        for rootidta in crashedruns:
+            rootofcrashedrun = botslib.OldTransaction(rootidta)
+            rootofcrashedrun.update(statust=DONE)
+            #delete run report
+            botslib.changeq('''DELETE FROM report WHERE idta = %(rootofcrashedrun)s''',{'rootofcrashedrun':rootidta})
         rootofcrashedrun = botslib.OldTransaction(self.minta4query_crash)
-        rootofcrashedrun.update(statust=DONE)
         #clean up things from crash **********************************
-        #delete run report
-        botslib.changeq('''DELETE FROM report WHERE idta = %(rootofcrashedrun)s''',{'rootofcrashedrun':rootofcrashedrun.idta})
         #delete file reports
-        botslib.changeq('''DELETE FROM filereport WHERE idta>%(rootofcrashedrun)s''',{'rootofcrashedrun':rootofcrashedrun.idta})
+        botslib.changeq('''DELETE FROM filereport WHERE idta>%(rootofcrashedrun)s''' + routeselection,
+                        {'rootofcrashedrun':rootofcrashedrun.idta,'idroute':self.routeofrun})
         #delete ta's for children of crashed merges (using child-relation)
         mergedidtatodelete = set()
         for row in botslib.query('''SELECT child  FROM ta
                                     WHERE idta > %(rootofcrashedrun)s
                                     AND statust = %(statust)s
                                     AND status != %(status)s
-                                    AND child != 0 ''',
-                                    {'rootofcrashedrun':rootofcrashedrun.idta,'status':PROCESS,'statust':OK}):
+                                    AND child != 0 ''' + routeselection,
+                                    {'rootofcrashedrun':rootofcrashedrun.idta,'status':PROCESS,'statust':OK,'idroute':self.routeofrun}):
             mergedidtatodelete.add(row['child'])
         for idta in mergedidtatodelete:
             ta_object = botslib.OldTransaction(idta)
@@ -266,12 +296,16 @@ class crashrecovery(new):
                                     WHERE idta > %(rootofcrashedrun)s
                                     AND ( statust = %(statust1)s OR statust = %(statust2)s )
                                     AND status != %(status)s
-                                    AND child = 0 ''',
-                                    {'rootofcrashedrun':rootofcrashedrun.idta,'status':PROCESS,'statust1':OK,'statust2':ERROR}):
+                                    AND child = 0 ''' + routeselection,
+                                    {'rootofcrashedrun':rootofcrashedrun.idta,'status':PROCESS,'statust1':OK,'statust2':ERROR,'idroute':self.routeofrun}):
             ta_object = botslib.OldTransaction(row['idta'])
             ta_object.deletechildren()
 
-        return super(crashrecovery, self).run()
+        terug = super(crashrecovery, self).run()
+        if self.routeofrun:     #crashed runs are recovered; if this run crashes these are recovered again
+            for rootidta in crashedruns:
+                botslib.remove_database_lock(-rootidta)
+        return terug
 
     def get_minta4query(self):
         ''' get the first idta for queries etc in  run.
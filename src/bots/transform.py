@@ -1,8 +1,10 @@
 import sys
 import os
+import time
 import copy
 import collections
 import unicodedata
+import multiprocessing
 try:
     import cPickle as pickle
 except ImportError:
@@ -14,6 +16,7 @@ from . import botsglobal
 from . import inmessage
 from . import outmessage
 from . import grammar
+from . import botsinit
 from .botsconfig import *
 ''' module contains functions to be called from user scripts. '''
 
@@ -35,17 +38,66 @@ def translate(startstatus,endstatus,routedict,rootidta):
     except botslib.BotsImportError:       #userscript is not there; other errors like syntax errors are not catched
         userscript = scriptname = None
     #select edifiles to translate
-    for rawrow in botslib.query('''SELECT idta,frompartner,topartner,filename,messagetype,testindicator,editype,charset,alt,fromchannel,filesize,frommail,tomail
+    rows = [dict(rawrow) for rawrow in botslib.query('''SELECT idta,frompartner,topartner,filename,messagetype,testindicator,editype,charset,alt,fromchannel,filesize,frommail,tomail
                                 FROM ta
                                 WHERE idta>%(rootidta)s
                                 AND status=%(status)s
                                 AND statust=%(statust)s
                                 AND idroute=%(idroute)s
                                 ORDER BY idta ''',
-                                {'status':startstatus,'statust':OK,'idroute':routedict['idroute'],'rootidta':rootidta}):
-            row = dict(rawrow)   #convert to real dictionary
+                                {'status':startstatus,'statust':OK,'idroute':routedict['idroute'],'rootidta':rootidta})]
+    translate_workers = botsglobal.ini.getint('settings','translate_workers',0)
+    if translate_workers > 1 and len(rows) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        _translate_in_pool(rows,routedict,endstatus,userscript,scriptname,translate_workers)
+    else:
+        for row in rows:
             _translate_one_file(row,routedict,endstatus,userscript,scriptname)
 
+#context for translating in worker processes; set before the worker processes are forked.
+_workercontext = {}
+
+def _translate_in_pool(rows,routedict,endstatus,userscript,scriptname,translate_workers):
+    ''' translate edifiles in a pool of worker processes (option "translate_workers" in bots.ini).
+        Each worker process has its own database connection and its own process-stack.
+        Workers do not write db-ta: changes are recorded per file and returned (botslib.tajournal).
+        Parent writes these in idta order of the incoming files, so results are the same as in serial translation.
+    '''
+    context = multiprocessing.get_context('fork')   #workers inherit initialised bots (ini, logging, imported userscripts, confirmrules)
+    _workercontext.update(routedict=routedict,endstatus=endstatus,userscript=userscript,scriptname=scriptname,
+                          processlist=list(botslib._Transaction.processlist),uniquelock=context.Lock())
+    botsglobal.logger.debug('Translate %(nr)s files using %(workers)s worker processes.',{'nr':len(rows),'workers':translate_workers})
+    pool = context.Pool(processes=min(translate_workers,len(rows)),initializer=_init_translate_worker)
+    try:
+        for tajournal in pool.imap(_translate_in_worker,rows):     #imap: results are in same order as rows (idta order)
+            botslib.replay_tajournal(tajournal)
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        _workercontext.clear()
+
+def _init_translate_worker():
+    ''' initialise worker process: own database connection, own process-stack.
+        The connection inherited from parent is kept as it is: closing it (also via garbage collection) would close
+        the socket that is shared with the parent process (postgreSQL, MySQL).
+    '''
+    _workercontext['inherited_db'] = botsglobal.db
+    botsinit.connect()
+    botslib._Transaction.processlist = list(_workercontext['processlist'])
+    botsglobal.uniquelock = _workercontext['uniquelock']
+
+def _translate_in_worker(row):
+    ''' translate one edifile in worker process; returns the journal of changes of db-ta.'''
+    botsglobal.tajournal = []
+    try:
+        _translate_one_file(row,_workercontext['routedict'],_workercontext['endstatus'],_workercontext['userscript'],_workercontext['scriptname'])
+        return botsglobal.tajournal
+    finally:
+        botsglobal.tajournal = None
+
 def _translate_one_file(row,routedict,endstatus,userscript,scriptname):
     ''' -   read, lex, parse, make tree of nodes.
         -   split up files into messages (using 'nextmessage' of grammar)
@@ -55,8 +107,12 @@ def _translate_one_file(row,routedict,endstatus,userscript,scriptname):
     try:
         ta_fromfile = botslib.OldTransaction(row['idta'])
         ta_parsed = ta_fromfile.copyta(status=PARSED)
-        if row['filesize'] > botsglobal.ini.getint('settings','maxfilesizeincoming',5000000):
-            ta_parsed.update(filesize=row['filesize'])
+        botslib.begin_unitofwork()      #changes in db-ta for this file are written and committed at end of file
+        #big edifact, x12, tradacoms, xml, json files can be parsed message by message (streaming).
+        #inmessage checks maxfilesizeincoming if the file is not streamed after all (eg depending on grammar).
+        streaming = (0 < botsglobal.ini.getint('settings','streaming_filesize',0) < row['filesize']
+                        and row['editype'] in ('edifact','x12','tradacoms','xml','xmlnocheck','json','jsonnocheck') and int(routedict['translateind']) != 3)
+        if not streaming and row['filesize'] > botsglobal.ini.getint('settings','maxfilesizeincoming',5000000):
             raise botslib.FileTooLargeError('File size of %(filesize)s is too big; option "maxfilesizeincoming" in bots.ini is %(maxfilesizeincoming)s.',
                                             {'filesize':row['filesize'],'maxfilesizeincoming':botsglobal.ini.getint('settings','maxfilesizeincoming',5000000)})
         botsglobal.logger.debug('Start translating file "%(filename)s" editype "%(editype)s" messagetype "%(messagetype)s".',row)
@@ -74,7 +130,8 @@ def _translate_one_file(row,routedict,endstatus,userscript,scriptname):
                                             frommail=row['frommail'],
                                             tomail=row['tomail'],
                                             idroute=routedict['idroute'],
-                                            command=routedict['command'])
+                                            command=routedict['command'],
+                                            streaming=streaming)
         edifile.checkforerrorlist() #no exception if infile has been lexed and parsed OK else raises an error
 
         if int(routedict['translateind']) == 3: #parse & passthrough; file is parsed, partners are known, no mapping, does confirm.
@@ -203,11 +260,12 @@ def _translate_one_file(row,routedict,endstatus,userscript,scriptname):
         edifile.handleconfirm(ta_fromfile,routedict,error=False)
         botsglobal.logger.debug('Parse & passthrough for input file "%(filename)s".',row)
     except botslib.FileTooLargeError as msg:
-        ta_parsed.update(statust=ERROR,errortext=unicode(msg))
+        ta_parsed.update(statust=ERROR,errortext=unicode(msg),filesize=row['filesize'])
         ta_parsed.deletechildren()
         botsglobal.logger.debug('Error in translating input file "%(filename)s":\n%(msg)s',{'filename':row['filename'],'msg':msg})
     except:
         txt = botslib.txtexc()
+        botslib.rollback_unitofwork()   #discard uncommitted results of this file
         ta_parsed.update(statust=ERROR,errortext=txt,**edifile.ta_info)
         ta_parsed.deletechildren()
         edifile.handleconfirm(ta_fromfile,routedict,error=True)
@@ -218,6 +276,7 @@ def _translate_one_file(row,routedict,endstatus,userscript,scriptname):
         botsglobal.logger.debug('Translated input file "%(filename)s".',row)
     finally:
         ta_fromfile.update(statust=DONE)
+        botslib.end_unitofwork()
 
 
 def handle_out_message(out_translated,ta_translated):
@@ -299,15 +358,113 @@ def persist_lookup(domein,botskey):
 #*********************************************************************
 #*** utily functions for codeconversion via database table ccode
 #*********************************************************************
+#code conversions (and partner lookups) are cached in memory, per process:
+#- a ccodeid (or the partner table) is read at once on first use.
+#- if a ccodeid has more than ccode_cache_size rows, only the looked-up codes are kept (LRU).
+#- each ccode_cache_seconds a change counter in table uniek is checked; this is increased when codes or partners are changed via GUI.
+#  if changed, the cache is emptied.
+#lookups of values that are not strings are not cached.
+CCODECACHE_DOMEIN = 'bots__ccodecache'     #same string is used in models.py
+_ccodetables = {}                          #key: ('ccode',ccodeid) or ('partner',); value: {'rows':[..],'index':{searchfield:{value:[rows]}}} or None if too big
+_ccodelookups = collections.OrderedDict()  #LRU for lookups in tables that are too big
+_ccodecache_state = {'checked':None,'changes':None}
+_ccodecache_stats = {'hit':0,'miss':0}
+
+def clear_ccode_cache():
+    ''' empty the cache of code conversions; eg use in user script after changing table ccode.'''
+    _ccodetables.clear()
+    _ccodelookups.clear()
+
+def _check_ccode_cache():
+    ''' empty the cache if codes or partners are changed via GUI; checked at most each ccode_cache_seconds.'''
+    now = time.time()
+    if _ccodecache_state['checked'] is not None and now - _ccodecache_state['checked'] < botsglobal.ini.getint('settings','ccode_cache_seconds',60):
+        return
+    _ccodecache_state['checked'] = now
+    changes = 0
+    for row in botslib.query('''SELECT nummer
+                                FROM uniek
+                                WHERE domein=%(domein)s''',
+                                {'domein':CCODECACHE_DOMEIN}):
+        changes = row['nummer']
+    if changes != _ccodecache_state['changes']:
+        clear_ccode_cache()
+        _ccodecache_state['changes'] = changes
+
+def _readtable(key):
+    ''' read a ccodeid or the partner table in memory; returns None if too big.'''
+    if key[0] == 'ccode':
+        where,orderby,params = 'WHERE ccodeid_id = %(ccodeid)s','ORDER BY id',{'ccodeid':key[1]}
+    else:
+        where,orderby,params = '','',{}
+    for row in botslib.query('''SELECT COUNT(*) as count
+                                FROM ''' + key[0] + ''' ''' + where,params):
+        if row['count'] > botsglobal.ini.getint('settings','ccode_cache_size',10000):
+            return None
+    rows = []
+    for row in botslib.query('''SELECT *
+                                FROM ''' + key[0] + ''' ''' + where + ''' ''' + orderby,params):
+        rows.append(dict((field,row[field]) for field in row.keys()))
+    return {'rows':rows,'index':{}}
+
+def _lookup(key,searchfield,value,field):
+    ''' returns list of values of field for rows where searchfield is value (for ccode: ordered by id).
+        key is ('ccode',ccodeid) or ('partner',).
+    '''
+    if not isinstance(value,str):
+        return _lookup_sql(key,searchfield,value,field)
+    _check_ccode_cache()
+    if key not in _ccodetables:
+        _ccodetables[key] = table = _readtable(key)
+        if table is not None:
+            _ccodecache_stats['miss'] += 1
+    else:
+        table = _ccodetables[key]
+        if table is not None:
+            _ccodecache_stats['hit'] += 1
+    if table is not None:
+        if table['rows'] and (searchfield not in table['rows'][0] or field not in table['rows'][0]):
+            return _lookup_sql(key,searchfield,value,field)     #not a plain field name
+        if searchfield not in table['index']:
+            index = table['index'][searchfield] = {}
+            for row in table['rows']:
+                index.setdefault(row[searchfield],[]).append(row)
+        return [row[field] for row in table['index'][searchfield].get(value,())]
+    #too big to read in memory: keep looked-up codes.
+    lookupkey = (key,searchfield,value,field)
+    if lookupkey in _ccodelookups:
+        _ccodecache_stats['hit'] += 1
+        _ccodelookups[lookupkey] = _ccodelookups.pop(lookupkey)     #move to end: most recently used
+        return _ccodelookups[lookupkey]
+    _ccodecache_stats['miss'] += 1
+    _ccodelookups[lookupkey] = terug = _lookup_sql(key,searchfield,value,field)
+    while len(_ccodelookups) > botsglobal.ini.getint('settings','ccode_cache_size',10000):
+        _ccodelookups.popitem(last=False)   #remove least recently used
+    return terug
+
+def _lookup_sql(key,searchfield,value,field):
+    ''' as _lookup, but via query.'''
+    if key[0] == 'ccode':
+        return [row[field] for row in botslib.query('''SELECT ''' +field+ '''
+                                                        FROM ccode
+                                                        WHERE ccodeid_id = %(ccodeid)s
+                                                        AND ''' +searchfield+ ''' = %(value)s
+                                                        ORDER BY id''',
+                                                        {'ccodeid':key[1],'value':value})]
+    return [row[field] for row in botslib.query('''SELECT ''' +field+ '''
+                                                    FROM partner
+                                                    WHERE ''' +searchfield+ ''' = %(value)s
+                                                    ''',{'value':value})]
+
+def log_ccode_cache_statistics():
+    ''' log the use of the code conversion cache (at end of run).'''
+    botsglobal.logger.info('Code conversion cache: %(hit)s hits, %(miss)s misses.',_ccodecache_stats)
+
 def ccode(ccodeid,leftcode,field='rightcode',safe=False):
     ''' converts code using a db-table ccode.
     '''
-    for row in botslib.query('''SELECT ''' +field+ '''
-                                FROM ccode
-                                WHERE ccodeid_id = %(ccodeid)s
-                                AND leftcode = %(leftcode)s''',
-                                {'ccodeid':ccodeid,'leftcode':leftcode}):
-        return row[field]
+    for value in _lookup(('ccode',ccodeid),'leftcode',leftcode,field):
+        return value
     if safe is None:
         return None
     elif safe:
@@ -321,12 +478,8 @@ def safe_ccode(ccodeid,leftcode,field='rightcode'):   #depreciated, use ccode wi
 
 def reverse_ccode(ccodeid,rightcode,field='leftcode',safe=False):
     ''' as ccode but reversed lookup.'''
-    for row in botslib.query('''SELECT ''' +field+ '''
-                                FROM ccode
-                                WHERE ccodeid_id = %(ccodeid)s
-                                AND rightcode = %(rightcode)s''',
-                                {'ccodeid':ccodeid,'rightcode':rightcode}):
-        return row[field]
+    for value in _lookup(('ccode',ccodeid),'rightcode',rightcode,field):
+        return value
     if safe is None:
         return None
     elif safe:
@@ -348,15 +501,7 @@ safercodetconversion = safe_reverse_ccode
 def getcodeset(ccodeid,leftcode,field='rightcode'):
     ''' Returns a list of all 'field' values in ccode with right ccodeid and leftcode.
     '''
-    terug = []
-    for row in botslib.query('''SELECT ''' +field+ '''
-                                FROM ccode
-                                WHERE ccodeid_id = %(ccodeid)s
-                                AND leftcode = %(leftcode)s
-                                ORDER BY id''',
-                                {'ccodeid':ccodeid,'leftcode':leftcode}):
-        terug.append(row[field])
-    return  terug
+    return list(_lookup(('ccode',ccodeid),'leftcode',leftcode,field))
 
 #*********************************************************************
 #*** utily functions for calculating/generating/checking EAN/GTIN/GLN
@@ -478,12 +623,9 @@ def partnerlookup(value,field,field_where_value_is_searched='idpartner',safe=Fal
         - False: if not found throw exception
         - None: if not found, return None
     '''
-    for row in botslib.query('''SELECT ''' +field+ '''
-                                FROM partner
-                                WHERE '''+field_where_value_is_searched+ ''' = %(value)s
-                                ''',{'value':value}):
-        if row[field]:
-            return row[field]
+    for fieldvalue in _lookup(('partner',),field_where_value_is_searched,value,field):
+        if fieldvalue:
+            return fieldvalue
     #nothing found in partner table
     if safe is None:
         return None
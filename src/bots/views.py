@@ -637,6 +637,7 @@ def delete(request,*kw,**kwargs):
                     cursor = connection.cursor()
                     cursor.execute('''DELETE FROM ccode''')
                     cursor.execute('''DELETE FROM ccodetrigger''')
+                    models.codes_changed()
                     if django.VERSION[0] <= 1 and django.VERSION[1] <= 5 :
                         transaction.commit_unless_managed()
                     notification = 'User code lists are deleted.'
@@ -0,0 +1,274 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import os
+import glob
+import timeit
+import tempfile
+import shutil
+import tracemalloc
+try:
+    from xml.etree import cElementTree as ET
+except ImportError:
+    from xml.etree import ElementTree as ET
+import bots.inmessage as inmessage
+import bots.outmessage as outmessage
+import bots.grammar as grammar
+import bots.preprocess as preprocess
+import bots.envelope as envelope
+import bots.botssqlite as botssqlite
+import bots.botslib as botslib
+import bots.botsinit as botsinit
+import bots.botsglobal as botsglobal
+import bots.node as node
+from bots.botsconfig import *
+if sys.version_info[0] > 2:
+    basestring = unicode = str
+
+''' benchmarks for speed-ups in bots.
+    uses plugin unitformats (edi files in botssys/infile/unitformats).
+    not an acceptance-test; prints timings.
+'''
+
+def lex_charbychar(edifile):
+    ''' lex whole file with the char by char lexer (as bots did before fast lexing).'''
+    index,countline,countpos = 0,1,0
+    while index < len(edifile.rawinput):
+        index,countline,countpos,lex_record = edifile._lex_charbychar(index,countline,countpos)
+        if lex_record is not None:
+            edifile.lex_records.append(lex_record)
+
+def benchmark_lexer(editype,messagetype,filenames,number=5):
+    ''' compare fast lexer (var._lex) with char by char lexer; check if results are the same.'''
+    for filename in filenames:
+        #as in Inmessage.initfromfile, but only till lexing
+        edifile = getattr(inmessage,editype)({'editype':editype,'messagetype':messagetype,'filename':filename})
+        edifile.messagegrammarread(typeofgrammarfile='grammars')
+        edifile._readcontent_edifile()
+        edifile._sniff()
+        edifile._lex()
+        fast_records = edifile.lex_records
+        edifile.lex_records = []
+        lex_charbychar(edifile)
+        if fast_records != edifile.lex_records:
+            print('    DIFFERENT RESULTS:',filename)
+        def fast():
+            edifile.lex_records = []
+            edifile._lex()
+        def charbychar():
+            edifile.lex_records = []
+            lex_charbychar(edifile)
+        time_fast = timeit.timeit(fast,number=number)
+        time_charbychar = timeit.timeit(charbychar,number=number)
+        print('    %-60s %8d chars; fast: %.4fs; char by char: %.4fs; factor %.1f'%(filename,len(edifile.rawinput),time_fast,time_charbychar,time_charbychar/(time_fast or 1e-9)))
+
+def parse_file(editype,messagetype,filename,**ta_info):
+    ''' read, lex and parse edi file; check for errors.'''
+    edifile = inmessage.parse_edi_file(editype=editype,messagetype=messagetype,filename=filename,frompartner='',topartner='',**ta_info)
+    edifile.checkforerrorlist()
+    return edifile
+
+def tree_records(inode):
+    ''' generator: records of all nodes in tree, as dicts.'''
+    if inode.record is not None:
+        yield dict(inode.record)
+    for childnode in inode.children:
+        for record in tree_records(childnode):
+            yield record
+
+def benchmark_compact_records(editype,messagetype,filenames):
+    ''' compare memory use of node tree with and without compact records (syntax parameter compact_records); check if results are the same.'''
+    for filename in filenames:
+        results = []
+        for compact_records in (False,True):
+            tracemalloc.start()
+            edifile = parse_file(editype,messagetype,filename,compact_records=compact_records)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            results.append((size,list(tree_records(edifile.root))))
+            del edifile
+        if results[0][1] != results[1][1]:
+            print('    DIFFERENT RESULTS:',filename)
+        print('    %-60s memory of tree: dict %8d; compact %8d; factor %.1f'%(filename,results[0][0],results[1][0],results[0][0]/(results[1][0] or 1)))
+
+MAILBAG_X12 = 'ISA*00*          *00*          *ZZ*SENDER         *ZZ*RECEIVER       *200101*1253*U*00401*000000001*0*P*>~GS*PO*S*R*20200101*1253*1*X*004010~ST*850*0001~BEG*00*SA*1~SE*3*0001~GE*1*1~IEA*1*000000001~\n'
+MAILBAG_EDIFACT = "UNA:+.? 'UNB+UNOA:2+S+R+200101:1253+1'UNH+1+ORDERS:D:96A:UN'BGM+220+1'UNT+3+1'UNZ+1+1'\n"
+
+def benchmark_mailbag(sizes):
+    ''' split synthetic mailbags (x12 and edifact interchanges) of sizes (in MB); time should grow linear with size.'''
+    for size in sizes:
+        edifile = (MAILBAG_X12 + MAILBAG_EDIFACT) * (size * 2**20 // (len(MAILBAG_X12) + len(MAILBAG_EDIFACT)))
+        nr_interchanges = [0]
+        def split():
+            nr_interchanges[0] = sum(1 for span in preprocess.split_interchanges(edifile))
+        time_split = timeit.timeit(split,number=1)
+        print('    %4d MB: %7d interchanges; %.3fs; %.1f MB/s'%(size,nr_interchanges[0],time_split,size/(time_split or 1e-9)))
+
+def synthetic_lex_records(nr_records,separators):
+    ''' lex_records of 10 fields each; some fields are subfields, some content contains separators.'''
+    lex_records = []
+    for counter in range(nr_records):
+        lex_record = []
+        for fieldnr in range(10):
+            field = [None] * 10
+            field[VALUE] = 'SEG%d'%(counter%50) if not fieldnr else ('value %d'%(counter*fieldnr) + (separators[fieldnr%len(separators)] if fieldnr == 7 else ''))
+            field[SFIELD] = 1 if fieldnr in (4,5) else 0
+            field[FORMATFROMGRAMMAR] = 'AN'
+            lex_record.append(field)
+        lex_records.append(lex_record)
+    return lex_records
+
+def benchmark_record2string(editype,nr_records,number=5):
+    ''' serialise synthetic lex_records with outmessage.record2string (escaping via translate-tables).'''
+    ta_info = dict(getattr(grammar,editype).defaultsyntax)
+    ta_info['replacechar'] = '_'
+    out = getattr(outmessage,editype)(ta_info)
+    lex_records = synthetic_lex_records(nr_records,ta_info['field_sep'] + ta_info['sfield_sep'] + ta_info['quote_char'])
+    size = len(out.record2string(lex_records))
+    time_record2string = timeit.timeit(lambda: out.record2string(lex_records),number=number) / number
+    print('    %-10s %8d records; %8d chars; %.4fs; %.1f MB/s'%(editype,nr_records,size,time_record2string,size/2.**20/(time_record2string or 1e-9)))
+
+FIELDVALUES = {'A':'some text','D':'20240229','T':'123059','R':'-1234.50','N':'1234.56','I':'123456'}
+
+def benchmark_formatfields(nr_records,nr_fields=60):
+    ''' check and format fields (as in Inmessage.checkmessage) of synthetic records with all field formats.'''
+    field_definitions = []
+    for counter in range(nr_fields):
+        field_definition = [None] * 9
+        field_definition[ID] = 'F%02d'%counter
+        field_definition[MANDATORY] = 'C'
+        field_definition[LENGTH] = 12
+        field_definition[FORMAT] = field_definition[BFORMAT] = 'ADTRNI'[counter%6]
+        field_definition[ISFIELD] = True
+        field_definition[DECIMALS] = 2
+        field_definition[MINLENGTH] = 0
+        field_definition[MAXREPEAT] = 1
+        field_definitions.append(field_definition)
+    record_definition = [None] * 10
+    record_definition[ID] = 'LIN'
+    record_definition[MPATH] = ['LIN']
+    record_definition[FIELDS] = field_definitions
+    record = dict((field_definition[ID],FIELDVALUES[field_definition[BFORMAT]]) for field_definition in field_definitions)
+    record['BOTSID'] = 'LIN'
+    edifile = inmessage.edifact({'editype':'edifact','messagetype':'','decimaal':'.','triad':'','lengthnumericbare':False})
+    nodes = [node.Node(record=dict(record)) for counter in range(nr_records)]
+    time_fields = timeit.timeit(lambda: [edifile._canonicalfields(inode,record_definition) for inode in nodes],number=1)
+    if edifile.errorlist:
+        print('    ERRORS:',edifile.errorlist[:3])
+    print('    %8d records of %d fields; %.4fs; %.0f fields/s'%(nr_records,nr_fields,time_fields,nr_records*nr_fields/(time_fields or 1e-9)))
+
+def benchmark_canonicaltree(nr_definitions,nr_children,number=5):
+    ''' check/sort tree (Message._canonicaltree) for segment group with many record definitions and many records.'''
+    structure = {ID:'UNH',MIN:1,MAX:1,BOTSIDNR:'1',MPATH:['UNH'],FIELDS:[],LEVEL:[]}
+    for counter in range(nr_definitions):
+        structure[LEVEL].append({ID:'S%03d'%counter,MIN:0,MAX:nr_children,BOTSIDNR:'1',MPATH:['UNH','S%03d'%counter],FIELDS:[]})
+    edifile = inmessage.edifact({'editype':'edifact','messagetype':''})
+    root = node.Node(record={'BOTSID':'UNH','BOTSIDnr':'1'})
+    for counter in range(nr_children):
+        root.append(node.Node(record={'BOTSID':'S%03d'%(counter%nr_definitions),'BOTSIDnr':'1'}))
+    time_canonicaltree = timeit.timeit(lambda: edifile._canonicaltree(root,structure),number=number) / number
+    print('    %4d record definitions %6d records: %.4fs'%(nr_definitions,nr_children,time_canonicaltree))
+
+def benchmark_xmlwrite(nr_records):
+    ''' write synthetic xml message (xmlnocheck) while walking the node tree; compare with building and writing an ElementTree (as done for envelopes).'''
+    ta_info = dict(grammar.xmlnocheck.defaultsyntax)
+    ta_info['indented'] = True
+    out = outmessage.xmlnocheck(ta_info)
+    root = node.Node(record={'BOTSID':'orders','sender':'S','receiver':'R'})
+    for counter in range(nr_records):
+        root.append(node.Node(record={'BOTSID':'line','line__nr':'%d'%counter,'item':'item %d'%counter,'quantity':'%d'%(counter%100),'description':'fish & chips'}))
+    def streamwrite():
+        out._write(root)
+    def etreewrite():
+        xmltree = ET.ElementTree(out._node2xml(root))
+        botslib.indent_xml(xmltree.getroot())
+        xmltree.write(out._outstream,encoding=ta_info['charset'],xml_declaration=False)
+    results = []
+    for write in (streamwrite,etreewrite):
+        with open(os.devnull,'wb') as out._outstream:
+            time_write = timeit.timeit(write,number=1)
+            tracemalloc.start()
+            write()
+            results.append((time_write,tracemalloc.get_traced_memory()[1]))
+            tracemalloc.stop()
+    print('    %8d records; stream: %.4fs, peak memory %8d; etree: %.4fs, peak memory %8d'%(nr_records,results[0][0],results[0][1],results[1][0],results[1][1]))
+
+def benchmark_fixed(size,nr_fields=400):
+    ''' lex and parse fields of synthetic fixed file (idoc-like records of many fields) of size (in MB).'''
+    record_definition = {ID:'E1EDP01',BOTSIDNR:'1',FIXED_RECORD_LENGTH:10 + 5 * nr_fields,
+                         FIELDS:[['BOTSID',True,10,'A',True,0,0,'A',1]] + [['F%03d'%counter,False,5,'A',True,0,0,'A',1] for counter in range(nr_fields)]}
+    line = 'E1EDP01   ' + ''.join('%-5d'%(counter%997) if counter%3 else '     ' for counter in range(nr_fields)) + '\r\n'
+    nr_records = size * 2**20 // len(line)
+    handle,filename = tempfile.mkstemp(suffix='.fix')
+    with os.fdopen(handle,'w') as outfile:
+        for counter in range(nr_records):
+            outfile.write(line)
+    ta_info = dict(grammar.fixed.defaultsyntax)
+    ta_info.update(editype='fixed',messagetype='',filename=filename,startrecordID=0,endrecordID=10,compact_records=False)
+    edifile = inmessage.fixed(ta_info)
+    def lex():
+        edifile._readcontent_edifile()
+        edifile._lex()
+    def parsefields():
+        for lex_record in edifile.lex_records:
+            edifile._parsefields(lex_record,record_definition)
+    time_lex = timeit.timeit(lex,number=1)
+    time_parsefields = timeit.timeit(parsefields,number=1)
+    os.remove(filename)
+    print('    %4d MB: %7d records of %d fields; lex: %.3fs, %.1f MB/s; parse fields: %.3fs, %.0f fields/s'%(size,nr_records,nr_fields,time_lex,size/(time_lex or 1e-9),time_parsefields,nr_records*nr_fields/(time_parsefields or 1e-9)))
+
+def benchmark_mergemessages(nr_messages,nr_interchanges,charset='utf-8'):
+    ''' merge small messages (no envelope) to interchanges; uses a temporary SQLite database and data directory.'''
+    tmpdir = tempfile.mkdtemp()
+    olddb,olddatadir = getattr(botsglobal,'db',None),botsglobal.ini.get('directories','data')
+    botsglobal.ini.set('directories','data',tmpdir)
+    botsglobal.db = botssqlite.connect(os.path.join(tmpdir,'botsdb'))
+    with open('bots/sql/ta.sqlite3.sql') as sqlfile:
+        botsglobal.db.executescript(sqlfile.read().split(';',1)[1])    #skip DROP TABLE
+    try:
+        botslib.begin_unitofwork()
+        for counter in range(nr_messages):
+            ta_message = botslib.NewTransaction(status=TRANSLATED,statust=OK,idroute='benchmark',editype='fixed',messagetype='benchmark',
+                                                frompartner='P%d'%(counter%nr_interchanges),topartner='T',testindicator='0',charset=charset,
+                                                merge=True,nrmessages=1,rsrv5='{"envelope_content":[{}],"syntax":{}}')
+            with botslib.opendata(unicode(ta_message.idta),'wb',charset) as outfile:
+                outfile.write('LINE %08d some content of a small message\n'%counter*5)
+            ta_message.update(filename=unicode(ta_message.idta))
+        botslib.end_unitofwork()
+        time_merge = timeit.timeit(lambda: envelope.mergemessages(startstatus=TRANSLATED,endstatus=MERGED,idroute='benchmark',rootidta=0),number=1)
+        nr_merged = sum(1 for row in botslib.query('''SELECT idta FROM ta WHERE status=%(status)s AND statust=%(statust)s''',{'status':MERGED,'statust':OK}))
+        print('    %-8s %6d messages to %4d interchanges (%d): %.3fs; %.0f messages/s'%(charset,nr_messages,nr_interchanges,nr_merged,time_merge,nr_messages/(time_merge or 1e-9)))
+    finally:
+        botsglobal.db.close()
+        botsglobal.db = olddb
+        botsglobal.ini.set('directories','data',olddatadir)
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    print('lexer edifact:')
+    benchmark_lexer('edifact','edifact',glob.glob('bots/botssys/infile/unitformats/edifact/*.edi'))
+    print('lexer x12:')
+    benchmark_lexer('x12','x12',glob.glob('bots/botssys/infile/unitformats/x12/*.edi'))
+    print('lexer csv:')
+    benchmark_lexer('csv','invoice',glob.glob('bots/botssys/infile/unitformats/csv/*.csv'))
+    print('compact records fixed:')
+    benchmark_compact_records('fixed','invoicfixed',glob.glob('bots/botssys/infile/unitformats/fixed/*.fix'))
+    print('mailbag:')
+    benchmark_mailbag([5,10,25,50])
+    print('record2string:')
+    for editype in ('edifact','x12','tradacoms','csv'):
+        benchmark_record2string(editype,100000)
+    print('format fields:')
+    benchmark_formatfields(10000)
+    print('canonical tree, wide segment groups:')
+    for nr_definitions in (10,50,200):
+        benchmark_canonicaltree(nr_definitions,5000)
+    print('write xml:')
+    benchmark_xmlwrite(100000)
+    print('fixed, records of 400 fields:')
+    benchmark_fixed(100)
+    print('merge messages:')
+    for charset in ('utf-8','utf-16'):
+        benchmark_mergemessages(50000,100,charset)
@@ -0,0 +1,63 @@
+from __future__ import print_function
+import unittest
+import bots.botsglobal as botsglobal
+import bots.botsinit as botsinit
+import bots.botslib as botslib
+import bots.inmessage as inmessage
+from bots.botsconfig import *
+
+''' parsing of fields of fixed records (inmessage.fixed._parsefields).
+    no plugin needed.
+'''
+
+def makerecorddefinition():
+    ''' record definition as made by grammar.py: BOTSID (3 pos), field A (5 pos), field B (2 pos).'''
+    fields = [['BOTSID','M',3,'AN',True,0,3,'A',1],
+              ['A','C',5,'AN',True,0,5,'A',1],
+              ['B','C',2,'AN',True,0,2,'A',1]]
+    return {ID:'HEA',MIN:1,MAX:1,BOTSIDNR:'1',FIELDS:fields,FIXED_RECORD_LENGTH:10}
+
+def lexrecord(line,botsid='HEA'):
+    return [{VALUE:botsid,LIN:1,POS:0,FIXEDLINE:line}]
+
+
+class TestParseFields(unittest.TestCase):
+    def parsefields(self,record_definition,line,noBOTSID=False,compact_records=False,tooshort=False,toolong=False):
+        edifile = inmessage.fixed({'noBOTSID':noBOTSID,'compact_records':compact_records,
+                                   'checkfixedrecordtooshort':tooshort,'checkfixedrecordtoolong':toolong})
+        return dict(edifile._parsefields(lexrecord(line),record_definition))
+
+    def testfields(self):
+        for compact_records in (False,True):
+            record_definition = makerecorddefinition()
+            self.assertEqual(self.parsefields(record_definition,'HEA ab  12',compact_records=compact_records),
+                             {'BOTSID':'HEA','A':'ab','B':'12','BOTSIDnr':'1'})
+            #empty fields are not in record; short record: missing fields are empty
+            self.assertEqual(self.parsefields(record_definition,'HEA     ',compact_records=compact_records),{'BOTSID':'HEA','BOTSIDnr':'1'})
+            self.assertEqual(self.parsefields(record_definition,'HEAabcdefg',compact_records=compact_records),
+                             {'BOTSID':'HEA','A':'abcde','B':'fg','BOTSIDnr':'1'})
+
+    def testnoBOTSID(self):
+        ''' same record definition (grammar is read once) is used with and without noBOTSID: positions of fields differ.'''
+        for compact_records in (False,True):
+            record_definition = makerecorddefinition()
+            self.assertEqual(self.parsefields(record_definition,'abcde12',noBOTSID=True,compact_records=compact_records),
+                             {'BOTSID':'HEA','A':'abcde','B':'12','BOTSIDnr':'1'})
+            self.assertEqual(self.parsefields(record_definition,'HEAabcde12',compact_records=compact_records),
+                             {'BOTSID':'HEA','A':'abcde','B':'12','BOTSIDnr':'1'})
+            self.assertEqual(self.parsefields(record_definition,'xy   34',noBOTSID=True,compact_records=compact_records),
+                             {'BOTSID':'HEA','A':'xy','B':'34','BOTSIDnr':'1'})
+
+    def testrecordlength(self):
+        record_definition = makerecorddefinition()
+        self.assertRaises(botslib.InMessageError,self.parsefields,record_definition,'HEAab',tooshort=True)
+        self.assertRaises(botslib.InMessageError,self.parsefields,record_definition,'HEAabcdefgh',toolong=True)
+        self.assertEqual(self.parsefields(record_definition,'HEAabcdefgh'),{'BOTSID':'HEA','A':'abcde','B':'fg','BOTSIDnr':'1'})
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()
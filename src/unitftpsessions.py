@@ -0,0 +1,186 @@
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import bots.botsglobal as botsglobal
+import bots.botslib as botslib
+import bots.botsinit as botsinit
+import bots.communication as communication
+from bots.botsconfig import *
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+except ImportError:
+    ThreadedFTPServer = None
+
+''' incoming ftp with one or more sessions (setting ftpsessions), against a local ftp server (pyftpdlib).
+    incoming sftp against a stand-in for paramiko.SFTPClient that uses a local directory.
+    no plugin needed; uses database and data directory of config.
+'''
+
+class TestSessions(unittest.TestCase):
+    sessionclass = None     #communication class to test
+
+    def fetch(self,nr_sessions,contents):
+        ''' put files on server, fetch these; returns {filename on server: content of received file}.'''
+        for filename,content in contents.items():
+            with open(os.path.join(self.serverdir,filename),'wb') as serverfile:
+                serverfile.write(content)
+        botsglobal.ini.set('settings','ftpsessions',str(nr_sessions))
+        session = self.sessionclass(self.channeldict,'unitftpsessions',None,None,'new',0)
+        session.maxsecondsperchannel = sys.maxsize
+        session.connect_tries()
+        for row in botslib.query('''SELECT MAX(idta) as max_idta FROM ta'''):
+            idta_before = row['max_idta'] or 0
+        session.incommunicate()
+        session.disconnect()
+        received = {}
+        for row in botslib.query('''SELECT ta.filename as filename,ta_from.filename as fromfilename
+                                    FROM ta,ta ta_from
+                                    WHERE ta.idta>%(idta)s
+                                    AND ta.status=%(status)s
+                                    AND ta.statust=%(statust)s
+                                    AND ta_from.idta=ta.parent ''',
+                                    {'idta':idta_before,'status':FILEIN,'statust':OK}):
+            received[row['fromfilename'].rsplit('/',1)[-1]] = botslib.readdata_bin(row['filename'])
+        return received
+
+
+@unittest.skipIf(ThreadedFTPServer is None,'pyftpdlib is not installed')
+class TestFtpSessions(TestSessions):
+    sessionclass = communication.ftp
+
+    @classmethod
+    def setUpClass(cls):
+        cls.serverdir = tempfile.mkdtemp()
+        authorizer = DummyAuthorizer()
+        authorizer.add_user('bots','botsbots',cls.serverdir,perm='elrdfmw')
+        handler = FTPHandler
+        handler.authorizer = authorizer
+        cls.server = ThreadedFTPServer(('127.0.0.1',0),handler)
+        cls.port = cls.server.socket.getsockname()[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever,kwargs={'timeout':0.1})
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close_all()
+        shutil.rmtree(cls.serverdir,ignore_errors=True)
+
+    def setUp(self):
+        self.channeldict = {'idchannel':'unitftpsessions_in','type':'ftp','inorout':'in','host':'127.0.0.1','port':self.port,
+                            'username':'bots','secret':'botsbots','ftpaccount':'','ftpactive':False,'ftpbinary':True,
+                            'path':'','filename':'*.edi','remove':True,'rsrv1':None,'rsrv2':None,'archivepath':''}
+
+    def testonesession(self):
+        contents = dict(('one%s.edi'%i,b'UNA:+.? \'' * (i + 1)) for i in range(5))
+        self.assertEqual(self.fetch(1,contents),contents)
+        self.assertEqual(os.listdir(self.serverdir),[],'files are removed from server')
+
+    def testsessions(self):
+        contents = dict(('more%s.edi'%i,os.urandom(1000 * i + 1)) for i in range(25))
+        contents['empty.edi'] = b''     #empty file is not received, no error
+        os.mkdir(os.path.join(self.serverdir,'directory.edi'))      #directory is not received, no error
+        expected = dict((filename,content) for filename,content in contents.items() if content)
+        self.assertEqual(self.fetch(4,contents),expected)
+        self.assertEqual(sorted(os.listdir(self.serverdir)),['directory.edi','empty.edi'])
+        os.rmdir(os.path.join(self.serverdir,'directory.edi'))
+        os.remove(os.path.join(self.serverdir,'empty.edi'))
+
+    def testconnecttries(self):
+        class ftpcount(communication.ftp):
+            nr_connects = 0
+            def connect(self):
+                ftpcount.nr_connects += 1
+                if ftpcount.nr_connects < 3:
+                    raise botslib.CommunicationError('Connection refused.')
+                super(ftpcount,self).connect()
+        botsglobal.ini.set('settings','maxconnectiontries','3')
+        session = ftpcount(self.channeldict,'unitftpsessions',None,None,'new',0)
+        session.connect_tries()     #connects at third try
+        session.disconnect()
+        self.assertEqual(ftpcount.nr_connects,3)
+        ftpcount.nr_connects = -10
+        self.assertRaises(botslib.CommunicationError,session.connect_tries)
+        self.assertEqual(ftpcount.nr_connects,-7)
+
+
+class SFTPClientStandin(object):
+    ''' stand-in for paramiko.SFTPClient (methods used by communication.sftp); files are in a local directory.'''
+    def __init__(self,serverdir):
+        self.serverdir = serverdir
+        self.blocksizes = []    #size of blocks written by getfo
+
+    def chdir(self,path):
+        pass
+
+    def getcwd(self):
+        return '/'
+
+    def listdir(self,path):
+        return os.listdir(self.serverdir)
+
+    def getfo(self,remotepath,fl,callback=None,prefetch=True):
+        ''' as paramiko: copy remote file to open file object fl in blocks; returns number of bytes copied.'''
+        size = 0
+        with open(os.path.join(self.serverdir,remotepath),'rb') as remotefile:
+            while True:
+                data = remotefile.read(32768)
+                if not data:
+                    break
+                fl.write(data)
+                size += len(data)
+                self.blocksizes.append(len(data))
+        return size
+
+    def remove(self,path):
+        os.remove(os.path.join(self.serverdir,path))
+
+    def close(self):
+        pass
+
+
+class TestSftpSessions(TestSessions):
+    ''' communication.sftp.retrieve: file is written while received (getfo), with one or more sessions.'''
+    def setUp(self):
+        self.serverdir = tempfile.mkdtemp()
+        self.channeldict = {'idchannel':'unitftpsessions_in','type':'sftp','inorout':'in','host':'127.0.0.1','port':22,
+                            'username':'bots','secret':'botsbots','path':'','filename':'*.edi','remove':True,
+                            'rsrv1':None,'rsrv2':None,'archivepath':'','keyfile':''}
+        serverdir = self.serverdir
+        class sftpstandin(communication.sftp):
+            clients = []
+            def connect(self):
+                self.transport = SFTPClientStandin(serverdir)    #only close() is used
+                self.session = SFTPClientStandin(serverdir)
+                sftpstandin.clients.append(self.session)
+                self.set_cwd()
+        self.sessionclass = sftpstandin
+
+    def tearDown(self):
+        shutil.rmtree(self.serverdir,ignore_errors=True)
+
+    def testonesession(self):
+        contents = dict(('one%s.edi'%i,os.urandom(40000 * i + 1)) for i in range(5))
+        self.assertEqual(self.fetch(1,contents),contents)
+        self.assertEqual(os.listdir(self.serverdir),[],'files are removed from server')
+        self.assertEqual(max(max(client.blocksizes) for client in self.sessionclass.clients),32768,'file is written in blocks')
+
+    def testsessions(self):
+        contents = dict(('more%s.edi'%i,os.urandom(1000 * i + 1)) for i in range(25))
+        self.assertEqual(self.fetch(4,contents),contents)
+        self.assertEqual(os.listdir(self.serverdir),[],'files are removed from server')
+        self.assertTrue(len(self.sessionclass.clients) > 1,'more sessions are used')
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()
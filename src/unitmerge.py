@@ -0,0 +1,68 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import bots.botsglobal as botsglobal
+import bots.botsinit as botsinit
+import bots.botslib as botslib
+import bots.botssqlite as botssqlite
+import bots.envelope as envelope
+from bots.botsconfig import *
+
+''' merging of messages (envelope.mergemessages): which messages are merged together.
+    no plugin needed; uses a temporary SQLite database and data directory.
+'''
+
+class TestMergeMessages(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.olddb,self.olddatadir = getattr(botsglobal,'db',None),botsglobal.ini.get('directories','data')
+        botsglobal.ini.set('directories','data',self.tmpdir)
+        botsglobal.db = botssqlite.connect(os.path.join(self.tmpdir,'botsdb'))
+        with open(os.path.join(os.path.dirname(botslib.__file__),'sql','ta.sqlite3.sql')) as sqlfile:
+            botsglobal.db.executescript(sqlfile.read().split(';',1)[1])    #skip DROP TABLE
+
+    def tearDown(self):
+        botsglobal.db.close()
+        botsglobal.db = self.olddb
+        botsglobal.ini.set('directories','data',self.olddatadir)
+        shutil.rmtree(self.tmpdir)
+
+    def merge(self,messages):
+        ''' messages: list of (frompartner,topartner,content); returns sorted list of contents of merged files.'''
+        for frompartner,topartner,content in messages:
+            ta_message = botslib.NewTransaction(status=TRANSLATED,statust=OK,idroute='unitmerge',editype='fixed',messagetype='unitmerge',
+                                                frompartner=frompartner,topartner=topartner,testindicator='0',charset='utf-8',
+                                                merge=True,nrmessages=1,rsrv5='{"envelope_content":[{}],"syntax":{}}')
+            with botslib.opendata(str(ta_message.idta),'wb','utf-8') as outfile:
+                outfile.write(content)
+            ta_message.update(filename=str(ta_message.idta))
+        envelope.mergemessages(startstatus=TRANSLATED,endstatus=MERGED,idroute='unitmerge',rootidta=0)
+        merged = []
+        for row in botslib.query('''SELECT filename,nrmessages FROM ta WHERE status=%(status)s AND statust=%(statust)s''',{'status':MERGED,'statust':OK}):
+            merged.append((botslib.readdata(row['filename'],'utf-8'),row['nrmessages']))
+        return sorted(merged)
+
+    def testmergekey(self):
+        ''' messages are merged only with messages with exactly the same partners; merged in order of idta.'''
+        self.assertEqual(self.merge([('P1','T','a'),('P2','T','b'),('P1','T','c'),('p1','T','d'),('P1 ','T','e'),('P2','T','f')]),
+                         [('ac',2),('bf',2),('d',1),('e',1)])
+
+    def testnullpartner(self):
+        ''' messages without partner (NULL) are merged with messages of a partner: the first group (in sort order) they match.'''
+        self.assertEqual(self.merge([(None,'T','a'),('P1','T','b'),(None,'T','c'),('P1',None,'d'),('P2','U','e'),(None,None,'f'),(None,'V','g')]),
+                         [('abcdf',5),('e',1),('g',1)])
+
+    def testemptypartner(self):
+        ''' empty string is a partner: messages without partner are merged with it; other messages without partner form their own group.'''
+        self.assertEqual(self.merge([(None,None,'a'),(None,'T','b'),(None,None,'c'),('','U','d')]),
+                         [('acd',3),('b',1)])
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()
@@ -159,6 +159,44 @@ class Testnode(unittest.TestCase):
         self.assertEqual(comparequeries,collectqueries)
         #~ inn.root.displayqueries()
 
+    def testchildindex(self):
+        ''' index of children by BOTSID (for nodes with many children) follows changes of children.'''
+        def botsids(root):
+            return [childnode.record['nr'] for childnode in root.getloop({'BOTSID':'UNH'},{'BOTSID':'LIN'})]
+        root = node.Node({'BOTSID':'UNH'})
+        for i in range(40):
+            root.append(node.Node({'BOTSID':'LIN' if i % 3 else 'QTY','nr':unicode(i)}))
+        expect = [unicode(i) for i in range(40) if i % 3]
+        self.assertEqual(botsids(root),expect)
+        root.append(node.Node({'BOTSID':'LIN','nr':'40'}))      #append
+        expect.append('40')
+        self.assertEqual(botsids(root),expect)
+        del root.children[1]                                      #delete
+        expect.remove('1')
+        self.assertEqual(botsids(root),expect)
+        root.children.append(root.children.pop(1))                #move to end: same number of children
+        expect.append(expect.pop(0))
+        self.assertEqual(botsids(root),expect)
+        root.children = list(reversed(root.children))             #replace list
+        expect.reverse()
+        self.assertEqual(botsids(root),expect)
+        root.sort(sortfrom=({'BOTSID':'UNH'},),compare=({'BOTSID':'LIN','nr':None},))   #sort in place
+        self.assertEqual(botsids(root),sorted(expect))
+
+    def testunhashablempath(self):
+        ''' with checklevel 0 values in mpath that are not hashable are compared (not cached).'''
+        remember_checklevel = node.Node.checklevel
+        node.Node.checklevel = 0
+        try:
+            root = node.Node({'BOTSID':'UNH','field':['a']})
+            self.assertEqual(root.get({'BOTSID':'UNH','field':['a']}),1)
+            self.assertEqual(root.get({'BOTSID':'UNH','field':['b']}),None)
+            self.assertEqual(len(list(root.getloop({'BOTSID':'UNH','field':['a']}))),1)
+            node.Node.checklevel = 1
+            self.assertRaises(botslib.MappingFormatError,root.get,{'BOTSID':'UNH','field':['a']})
+        finally:
+            node.Node.checklevel = remember_checklevel
+
 
 if __name__ == '__main__':
     import datetime
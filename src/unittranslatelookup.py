@@ -0,0 +1,72 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import random
+import unittest
+import bots.botslib as botslib
+import bots.botsglobal as botsglobal
+import bots.botssqlite as botssqlite
+if sys.version_info[0] > 2:
+    basestring = unicode = str
+
+''' lookup of translations in memory (botslib.lookup_translation) should give same results as the query (botslib.lookup_translation_sql).
+    uses randomised translate tables in a SQLite in-memory database.
+    not an acceptance-test; no plugin needed.
+'''
+
+PARTNERS = ['P1','P2','P3','P4']
+GROUPS = ['G1','G2','G3']
+EDITYPES = ['edifact','x12']
+MESSAGETYPES = ['ORDERSD96AUNEAN008','850']
+ALTS = ['','alt1','alt2']
+
+def create_database():
+    botsglobal.db = botssqlite.connect(database=':memory:')
+    botsglobal.db.execute('''CREATE TABLE translate (id INTEGER PRIMARY KEY, active BOOLEAN, fromeditype TEXT, frommessagetype TEXT, alt TEXT,
+                                                     frompartner_id TEXT, topartner_id TEXT, tscript TEXT, toeditype TEXT, tomessagetype TEXT)''')
+    botsglobal.db.execute('''CREATE TABLE partnergroup (id INTEGER PRIMARY KEY, from_partner_id TEXT, to_partner_id TEXT)''')
+
+def fill_random_tables(rnd):
+    botsglobal.db.execute('''DELETE FROM translate''')
+    botsglobal.db.execute('''DELETE FROM partnergroup''')
+    for partner in PARTNERS:
+        for group in GROUPS:
+            if rnd.random() < 0.3:
+                botsglobal.db.execute('''INSERT INTO partnergroup (from_partner_id,to_partner_id) VALUES (?,?)''',(partner,group))
+    used = set()    #no 2 translations with same key: order for these is not defined in SQL
+    for counter in range(rnd.randint(0,40)):
+        key = (rnd.choice(EDITYPES),rnd.choice(MESSAGETYPES),rnd.choice(ALTS),
+               rnd.choice([None,None] + PARTNERS + GROUPS),rnd.choice([None,None] + PARTNERS + GROUPS))
+        if key in used:
+            continue
+        used.add(key)
+        botsglobal.db.execute('''INSERT INTO translate (active,fromeditype,frommessagetype,alt,frompartner_id,topartner_id,tscript,toeditype,tomessagetype)
+                                 VALUES (?,?,?,?,?,?,?,?,?)''',
+                                 (rnd.random() < 0.9,) + key + ('mapping%s'%counter,'xml','xmlmessage'))
+    botsglobal.db.commit()
+    botsglobal.translations = None    #read again into memory
+
+
+class TestLookupTranslation(unittest.TestCase):
+    def setUp(self):
+        create_database()
+
+    def test_same_as_sql(self):
+        rnd = random.Random(1234)
+        for table in range(300):
+            fill_random_tables(rnd)
+            for lookup in range(30):
+                kwargs = {'fromeditype':rnd.choice(EDITYPES),
+                          'frommessagetype':rnd.choice(MESSAGETYPES),
+                          'alt':rnd.choice(ALTS + [None]),
+                          'frompartner':rnd.choice([None,''] + PARTNERS),
+                          'topartner':rnd.choice([None,''] + PARTNERS)}
+                self.assertEqual(botslib.lookup_translation(**kwargs),botslib.lookup_translation_sql(**kwargs),kwargs)
+
+    def test_not_found(self):
+        fill_random_tables(random.Random(1))
+        self.assertEqual(botslib.lookup_translation(fromeditype='csv',frommessagetype='unknown',alt='',frompartner=None,topartner=None),(None,None,None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import bots.botsglobal as botsglobal
+import bots.botsinit as botsinit
+import bots.botslib as botslib
+import bots.botssqlite as botssqlite
+from bots.botsconfig import *
+
+''' changes of db-ta in worker processes (journal, botslib.replay_tajournal).
+    no plugin needed; uses a temporary SQLite database and data directory.
+'''
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.olddb,self.olddatadir = getattr(botsglobal,'db',None),botsglobal.ini.get('directories','data')
+        botsglobal.ini.set('directories','data',self.tmpdir)
+        botsglobal.db = botssqlite.connect(os.path.join(self.tmpdir,'botsdb'))
+        with open(os.path.join(os.path.dirname(botslib.__file__),'sql','ta.sqlite3.sql')) as sqlfile:
+            botsglobal.db.executescript(sqlfile.read().split(';',1)[1])    #skip DROP TABLE
+
+    def tearDown(self):
+        botsglobal.tajournal = None
+        botsglobal.db.close()
+        botsglobal.db = self.olddb
+        botsglobal.ini.set('directories','data',self.olddatadir)
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def writedata(ta,content):
+        with botslib.opendata(str(ta.idta),'wb','utf-8') as outfile:
+            outfile.write(content)
+
+    @staticmethod
+    def tarows():
+        return dict((row['idta'],dict(row)) for row in botslib.query('''SELECT idta,status,statust,parent,child,filename FROM ta''',{}))
+
+
+class TestTaJournal(TestDatabase):
+    def testreplay(self):
+        ta_fromfile = botslib.NewTransaction(status=FILEIN,statust=OK,filename='infile')
+        #as in worker process: changes are recorded in journal
+        botsglobal.tajournal = []
+        ta_parsed = botslib.OldTransaction(ta_fromfile.idta).copyta(status=PARSED)
+        ta_splitup = ta_parsed.copyta(status=SPLITUP)
+        ta_translated = ta_splitup.copyta(status=TRANSLATED)
+        self.writedata(ta_translated,'translated')
+        ta_translated.update(filename=str(ta_translated.idta),statust=OK)
+        ta_confirm = botslib.NewTransaction(status=TRANSLATED,statust=OK,parent=ta_splitup.idta)
+        self.writedata(ta_confirm,'confirm')
+        ta_confirm.update(filename=str(ta_confirm.idta))
+        ta_discarded = ta_splitup.copyta(status=TRANSLATED)
+        ta_discarded.delete()
+        ta_splitup.update(statust=DONE,child=ta_translated.idta)
+        ta_parsed.update(statust=DONE)
+        tajournal = botsglobal.tajournal
+        botsglobal.tajournal = None
+        self.assertTrue(all(idta < 0 for idta in (ta_parsed.idta,ta_splitup.idta,ta_translated.idta,ta_confirm.idta)),'provisional idta')
+        self.assertEqual([entry[0] for entry in tajournal],['copyta','copyta','copyta','update','new','update','copyta','delete','update','update'])
+
+        botslib.replay_tajournal(tajournal)
+        rows = self.tarows()
+        self.assertTrue(all(idta > 0 and (row['parent'] or 0) >= 0 and (row['child'] or 0) >= 0 for idta,row in rows.items()),'no provisional idta in db-ta')
+        self.assertEqual(len(rows),5,'discarded db-ta is deleted')
+        parsed = [row for row in rows.values() if row['status'] == PARSED][0]
+        splitup = [row for row in rows.values() if row['status'] == SPLITUP][0]
+        translated = [row for row in rows.values() if row['status'] == TRANSLATED and row['parent'] == splitup['idta']]
+        self.assertEqual(parsed['parent'],ta_fromfile.idta)
+        self.assertEqual(parsed['statust'],DONE)
+        self.assertEqual(splitup['parent'],parsed['idta'])
+        self.assertEqual(len(translated),2)
+        ta_translated_row = [row for row in translated if row['idta'] == splitup['child']][0]
+        ta_confirm_row = [row for row in translated if row['idta'] != splitup['child']][0]
+        #files written with provisional idta are renamed; filename in db-ta is the real one
+        self.assertEqual(ta_translated_row['filename'],str(ta_translated_row['idta']))
+        self.assertEqual(botslib.readdata(ta_translated_row['filename'],'utf-8'),'translated')
+        self.assertEqual(ta_confirm_row['filename'],str(ta_confirm_row['idta']))
+        self.assertEqual(botslib.readdata(ta_confirm_row['filename'],'utf-8'),'confirm')
+        self.assertFalse(os.path.exists(botslib.abspathdata(str(ta_translated.idta))))
+        self.assertFalse(os.path.exists(botslib.abspathdata(str(ta_confirm.idta))))
+
+
+class TestRollback(TestDatabase):
+    ''' error in translation of a file: results of that file are discarded, next file is translated (as in transform._translate_one_file).'''
+    def translate(self,ta_fromfile,fail):
+        ta_parsed = botslib.OldTransaction(ta_fromfile.idta).copyta(status=PARSED)
+        botslib.begin_unitofwork()
+        try:
+            ta_splitup = ta_parsed.copyta(status=SPLITUP)
+            ta_translated = ta_splitup.copyta(status=TRANSLATED)
+            self.writedata(ta_translated,'translated')
+            ta_translated.update(filename=str(ta_translated.idta),statust=OK)
+            ta_splitup.update(statust=DONE)
+            if fail:
+                raise botslib.InMessageError('error in next message')
+        except botslib.InMessageError:
+            botslib.rollback_unitofwork()
+            ta_parsed.update(statust=ERROR)
+        else:
+            ta_parsed.update(statust=DONE)
+        finally:
+            ta_fromfile.update(statust=DONE)
+            botslib.end_unitofwork()
+        return ta_translated
+
+    def checkroute(self,tajournal=None):
+        ta_fromfiles = [botslib.NewTransaction(status=FILEIN,statust=OK,filename='infile%s'%i) for i in range(2)]
+        botsglobal.tajournal = tajournal
+        ta_failed = self.translate(ta_fromfiles[0],fail=True)
+        ta_ok = self.translate(ta_fromfiles[1],fail=False)
+        botsglobal.tajournal = None
+        if tajournal is not None:
+            self.assertEqual([entry[0] for entry in tajournal].count('copyta'),4,'journal of failed file is discarded, except PARSED')
+            botslib.replay_tajournal(tajournal)
+        self.assertFalse(os.path.exists(botslib.abspathdata(str(ta_failed.idta))),'output file of failed file is removed')
+        rows = self.tarows()
+        self.assertEqual(sorted(row['status'] for row in rows.values()),[FILEIN,FILEIN,PARSED,PARSED,SPLITUP,TRANSLATED])
+        self.assertTrue(all(row['statust'] == DONE for row in rows.values() if row['status'] == FILEIN))
+        parsed = sorted((row for row in rows.values() if row['status'] == PARSED),key=lambda row:row['parent'])
+        self.assertEqual([row['statust'] for row in parsed],[ERROR,DONE])
+        translated = [row for row in rows.values() if row['status'] == TRANSLATED][0]
+        self.assertEqual(translated['statust'],OK)
+        self.assertEqual(botslib.readdata(translated['filename'],'utf-8'),'translated')
+        if tajournal is None:
+            self.assertEqual(translated['idta'],ta_ok.idta)
+
+    def testrollback(self):
+        self.checkroute()
+
+    def testrollbackjournal(self):
+        ''' in worker process: changes are in journal.'''
+        self.checkroute(tajournal=[])
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()
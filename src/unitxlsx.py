@@ -0,0 +1,122 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import bots.botsglobal as botsglobal
+import bots.botsinit as botsinit
+import bots.inmessage as inmessage
+
+''' reading of xlsx files (inmessage.XlsxReader), with xlsx files made in this test.
+    no plugin needed.
+'''
+
+NAMESPACE = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+NAMESPACE_R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+SHAREDSTRINGS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst %s count="3" uniqueCount="3">
+<si><t>shared</t></si>
+<si><r><rPr><b/></rPr><t>rich </t></r><r><t xml:space="preserve">text</t></r><rPh><t>phonetic</t></rPh></si>
+<si><t/></si>
+</sst>'''%NAMESPACE
+
+#style 0: General; style 1: built-in date format 14; style 2: custom date format; style 3: custom number format (not a date)
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet %s>
+<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy\\ hh:mm"/><numFmt numFmtId="165" formatCode="&quot;days&quot;\\ 0.00"/></numFmts>
+<cellXfs count="4"><xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="164"/><xf numFmtId="165"/></cellXfs>
+</styleSheet>'''%NAMESPACE
+
+SHEET = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet %s><sheetData>
+<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="inlineStr"><is><t>inline</t></is></c><c r="D1" t="inlineStr"><is><r><t>in</t></r><r><t>line rich</t></r></is></c></row>
+<row r="2"><c r="A2"><v>12</v></c><c r="B2"><v>1.5</v></c><c r="C2" s="1"><v>%s</v></c><c r="D2" s="2"><v>%s.75</v></c><c r="E2" s="3"><v>2.25</v></c></row>
+<row r="3"><c r="A3" t="b"><v>1</v></c><c r="B3" t="b"><v>0</v></c><c r="C3" t="e"><v>#DIV/0!</v></c><c r="D3" t="str"><v>formula</v></c></row>
+<row r="4"><c r="A4" s="1"/></row>
+<row r="6"><c r="C6" t="s"><v>0</v></c><c r="AB6"><v>7</v></c><c r="AC6" t="s"><v>2</v></c></row>
+<row><c t="s"><v>0</v></c><c><v>8</v></c></row>
+</sheetData></worksheet>'''
+
+def makexlsx(filename,date1904=False,sheetfilename='worksheets/sheet1.xml',sheet=None):
+    ''' write minimal xlsx file: workbook with one sheet, shared strings and styles.
+        date 2015-03-02 is 42065 (days since 1899-12-30) or 40603 (days since 1904-01-01).
+    '''
+    workbook = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook %s %s><workbookPr%s/><sheets><sheet name="first" sheetId="1" r:id="rId1"/><sheet name="second" sheetId="2" r:id="rId2"/></sheets></workbook>'''%(
+                NAMESPACE,NAMESPACE_R,' date1904="1"' if date1904 else '')
+    relationships = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/other.xml"/>
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="%s"/>
+</Relationships>'''%sheetfilename
+    date = '40603' if date1904 else '42065'
+    with zipfile.ZipFile(filename,'w',zipfile.ZIP_DEFLATED) as xlsx:
+        xlsx.writestr('xl/workbook.xml',workbook)
+        xlsx.writestr('xl/_rels/workbook.xml.rels',relationships)
+        xlsx.writestr('xl/sharedStrings.xml',SHAREDSTRINGS)
+        xlsx.writestr('xl/styles.xml',STYLES)
+        xlsx.writestr('xl/' + sheetfilename,SHEET%(NAMESPACE,date,date) if sheet is None else sheet)
+        xlsx.writestr('xl/worksheets/other.xml','<worksheet %s><sheetData><row r="1"><c><v>99</v></c></row></sheetData></worksheet>'%NAMESPACE)
+
+
+class TestXlsxReader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory,'test.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+    def readrows(self):
+        xlsx = inmessage.XlsxReader(self.filename)
+        return xlsx.datemode,list(xlsx.rows())
+
+    def testrows(self):
+        makexlsx(self.filename)
+        datemode,rows = self.readrows()
+        self.assertEqual(datemode,0)
+        self.assertEqual(rows,[(1,[(1,'shared'),(1,'rich text'),(1,'inline'),(1,'inline rich')]),
+                               (2,[(2,12.0),(2,1.5),(3,42065.0),(3,42065.75),(2,2.25)]),
+                               (3,[(4,1),(4,0),(5,'#DIV/0!'),(1,'formula')]),
+                               #row 4 has no values: skipped. Row 6: sparse columns; empty shared string is a text cell (as in xlrd).
+                               (6,[(0,''),(0,''),(1,'shared')] + [(0,'')] * 24 + [(2,7.0),(1,'')]),
+                               (7,[(1,'shared'),(2,8.0)]),      #row and cells without reference
+                               ])
+
+    def testdatemode1904(self):
+        makexlsx(self.filename,date1904=True)
+        datemode,rows = self.readrows()
+        self.assertEqual(datemode,1)
+        self.assertEqual(rows[1][1][2:4],[(3,40603.0),(3,40603.75)])
+        excel = inmessage.excel
+        self.assertEqual(excel.xldate_as_tuple(40603.75,1),(2015,3,2,18,0,0))
+        self.assertEqual(excel.xldate_as_tuple(42065.75,0),(2015,3,2,18,0,0))
+
+    def testfirstsheet(self):
+        ''' first sheet is found via relationship of workbook, not via name of sheet file.'''
+        makexlsx(self.filename,sheetfilename='worksheets/sheetA.xml')
+        datemode,rows = self.readrows()
+        self.assertEqual(rows[0][1][0],(1,'shared'))
+
+    def testclosed(self):
+        ''' zip file is closed after reading, also if rows are not all read or reading fails.'''
+        makexlsx(self.filename)
+        xlsx = inmessage.XlsxReader(self.filename)
+        rows = xlsx.rows()
+        next(rows)
+        rows.close()
+        self.assertIsNone(xlsx.zipfile.fp)
+        makexlsx(self.filename,sheet='<worksheet %s><sheetData><row r="1"><c><v>1</v></c></row><row>'%NAMESPACE)
+        xlsx = inmessage.XlsxReader(self.filename)
+        self.assertRaises(Exception,list,xlsx.rows())
+        self.assertIsNone(xlsx.zipfile.fp)
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()
@@ -0,0 +1,115 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import bots.botsglobal as botsglobal
+import bots.botslib as botslib
+import bots.botsinit as botsinit
+import bots.communication as communication
+from bots.botsconfig import *
+
+''' setting zerocopy: botslib.linkfile and incoming file channel.
+    no plugin needed; uses database and data directory of config.
+'''
+
+class TestZeroCopy(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.zerocopy = botsglobal.ini.get('settings','zerocopy','False')
+        botsglobal.ini.set('settings','zerocopy','True')
+
+    def tearDown(self):
+        botsglobal.ini.set('settings','zerocopy',self.zerocopy)
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+    def writefile(self,filename,content):
+        filename = os.path.join(self.directory,filename)
+        with open(filename,'wb') as fromfile:
+            fromfile.write(content)
+        return filename
+
+    def testlinkfile(self):
+        fromfilename = self.writefile('link.txt',b'content')
+        tofilename = os.path.join(self.directory,'linked.txt')
+        self.assertEqual(botslib.linkfile(fromfilename,tofilename),0,'hard link: nothing copied')
+        self.assertTrue(os.path.samefile(fromfilename,tofilename))
+
+    def testlinkfilecopy(self):
+        ''' hard link not possible (eg other filesystem): file is copied.'''
+        fromfilename = self.writefile('copy.txt',b'content')
+        tofilename = os.path.join(self.directory,'copied.txt')
+        def link(fromfilename,tofilename):
+            raise OSError('Invalid cross-device link')
+        oslink = os.link
+        os.link = link
+        try:
+            self.assertEqual(botslib.linkfile(fromfilename,tofilename),7)
+        finally:
+            os.link = oslink
+        self.assertFalse(os.path.samefile(fromfilename,tofilename))
+        with open(tofilename,'rb') as tofile:
+            self.assertEqual(tofile.read(),b'content')
+
+    def incommunicate(self,remove):
+        ''' receive files of self.directory via file channel; returns {filename: (data file name, content)}.'''
+        channeldict = {'idchannel':'unitzerocopy_in','type':'file','inorout':'in','path':self.directory,'filename':'*.edi',
+                       'remove':remove,'syslock':False,'lockname':'','archivepath':'','rsrv1':None,'rsrv2':None}
+        session = communication.file(channeldict,'unitzerocopy',None,None,'new',0)
+        session.maxsecondsperchannel = 3600
+        for row in botslib.query('''SELECT MAX(idta) as max_idta FROM ta'''):
+            idta_before = row['max_idta'] or 0
+        session.incommunicate()
+        received = {}
+        for row in botslib.query('''SELECT ta.filename as filename,ta_from.filename as fromfilename
+                                    FROM ta,ta ta_from
+                                    WHERE ta.idta>%(idta)s
+                                    AND ta.status=%(status)s
+                                    AND ta.statust=%(statust)s
+                                    AND ta_from.idta=ta.parent ''',
+                                    {'idta':idta_before,'status':FILEIN,'statust':OK}):
+            received[os.path.basename(row['fromfilename'])] = (botslib.abspathdata(row['filename']),botslib.readdata_bin(row['filename']))
+        return received
+
+    def testremove(self):
+        ''' channel removes files: hard linked in data directory, file is removed.'''
+        fromfilename = self.writefile('remove.edi',b'UNB+UNOA:1')
+        inode = os.stat(fromfilename).st_ino
+        received = self.incommunicate(True)
+        self.assertEqual(list(received),['remove.edi'])
+        datafilename,content = received['remove.edi']
+        self.assertEqual(content,b'UNB+UNOA:1')
+        self.assertEqual(os.stat(datafilename).st_ino,inode,'hard link')
+        self.assertFalse(os.path.exists(fromfilename))
+
+    def testnoremove(self):
+        ''' channel does not remove files: file is copied (data file is not changed if file is changed).'''
+        fromfilename = self.writefile('noremove.edi',b'UNB+UNOA:2')
+        received = self.incommunicate(False)
+        datafilename,content = received['noremove.edi']
+        self.assertEqual(content,b'UNB+UNOA:2')
+        self.assertFalse(os.path.samefile(datafilename,fromfilename))
+        self.assertTrue(os.path.exists(fromfilename))
+
+    def testremoveaftercommit(self):
+        ''' file is removed only after its ta is committed: if that fails, file is still there.'''
+        fromfilename = self.writefile('notcommitted.edi',b'UNB+UNOA:3')
+        update = botslib._Transaction.update
+        def failingupdate(ta,**ta_info):
+            if ta_info.get('statust') == OK:
+                raise botslib.BotsError('Database error.')
+            return update(ta,**ta_info)
+        botslib._Transaction.update = failingupdate
+        try:
+            self.assertEqual(self.incommunicate(True),{})
+        finally:
+            botslib._Transaction.update = update
+        self.assertTrue(os.path.exists(fromfilename))
+
+
+if __name__ == '__main__':
+    botsinit.generalinit('config')
+    botsglobal.logger = botsinit.initenginelogging('engine')
+    botsinit.connect()
+    unittest.main()
+    botsglobal.db.close()